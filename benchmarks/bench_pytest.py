@@ -0,0 +1,32 @@
+"""
+pytest-benchmark entry point for the same cases as `run.py`:
+
+    LLM_BATCH_BENCH_SCALE=100k pytest benchmarks/bench_pytest.py --benchmark-autosave
+    pytest benchmarks/bench_pytest.py --benchmark-compare
+
+pytest-benchmark measures time only; use `run.py` for peak RSS.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cases  # noqa: E402
+from run import SCALES  # noqa: E402
+
+SCALE = SCALES[os.environ.get("LLM_BATCH_BENCH_SCALE", "1k").lower()]
+
+
+@pytest.mark.parametrize("name", list(cases.CASES))
+def test_benchmark(benchmark, tmp_path, name):
+    """Benchmark one pipeline case."""
+    cases.quiet()
+    setup, unit = cases.CASES[name]
+    fn = setup(SCALE, tmp_path)
+    items = benchmark.pedantic(fn, rounds=1, iterations=1)
+    benchmark.extra_info.update(items=items, unit=unit)
@@ -0,0 +1,250 @@
+import json
+import math
+import os
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import fitz
+import jinja2
+
+from llm_batch import CONFIG, console
+from llm_batch import batch_anthropic, batch_openai
+from llm_batch.cli import extract_combinations, make, pdf2text
+from llm_batch.mock_server import MockConfig, MockProviderServer
+from llm_batch.index import OffsetIndex, build_index
+from llm_batch.store import open_store
+from llm_batch import serialization
+
+# Each case takes the number of items and a scratch directory, does its (untimed) setup and returns the timed
+# callable. The callable returns the number of items it processed so the runner can report throughput.
+Case = Callable[[int, Path], Callable[[], int]]
+
+TEMPLATE = (
+    Path(__file__).parents[1] / "examples" / "example1" / "prompt-template.json"
+).read_text()
+
+# directory-based `make` and PDF extraction are capped so the 1M scale does not need a million files
+MAX_FILES = 100_000
+PAGES_PER_ITEM = 100
+PAGES_PER_PDF = 20
+# random lookups per index_lookup run
+LOOKUPS = 10_000
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------------------------------------------------
+def grid(n: int) -> Dict[str, list]:
+    """A three-parameter grid with (at least) n combinations."""
+    side = math.ceil(n ** (1 / 3))
+    return {
+        "Description": [f"persona {i}" for i in range(side)],
+        "Temp": [round(i / side, 3) for i in range(side)],
+        "Seed": list(range(side)),
+    }
+
+
+def request_line(idx: int) -> Dict:
+    return {
+        "custom_id": f"id_{idx}",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": "gpt-4o",
+            "max_tokens": 50,
+            "messages": [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": f"What is your favorite book? ({idx})"},
+            ],
+        },
+    }
+
+
+def write_requests(path: Path, n: int) -> Path:
+    with open(path, "w") as f:
+        for idx in range(n):
+            f.write(json.dumps(request_line(idx)) + "\n")
+    return path
+
+
+def use_mock_server(tmp: Path) -> MockProviderServer:
+    server = MockProviderServer(config=MockConfig(result_size=100, seed=0)).start()
+    CONFIG["providers"] = {
+        "openai": {"base_url": f"{server.url}/v1"},
+        "anthropic": {"base_url": server.url},
+    }
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+    return server
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------------------------------------------------------
+def extract_combinations_case(n: int, tmp: Path) -> Callable[[], int]:
+    data = grid(n)
+    return lambda: len(extract_combinations(data))
+
+
+def render_parse_case(n: int, tmp: Path) -> Callable[[], int]:
+    t = jinja2.Environment(undefined=jinja2.StrictUndefined).from_string(TEMPLATE)
+    combinations = extract_combinations(grid(n))[:n]
+
+    def run() -> int:
+        for combination in combinations:
+            serialization.loads_lenient(t.render(**combination))
+        return len(combinations)
+
+    return run
+
+
+def make_files_case(n: int, tmp: Path) -> Callable[[], int]:
+    n = min(n, MAX_FILES)
+    in_dir = tmp / "requests"
+    in_dir.mkdir()
+    for idx in range(n):
+        (in_dir / f"{idx}.json").write_text(
+            json.dumps({"request": request_line(idx)["body"]})
+        )
+
+    def run() -> int:
+        make(in_dir=in_dir, out=tmp / "out", batch_name="bench")
+        return n
+
+    return run
+
+
+def make_store_case(n: int, tmp: Path) -> Callable[[], int]:
+    store = tmp / "records.jsonl"
+    with open_store(tmp, store) as output:
+        for idx in range(n):
+            output.write(
+                {
+                    "id": f"{idx:07d}",
+                    "template_params": {},
+                    "request": request_line(idx)["body"],
+                }
+            )
+
+    def run() -> int:
+        make(in_dir=store, out=tmp / "out", batch_name="bench")
+        return n
+
+    return run
+
+
+def anthropic_build_case(n: int, tmp: Path) -> Callable[[], int]:
+    lines = [request_line(idx) for idx in range(n)]
+    return lambda: len(batch_anthropic.build_requests(lines))
+
+
+def openai_fetch_case(n: int, tmp: Path) -> Callable[[], int]:
+    server = use_mock_server(tmp)
+    batch_file = write_requests(tmp / "bench-requests.jsonl", n)
+    batch_openai.send(batch_file=batch_file)
+    batch_id = next(iter(server.batches))
+
+    def run() -> int:
+        batch_openai.fetch(batch_id=batch_id, out=tmp / "out", batch_name="bench")
+        return n
+
+    return run
+
+
+def anthropic_fetch_case(n: int, tmp: Path) -> Callable[[], int]:
+    server = use_mock_server(tmp)
+    batch_file = write_requests(tmp / "bench-requests.jsonl", n)
+    batch_anthropic.send(batch_file=batch_file)
+    batch_id = next(iter(server.batches))
+
+    def run() -> int:
+        batch_anthropic.fetch(batch_id=batch_id, out=tmp / "out", batch_name="bench")
+        return n
+
+    return run
+
+
+def pdf2text_case(n: int, tmp: Path) -> Callable[[], int]:
+    pages = min(max(n // PAGES_PER_ITEM, PAGES_PER_PDF), MAX_FILES)
+    in_dir = tmp / "pdfs"
+    in_dir.mkdir()
+    for pdf_idx in range(math.ceil(pages / PAGES_PER_PDF)):
+        doc = fitz.open()
+        for page_idx in range(PAGES_PER_PDF):
+            page = doc.new_page()
+            page.insert_text(
+                (72, 72), f"Document {pdf_idx} page {page_idx}\n" + "lorem ipsum " * 40
+            )
+        doc.save(in_dir / f"{pdf_idx}.pdf")
+        doc.close()
+
+    def run() -> int:
+        pdf2text(in_dir=in_dir, out=tmp / "out")
+        return pages
+
+    return run
+
+
+def index_build_case(n: int, tmp: Path) -> Callable[[], int]:
+    batch_file = write_requests(tmp / "bench-requests.jsonl", n)
+
+    def run() -> int:
+        build_index(batch_file)
+        return n
+
+    return run
+
+
+def index_lookup_case(n: int, tmp: Path) -> Callable[[], int]:
+    batch_file = write_requests(tmp / "bench-requests.jsonl", n)
+    build_index(batch_file)
+    ids = [f"id_{(idx * 7919) % n}" for idx in range(min(n, LOOKUPS))]
+
+    def run() -> int:
+        with OffsetIndex(batch_file) as index:
+            for custom_id in ids:
+                index.get(custom_id)
+        return len(ids)
+
+    return run
+
+
+def serialize_case(backend: str) -> Case:
+    """Encode and decode batch request lines with one JSON backend."""
+
+    def setup(n: int, tmp: Path) -> Callable[[], int]:
+        serialization.use_backend(backend)  # type: ignore
+        lines = [request_line(idx) for idx in range(n)]
+
+        def run() -> int:
+            for line in lines:
+                serialization.loads(serialization.dumps(line))
+            return n
+
+        return run
+
+    return setup
+
+
+CASES: Dict[str, Tuple[Case, str]] = {
+    "extract_combinations": (extract_combinations_case, "combinations"),
+    "render_parse": (render_parse_case, "requests"),
+    "make_files": (make_files_case, "files"),
+    "make_store": (make_store_case, "records"),
+    "anthropic_build": (anthropic_build_case, "requests"),
+    "openai_fetch": (openai_fetch_case, "results"),
+    "anthropic_fetch": (anthropic_fetch_case, "results"),
+    "pdf2text": (pdf2text_case, "pages"),
+    "index_build": (index_build_case, "lines"),
+    "index_lookup": (index_lookup_case, "lookups"),
+    **{
+        f"serialize_{backend}": (serialize_case(backend), "requests")
+        for backend, available in serialization.BACKENDS.items()
+        if available()
+    },
+}
+
+
+def quiet() -> None:
+    """Silence per-item console output so it does not dominate the timings."""
+    console.quiet = True
@@ -0,0 +1,175 @@
+"""
+Standalone benchmark runner for the batch pipeline hot paths.
+
+    python benchmarks/run.py --scale 1k --save benchmarks/baseline-1k.json
+    python benchmarks/run.py --scale 1k --compare benchmarks/baseline-1k.json
+    python benchmarks/run.py --scale 100k --case make_store --case anthropic_build
+
+Every case runs in a fresh process so the reported peak RSS belongs to that case alone.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+from rich.console import Console
+from rich.table import Table
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(name: str, n: int, repeat: int, queue) -> None:
+    """Run one case in this (child) process and report the best timing."""
+    import cases
+
+    cases.quiet()
+    setup, unit = cases.CASES[name]
+    rss_before = peak_rss_mb()
+    best = None
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = setup(n, Path(tmp))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    queue.put(
+        {
+            "items": items,
+            "unit": unit,
+            "seconds": best,
+            "throughput": items / best if best else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+        }
+    )
+
+
+def run(names, n: int, repeat: int) -> Dict[str, Dict]:
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in names:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_case, args=(name, n, repeat, queue))
+        proc.start()
+        proc.join()
+        results[name] = queue.get() if proc.exitcode == 0 else {"error": proc.exitcode}
+    return results
+
+
+def report(
+    console: Console, results: Dict[str, Dict], baseline: Dict, threshold: float
+) -> bool:
+    """Print a results table, returning True if any case regressed beyond the threshold."""
+    table = Table(title="llm-batch benchmarks")
+    for column in [
+        "case",
+        "items",
+        "seconds",
+        "items/s",
+        "peak RSS (MB)",
+        "RSS growth (MB)",
+        "vs baseline",
+    ]:
+        table.add_column(column, justify="left" if column == "case" else "right")
+    regressed = False
+    for name, r in results.items():
+        if "error" in r:
+            table.add_row(
+                name, "-", "-", "-", "-", "-", f"[red]failed ({r['error']})[/red]"
+            )
+            regressed = True
+            continue
+        delta = ""
+        old = baseline.get(name, {}).get("throughput")
+        if old:
+            change = r["throughput"] / old - 1
+            color = (
+                "red"
+                if change < -threshold
+                else "green" if change > threshold else "white"
+            )
+            delta = f"[{color}]{change:+.1%}[/{color}]"
+            regressed |= change < -threshold
+        table.add_row(
+            name,
+            f"{r['items']:,} {r['unit']}",
+            f"{r['seconds']:.3f}",
+            f"{r['throughput']:,.0f}",
+            f"{r['peak_rss_mb']:,.1f}",
+            f"{r['rss_growth_mb']:,.1f}",
+            delta,
+        )
+    console.print(table)
+    return regressed
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+def main() -> int:
+    import cases
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scale", choices=SCALES, default="1k")
+    parser.add_argument(
+        "--case", action="append", choices=cases.CASES, help="Run only these cases"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Repeats per case; the best time is kept"
+    )
+    parser.add_argument(
+        "--save", type=Path, help="Write results to this baseline JSON file"
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="Compare against this baseline JSON file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Throughput drop that counts as a regression",
+    )
+    args = parser.parse_args()
+
+    results = run(args.case or list(cases.CASES), SCALES[args.scale], args.repeat)
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else {}
+    regressed = report(Console(), results, baseline, args.threshold)
+
+    if args.save:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "scale": args.scale,
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+    return 1 if args.compare and regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,12 @@
 import os
 import logging
-import logging.config
 import yaml
 from importlib import resources
 from dotenv import load_dotenv
 from rich.console import Console
 from cyclopts import App
 from llm_batch import data  # type: ignore
+from llm_batch.logs import ItemLog, setup_logging
 
 __author__ = """Kellogg Research Support"""
 __email__ = "rs@kellogg.northwestern.edu"
@@ -30,6 +30,8 @@ CONFIG = {}
 with resources.path(data, "config.yml") as path:
     CONFIG = yaml.load(open(path), Loader=yaml.FullLoader)
 
-# setup logging
-logging.config.dictConfig(CONFIG["logging"])
+# setup logging; the handlers run on background listener threads
+setup_logging(CONFIG)
 logger = logging.getLogger(__name__)
+# per-item messages of hot loops, sampled
+item_log = ItemLog(logger, config=CONFIG)
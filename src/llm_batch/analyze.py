@@ -0,0 +1,483 @@
+import glob
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import polars as pl
+from rich.console import Console
+from rich.table import Table
+
+from llm_batch.serialization import dumps
+from llm_batch.store import is_sqlite, read_records
+
+# usage and finish reason of an OpenAI-style chat completion (sync responses and OpenAI batch bodies)
+CHAT = pl.Struct(
+    {
+        "model": pl.Utf8,
+        "choices": pl.List(pl.Struct({"finish_reason": pl.Utf8})),
+        "usage": pl.Struct(
+            {
+                "prompt_tokens": pl.Int64,
+                "completion_tokens": pl.Int64,
+                "prompt_tokens_details": pl.Struct({"cached_tokens": pl.Int64}),
+            }
+        ),
+    }
+)
+# ... and of an Anthropic message
+MESSAGE = pl.Struct(
+    {
+        "model": pl.Utf8,
+        "stop_reason": pl.Utf8,
+        "usage": pl.Struct(
+            {
+                "input_tokens": pl.Int64,
+                "output_tokens": pl.Int64,
+                "cache_read_input_tokens": pl.Int64,
+            }
+        ),
+    }
+)
+ERROR = pl.Struct({"message": pl.Utf8})
+
+# columns of the normalized response rows; template parameters follow as `param_<name>`
+COLUMNS = [
+    "file",
+    "id",
+    "model",
+    "status",
+    "finish_reason",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "error",
+]
+TRUNCATED = ["length", "max_tokens"]
+PERCENTILES = (50, 95, 99)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Scanning response files
+# ---------------------------------------------------------------------------------------------------------------------
+def expand(patterns: Iterable[str]) -> List[Path]:
+    """Files and directory stores matching the paths or glob patterns (`**` included), in order."""
+    paths: List[Path] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for match in matches:
+            path = Path(match)
+            if not path.exists():
+                raise FileNotFoundError(f"No response files match {pattern}")
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def detect(record: Dict) -> str:
+    """
+    The kind of a response file from one of its records: `template` or `fanout` records, `openai` or
+    `anthropic` batch results, or telemetry `events`.
+    """
+    if "template_params" in record or "request" in record:
+        return "fanout" if "models" in record else "template"
+    if "custom_id" in record:
+        return "anthropic" if "result" in record else "openai"
+    if "source" in record and "latency" in record:
+        return "events"
+    raise ValueError(f"Unrecognized response record with keys {sorted(record)}")
+
+
+def schema_of(kind: str, sample: List[Dict]) -> Dict:
+    """Schema to read a file of `kind` with; only the fields the analyses use are parsed."""
+    if kind == "openai":
+        return {
+            "custom_id": pl.Utf8,
+            "response": pl.Struct(
+                {
+                    "status_code": pl.Int64,
+                    "body": pl.Struct({**CHAT.to_schema(), "error": ERROR}),
+                }
+            ),
+            "error": ERROR,
+        }
+    if kind == "anthropic":
+        return {
+            "custom_id": pl.Utf8,
+            "result": pl.Struct(
+                {
+                    "type": pl.Utf8,
+                    "message": MESSAGE,
+                    "error": pl.Struct({"error": ERROR}),
+                }
+            ),
+        }
+    if kind == "events":
+        return {
+            "id": pl.Utf8,
+            "source": pl.Utf8,
+            "status": pl.Utf8,
+            "model": pl.Utf8,
+            "latency": pl.Float64,
+            "ttft": pl.Float64,
+            "tokens_per_second": pl.Float64,
+        }
+    params = {k: pl.Utf8 for r in sample for k in r.get("template_params") or {}}
+    schema = {"id": pl.Utf8, "request": pl.Struct({"model": pl.Utf8})}
+    if params:
+        schema["template_params"] = pl.Struct(params)
+    if kind == "fanout":
+        models = list(dict.fromkeys(m for r in sample for m in r.get("models") or []))
+        schema["responses"] = pl.Struct({m: CHAT for m in models})
+        schema["errors"] = pl.Struct({m: pl.Utf8 for m in models})
+    else:
+        schema["response"] = CHAT
+        schema["error"] = pl.Utf8
+    return schema
+
+
+def scan_file(path: Path, schema: Dict) -> pl.LazyFrame:
+    """
+    Lazily read a response file. Plain and gzipped JSONL files are scanned by polars in parallel; directory,
+    SQLite and zstd stores are streamed through `read_records` and decoded by polars.
+    """
+    if path.is_file() and not is_sqlite(path) and not path.name.endswith(".zst"):
+        return pl.scan_ndjson(path, schema=schema)
+    lines = pl.Series("line", [dumps(r) for r in read_records(path)], pl.Utf8)
+    return (
+        pl.LazyFrame([lines])
+        .select(pl.col("line").str.json_decode(pl.Struct(schema)))
+        .unnest("line")
+    )
+
+
+def chat_columns(response: pl.Expr) -> List[pl.Expr]:
+    usage = response.struct.field("usage")
+    return [
+        response.struct.field("choices").list.first().struct.field("finish_reason"),
+        usage.struct.field("prompt_tokens"),
+        usage.struct.field("completion_tokens"),
+        usage.struct.field("prompt_tokens_details").struct.field("cached_tokens"),
+    ]
+
+
+def normalize(kind: str, lf: pl.LazyFrame, schema: Dict) -> List[pl.LazyFrame]:
+    """One row per response with the `COLUMNS` (and `param_*` columns of template records)."""
+    usage_names = [
+        "finish_reason",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached_tokens",
+    ]
+    if kind == "openai":
+        response = pl.col("response")
+        body = response.struct.field("body")
+        ok = response.struct.field("status_code") == 200
+        frame = lf.select(
+            pl.col("custom_id").alias("id"),
+            body.struct.field("model").alias("model"),
+            pl.when(ok).then(pl.lit("ok")).otherwise(pl.lit("error")).alias("status"),
+            *(e.alias(n) for e, n in zip(chat_columns(body), usage_names)),
+            pl.when(ok)
+            .then(None)
+            .otherwise(
+                pl.coalesce(
+                    pl.col("error").struct.field("message"),
+                    body.struct.field("error").struct.field("message"),
+                    pl.format("HTTP {}", response.struct.field("status_code")),
+                )
+            )
+            .alias("error"),
+        )
+        return [frame]
+    if kind == "anthropic":
+        result = pl.col("result")
+        message = result.struct.field("message")
+        usage = message.struct.field("usage")
+        ok = result.struct.field("type") == "succeeded"
+        frame = lf.select(
+            pl.col("custom_id").alias("id"),
+            message.struct.field("model").alias("model"),
+            pl.when(ok).then(pl.lit("ok")).otherwise(pl.lit("error")).alias("status"),
+            message.struct.field("stop_reason").alias("finish_reason"),
+            usage.struct.field("input_tokens").alias("prompt_tokens"),
+            usage.struct.field("output_tokens").alias("completion_tokens"),
+            usage.struct.field("cache_read_input_tokens").alias("cached_tokens"),
+            pl.when(ok)
+            .then(None)
+            .otherwise(
+                pl.coalesce(
+                    result.struct.field("error")
+                    .struct.field("error")
+                    .struct.field("message"),
+                    result.struct.field("type"),
+                )
+            )
+            .alias("error"),
+        )
+        return [frame]
+
+    params = [
+        pl.col("template_params").struct.field(k).alias(f"param_{k}")
+        for k in schema.get("template_params", pl.Struct({})).to_schema()
+    ]
+    if kind == "template":
+        response = pl.col("response")
+        responses = [
+            (response, pl.col("error"), pl.col("request").struct.field("model"))
+        ]
+    else:
+        responses = [
+            (
+                pl.col("responses").struct.field(m),
+                pl.col("errors").struct.field(m),
+                pl.lit(m),
+            )
+            for m in schema["responses"].to_schema()
+        ]
+    frames = []
+    for response, error, model in responses:
+        failed = error.is_not_null() | response.is_null()
+        frames.append(
+            lf.select(
+                pl.col("id"),
+                pl.coalesce(response.struct.field("model"), model).alias("model"),
+                pl.when(failed)
+                .then(pl.lit("error"))
+                .otherwise(pl.lit("ok"))
+                .alias("status"),
+                *(e.alias(n) for e, n in zip(chat_columns(response), usage_names)),
+                error.alias("error"),
+                *params,
+            )
+        )
+    return frames
+
+
+def scan(
+    patterns: Iterable[str], sample_records: int = 100
+) -> Dict[str, Optional[pl.LazyFrame]]:
+    """
+    Scan response files (template stores or directories, multi-model stores, OpenAI or Anthropic batch
+    results) into one lazy frame of normalized `responses`, and telemetry event files into `events`.
+    The kind and template parameters of each file are taken from its first `sample_records` records.
+    """
+    responses, events = [], []
+    for path in expand(patterns):
+        sample = list(islice(read_records(path), sample_records))
+        if not sample:
+            continue
+        kind = detect(sample[0])
+        schema = schema_of(kind, sample)
+        lf = scan_file(path, schema)
+        if kind == "events":
+            events.append(lf)
+            continue
+        for frame in normalize(kind, lf, schema):
+            frame = frame.with_columns(pl.lit(str(path)).alias("file"))
+            params = [c for c in frame.collect_schema() if c.startswith("param_")]
+            responses.append(frame.select(*COLUMNS, *params))
+    return {
+        "responses": (
+            pl.concat(responses, how="diagonal_relaxed") if responses else None
+        ),
+        "events": pl.concat(events, how="diagonal_relaxed") if events else None,
+    }
+
+
+def with_params(
+    responses: pl.LazyFrame, store: Path, requests: Optional[Path] = None
+) -> pl.LazyFrame:
+    """
+    Attach the template parameters (and requested model) of a template store to batch results, whose
+    custom IDs are `id_<combination ID>`. Anthropic results are keyed by position (`id-<n>`) instead; with
+    the submitted `requests` file their positions are first mapped to its custom IDs. Raises `ValueError`
+    when no result matches a record of the store.
+    """
+    if requests is not None:
+        submitted = (
+            scan_file(requests, {"custom_id": pl.Utf8})
+            .with_row_index("position")
+            .select(pl.format("id-{}", pl.col("position")).alias("id"), "custom_id")
+        )
+        responses = (
+            responses.join(submitted, on="id", how="left")
+            .with_columns(pl.coalesce("custom_id", "id").alias("id"))
+            .drop("custom_id")
+        )
+    sample = list(islice(read_records(store), 100))
+    schema = schema_of("template", sample)
+    schema.pop("response", None)
+    schema.pop("error", None)
+    params = scan_file(store, schema).select(
+        pl.format("id_{}", pl.col("id")).alias("id"),
+        pl.col("request").struct.field("model").alias("request_model"),
+        *(
+            pl.col("template_params").struct.field(k).alias(f"param_{k}")
+            for k in schema.get("template_params", pl.Struct({})).to_schema()
+        ),
+    )
+    matched = responses.select("id").join(params.select("id"), on="id", how="semi")
+    if matched.head(1).collect().is_empty():
+        hint = (
+            ""
+            if requests is not None
+            else "; Anthropic results are keyed by position, pass the submitted requests file"
+        )
+        raise ValueError(f"No batch result matches a record of {store}{hint}")
+    existing = [c for c in responses.collect_schema() if c.startswith("param_")]
+    return (
+        responses.drop(existing)
+        .join(params, on="id", how="left")
+        .with_columns(pl.coalesce("model", "request_model").alias("model"))
+        .drop("request_model")
+    )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Analyses
+# ---------------------------------------------------------------------------------------------------------------------
+def finish_reasons(responses: pl.LazyFrame) -> pl.LazyFrame:
+    """Finish (stop) reasons of successful responses by model, with their share of the model's responses."""
+    return (
+        responses.filter(pl.col("status") == "ok")
+        .group_by("model", "finish_reason")
+        .agg(pl.len().alias("responses"))
+        .with_columns(
+            (pl.col("responses") / pl.col("responses").sum().over("model")).alias(
+                "share"
+            )
+        )
+        .sort("model", "responses", descending=[False, True])
+    )
+
+
+def token_usage(responses: pl.LazyFrame) -> pl.LazyFrame:
+    """Prompt, completion and cached tokens by model: totals, means and the 95th percentile of completions."""
+    return (
+        responses.filter(pl.col("status") == "ok")
+        .group_by("model")
+        .agg(
+            pl.len().alias("responses"),
+            pl.col("prompt_tokens").sum(),
+            pl.col("completion_tokens").sum(),
+            pl.col("cached_tokens").sum(),
+            pl.col("prompt_tokens").mean().alias("prompt_mean"),
+            pl.col("completion_tokens").mean().alias("completion_mean"),
+            pl.col("completion_tokens")
+            .quantile(0.95, "nearest")
+            .alias("completion_p95"),
+        )
+        .sort("model")
+    )
+
+
+def error_rates(responses: pl.LazyFrame) -> pl.LazyFrame:
+    """Requests, errors and error rate by model, with the most frequent error message."""
+    return (
+        responses.group_by("model")
+        .agg(
+            pl.len().alias("requests"),
+            (pl.col("status") == "error").sum().alias("errors"),
+            pl.col("error").drop_nulls().mode().first().alias("top_error"),
+        )
+        .with_columns((pl.col("errors") / pl.col("requests")).alias("error_rate"))
+        .select("model", "requests", "errors", "error_rate", "top_error")
+        .sort("error_rate", "model", descending=[True, False])
+    )
+
+
+def latency(events: pl.LazyFrame) -> pl.LazyFrame:
+    """Latency and time-to-first-token percentiles by model from telemetry events of synchronous runs."""
+    return (
+        events.filter(pl.col("latency").is_not_null())
+        .group_by("model")
+        .agg(
+            pl.len().alias("requests"),
+            (pl.col("status") == "error").sum().alias("errors"),
+            *(
+                pl.col("latency").quantile(q / 100, "nearest").alias(f"latency_p{q}")
+                for q in PERCENTILES
+            ),
+            pl.col("ttft").quantile(0.5, "nearest").alias("ttft_p50"),
+            pl.col("ttft").quantile(0.95, "nearest").alias("ttft_p95"),
+        )
+        .sort("model")
+    )
+
+
+def by_param(responses: pl.LazyFrame, param: str) -> pl.LazyFrame:
+    """Requests, error rate, token means and truncated share for each value of a template parameter."""
+    column = f"param_{param}"
+    return (
+        responses.group_by(pl.col(column).alias(param))
+        .agg(
+            pl.len().alias("requests"),
+            ((pl.col("status") == "error").sum() / pl.len()).alias("error_rate"),
+            pl.col("prompt_tokens").mean().alias("prompt_mean"),
+            pl.col("completion_tokens").mean().alias("completion_mean"),
+            (pl.col("finish_reason").is_in(TRUNCATED).sum() / pl.len()).alias(
+                "truncated"
+            ),
+        )
+        .sort(param)
+    )
+
+
+def analyze(
+    patterns: Iterable[str],
+    params: Optional[Path] = None,
+    by: Optional[List[str]] = None,
+    requests: Optional[Path] = None,
+) -> Dict[str, pl.DataFrame]:
+    """
+    Run all analyses over the response and event files matching `patterns`, optionally joining the
+    template parameters of batch results from the `params` store (through the submitted `requests` file
+    for Anthropic results). Breakdowns are made for the template parameters in `by`, all of them by
+    default. The queries are collected together, so each file is scanned once.
+    """
+    frames = scan(patterns)
+    responses, events = frames["responses"], frames["events"]
+    queries: Dict[str, pl.LazyFrame] = {}
+    if responses is not None:
+        if params is not None:
+            responses = with_params(responses, params, requests)
+        responses = responses.with_columns(pl.col("model").fill_null("unknown"))
+        responses = responses.cache()
+        queries["finish_reasons"] = finish_reasons(responses)
+        queries["token_usage"] = token_usage(responses)
+        queries["error_rates"] = error_rates(responses)
+        names = [
+            c.removeprefix("param_")
+            for c in responses.collect_schema()
+            if c.startswith("param_")
+        ]
+        for name in by if by is not None else names:
+            if name not in names:
+                raise ValueError(f"Unknown template parameter: {name}")
+            queries[f"by_{name}"] = by_param(responses, name)
+    if events is not None:
+        queries["latency"] = latency(events)
+    return dict(zip(queries, pl.collect_all(queries.values())))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------------------------------------------------
+def format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.3f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def print_tables(results: Dict[str, pl.DataFrame], console: Console) -> None:
+    for name, df in results.items():
+        table = Table(title=name.replace("_", " "), title_justify="left")
+        for column, dtype in df.schema.items():
+            table.add_column(column, justify="right" if dtype.is_numeric() else "left")
+        for row in df.iter_rows():
+            table.add_row(*(format_value(v) for v in row))
+        console.print(table)
@@ -0,0 +1,538 @@
+import asyncio
+import json
+import os
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import litellm
+import openai
+from anthropic import AsyncAnthropic
+from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
+from anthropic.types.messages.batch_create_params import Request
+from rich.console import Console
+from tenacity import AsyncRetrying
+
+from llm_batch.backoff import circuit, retry_options
+from llm_batch.caching import (
+    CachePlan,
+    CacheReport,
+    anthropic_layout,
+    cache_order,
+    order_requests,
+    plan_prefixes,
+)
+from llm_batch.clients import (
+    aclose_clients,
+    acompletion_options,
+    client_options,
+)
+from llm_batch.dedup import Deduplicator, dedup_batch_file, fanout_path, read_fanout
+from llm_batch.fileio import (
+    Compression,
+    companion_path,
+    compressed_name,
+    open_file,
+    strip_compression,
+    upload_file,
+)
+from llm_batch.profiling import phase
+from llm_batch.progress import RunProgress
+from llm_batch.records import (
+    CHAT_URL,
+    ChatRequest,
+    Validator,
+    batch_url,
+    quarantine_path,
+)
+from llm_batch.serialization import dumps, loads
+from llm_batch.store import read_records
+
+Provider = Literal["openai", "anthropic"]
+
+OPENAI_DONE = {"completed", "failed", "expired", "cancelled"}
+ANTHROPIC_DONE = {"ended"}
+
+T = TypeVar("T")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Shared clients
+# ---------------------------------------------------------------------------------------------------------------------
+def async_openai_client() -> openai.AsyncOpenAI:
+    """
+    AsyncOpenAI client over the connection pool shared on the running event loop.
+    """
+    return openai.AsyncOpenAI(**client_options("openai", asynchronous=True))
+
+
+def async_anthropic_client() -> AsyncAnthropic:
+    """
+    AsyncAnthropic client over the connection pool shared on the running event loop.
+    """
+    return AsyncAnthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        **client_options("anthropic", asynchronous=True),
+    )
+
+
+def run(main: Awaitable[T]) -> T:
+    """
+    Run a coroutine of this module on a new event loop and close the loop's connection pools before
+    returning its result. For synchronous callers such as the CLI.
+    """
+
+    async def run_and_close() -> T:
+        try:
+            return await main
+        finally:
+            await aclose_clients()
+
+    return asyncio.run(run_and_close())
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Requests
+# ---------------------------------------------------------------------------------------------------------------------
+def batch_request(custom_id: str, body: Dict, url: str = CHAT_URL) -> Dict:
+    """
+    One line of a batch requests file, to the chat completions endpoint unless `url` says otherwise.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": url,
+        "body": body,
+    }
+
+
+def request_body(request_data: Union[Dict, ChatRequest]) -> Dict:
+    if isinstance(request_data, ChatRequest):
+        return request_data.body
+    return request_data["body"]
+
+
+def build_requests(
+    request_datas: Sequence[Union[Dict, ChatRequest]],
+    plans: Optional[Sequence[CachePlan]] = None,
+) -> List[Request]:
+    """
+    Translate OpenAI-style batch request lines (dicts or validated `ChatRequest`s) into Anthropic batch
+    requests. System messages move to the `system` parameter. With cache `plans` (see
+    `caching.plan_prefixes`), requests sharing a prefix are submitted next to each other with a cache
+    breakpoint after the prefix; custom_ids keep the position of the request in the batch file either way.
+    """
+    order = cache_order(plans) if plans else range(len(request_datas))
+    requests = []
+    for idx in order:
+        body = request_body(request_datas[idx])
+        params = MessageCreateParamsNonStreaming(
+            model=body["model"],
+            max_tokens=body["max_tokens"],
+            **anthropic_layout(body, plans[idx] if plans else None),  # type: ignore
+        )
+        requests.append(Request(custom_id=f"id-{idx}", params=params))
+    return requests
+
+
+def iter_requests(
+    in_path: Path,
+    on_error: Optional[Callable[[Path, json.JSONDecodeError], None]] = None,
+) -> Iterator[Dict]:
+    """
+    Stream batch requests from a directory of JSON request files or from a template output store.
+    Files that are not valid JSON are skipped and passed to `on_error`.
+    """
+    if in_path.is_file():
+        for record in read_records(in_path):
+            yield batch_request(f"id_{record['id']}", record["request"])
+        return
+    for f in in_path.glob("*.json"):
+        try:
+            with phase("load"):
+                text = f.read_bytes()
+            with phase("serialize"):
+                body = loads(text)
+        except json.JSONDecodeError as e:
+            if on_error:
+                on_error(f, e)
+            continue
+        yield batch_request(f"id_{f.name}", body.get("request", body))
+
+
+def read_batch_file(batch_file: Path) -> Iterator[Dict]:
+    with open_file(batch_file) as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+@dataclass
+class MadeBatch:
+    """A batch requests file written by `make_batch_file`, and what was dropped or reordered on the way."""
+
+    path: Path
+    count: int
+    validator: Validator
+    deduplicator: Optional[Deduplicator] = None
+    cache_report: Optional[CacheReport] = None
+
+
+def make_batch_file(
+    in_path: Path,
+    out: Path,
+    batch_name: str = "batch",
+    dedup: bool = False,
+    cache_order: bool = False,
+    compression: Compression = "none",
+    progress: Optional[RunProgress] = None,
+    on_error: Optional[Callable[[Path, json.JSONDecodeError], None]] = None,
+) -> MadeBatch:
+    """
+    Write a batch requests file from JSON request files or an output store, streaming one request at a time.
+    Invalid requests are skipped and written to `<batch_name>-quarantine.jsonl`. With `dedup`, identical
+    request bodies are written once and a fan-out map is written alongside. Ordering by cache prefix needs
+    the whole batch, so `cache_order` holds the requests in memory.
+    """
+    out.mkdir(parents=True, exist_ok=True)
+    out_file = out / compressed_name(f"{batch_name}-requests.jsonl", compression)
+    made = MadeBatch(out_file, 0, Validator(quarantine=quarantine_path(out_file)))
+
+    def read() -> Iterator[Dict]:
+        for request in iter_requests(in_path, on_error):
+            if progress:
+                progress.advance()
+            yield request
+
+    with ExitStack() as stack:
+        f = stack.enter_context(open_file(out_file, "w"))
+        requests = stack.enter_context(made.validator).check(read())
+        if dedup:
+            fanout = stack.enter_context(open(fanout_path(out_file), "w"))
+            made.deduplicator = Deduplicator(fanout)
+            requests = made.deduplicator.unique(requests)
+        if cache_order:
+            with phase("tokenize"):
+                requests, made.cache_report = order_requests(list(requests))
+        for request in requests:
+            with phase("serialize"):
+                line = dumps(request)
+            with phase("write"):
+                f.write(("\n" if made.count else "") + line)
+            made.count += 1
+    return made
+
+
+@dataclass
+class PreparedBatch:
+    """A batch requests file as `send` submits it: validated, deduplicated and, for Anthropic, translated."""
+
+    batch_file: Path
+    validator: Validator
+    # the file whose lines are submitted: `batch_file`, its valid lines or its unique requests
+    path: Path
+    # Anthropic batch requests, in submission order
+    requests: Optional[List[Request]] = None
+    deduplicator: Optional[Deduplicator] = None
+    cache_report: Optional[CacheReport] = None
+
+    def print(self, console: Console) -> None:
+        self.validator.print(console)
+        if self.deduplicator:
+            console.print(
+                f"[green]Deduplicated {self.deduplicator.total} requests to {self.deduplicator.unique_count}[/green] "
+                f"(fan-out map: {fanout_path(self.batch_file)})"
+            )
+        if self.path != self.batch_file:
+            console.print(f"Submitted requests written to {self.path}")
+        if self.cache_report:
+            self.cache_report.print(console)
+
+
+def prepare_batch(
+    batch_file: Path,
+    provider: Provider = "openai",
+    dedup: bool = False,
+    strict: bool = True,
+    cache: bool = True,
+) -> PreparedBatch:
+    """
+    Validate a batch requests file for submission. With `strict`, the first invalid line raises
+    (`json.JSONDecodeError` or `RecordError`, with its line number); otherwise invalid lines are written to
+    `<batch>-quarantine.jsonl` and the rest to `<batch>-valid.jsonl`, which is what gets submitted. With
+    `dedup`, only requests with unique bodies are submitted and a fan-out map is written alongside.
+    Anthropic requests are translated in memory; with `cache`, requests sharing a prompt prefix are
+    grouped and get a cache breakpoint.
+    """
+    quarantine = None if strict else quarantine_path(batch_file)
+    valid_path = companion_path(batch_file, "valid")
+    if provider == "anthropic":
+        with (
+            open_file(batch_file) as f,
+            Validator("anthropic", quarantine) as validator,
+            phase("serialize"),
+        ):
+            request_datas: List = list(validator.parse(f))
+        prepared = PreparedBatch(batch_file, validator, batch_file)
+        if dedup:
+            with open(fanout_path(batch_file), "w") as fanout:
+                prepared.deduplicator = Deduplicator(fanout)
+                request_datas = list(
+                    prepared.deduplicator.unique(r.to_dict() for r in request_datas)
+                )
+        if validator.invalid:
+            # result custom_ids are positions, so keep the file the positions refer to
+            prepared.path = valid_path
+            with open(valid_path, "w") as valid:
+                valid.writelines(
+                    dumps(r.to_dict() if isinstance(r, ChatRequest) else r) + "\n"
+                    for r in request_datas
+                )
+        plans = None
+        if cache:
+            with phase("tokenize"):
+                plans = plan_prefixes(request_body(data) for data in request_datas)
+            prepared.cache_report = CacheReport.from_plans(plans)
+        with phase("render"):
+            prepared.requests = build_requests(request_datas, plans)
+        return prepared
+
+    with ExitStack() as stack, phase("serialize"):
+        f = stack.enter_context(open_file(batch_file))
+        validator = stack.enter_context(Validator(quarantine=quarantine))
+        valid = None if strict else stack.enter_context(open(valid_path, "w"))
+        for line in validator.valid_lines(f):
+            if valid:
+                valid.write(line)
+    prepared = PreparedBatch(batch_file, validator, batch_file)
+    if validator.invalid:
+        prepared.path = valid_path
+    elif not strict:
+        valid_path.unlink()
+    if dedup:
+        plain = batch_file.with_name(strip_compression(batch_file.name))
+        unique_path = plain.with_suffix(".unique.jsonl")
+        with phase("serialize"):
+            prepared.deduplicator = dedup_batch_file(
+                prepared.path, unique_path, fanout_path(batch_file)
+            )
+        prepared.path = unique_path
+    return prepared
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Coroutines
+# ---------------------------------------------------------------------------------------------------------------------
+async def make(
+    in_path: Path,
+    out: Path,
+    batch_name: str = "batch",
+    dedup: bool = False,
+    cache_order: bool = False,
+    compression: Compression = "none",
+) -> Path:
+    """
+    Write a batch requests file from JSON request files or an output store; returns its path.
+    See `make_batch_file`.
+    """
+    made = await asyncio.to_thread(
+        make_batch_file, in_path, out, batch_name, dedup, cache_order, compression
+    )
+    return made.path
+
+
+async def send(
+    batch_file: Path,
+    provider: Provider = "openai",
+    description: str = "batch job",
+    cache: bool = True,
+    metadata: Optional[Dict[str, str]] = None,
+    dedup: bool = False,
+    strict: bool = True,
+    on_prepared: Optional[Callable[[PreparedBatch], None]] = None,
+) -> str:
+    """
+    Validate and submit a batch requests file and return the provider batch ID. See `prepare_batch` for
+    `dedup`, `strict` and `cache`; `on_prepared` is called with the prepared batch before it is submitted.
+    `metadata` is attached to OpenAI batches; Anthropic batches have no metadata.
+    """
+    prepared = await asyncio.to_thread(
+        prepare_batch, batch_file, provider, dedup, strict, cache
+    )
+    if on_prepared:
+        on_prepared(prepared)
+    if provider == "anthropic":
+        with phase("network"):
+            batch = await async_anthropic_client().messages.batches.create(
+                requests=prepared.requests  # type: ignore
+            )
+        return batch.id
+
+    client = async_openai_client()
+    with phase("network"):
+        with upload_file(prepared.path) as f:
+            uploaded = await client.files.create(file=f, purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=batch_url(prepared.path),  # type: ignore
+            completion_window="24h",
+            metadata={
+                "description": f"{description}: {batch_file.name}",
+                **(metadata or {}),
+            },
+        )
+    return batch.id
+
+
+async def retrieve(batch_id: str, provider: Provider = "openai"):
+    """The provider batch object: status, request counts and, for OpenAI, the endpoint and file IDs."""
+    if provider == "anthropic":
+        return await async_anthropic_client().messages.batches.retrieve(batch_id)
+    return await async_openai_client().batches.retrieve(batch_id)
+
+
+async def poll(
+    batch_id: str,
+    provider: Provider = "openai",
+    interval: float = 30.0,
+    timeout: Optional[float] = None,
+):
+    """
+    Wait until a batch reaches a terminal state and return the provider batch object.
+    Raises TimeoutError if `timeout` seconds pass first.
+    """
+    async with asyncio.timeout(timeout):
+        while True:
+            if provider == "anthropic":
+                batch = await async_anthropic_client().messages.batches.retrieve(
+                    batch_id
+                )
+                if batch.processing_status in ANTHROPIC_DONE:
+                    return batch
+            else:
+                batch = await async_openai_client().batches.retrieve(batch_id)
+                if batch.status in OPENAI_DONE:
+                    return batch
+            await asyncio.sleep(interval)
+
+
+async def progress(batch_id: str, provider: Provider = "openai") -> Tuple[bool, int, int]:
+    """
+    Whether a batch reached a terminal state, and how many of its requests are done out of the total.
+    """
+    if provider == "anthropic":
+        batch = await async_anthropic_client().messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        done = counts.succeeded + counts.errored + counts.canceled + counts.expired
+        return batch.processing_status in ANTHROPIC_DONE, done, done + counts.processing
+    batch = await async_openai_client().batches.retrieve(batch_id)
+    counts = batch.request_counts
+    done = (counts.completed + counts.failed) if counts else 0
+    return batch.status in OPENAI_DONE, done, counts.total if counts else 0
+
+
+async def cancel(batch_id: str, provider: Provider = "openai") -> None:
+    """
+    Ask the provider to cancel a batch. Requests already done keep their results; `poll` until it ends.
+    """
+    if provider == "anthropic":
+        await async_anthropic_client().messages.batches.cancel(batch_id)
+    else:
+        await async_openai_client().batches.cancel(batch_id)
+
+
+async def fetch_lines(batch_id: str, provider: Provider = "openai") -> AsyncIterator[str]:
+    """
+    Stream the results of a finished batch as JSON lines, without parsing them: OpenAI output-file lines
+    as downloaded, followed by the error-file lines, or Anthropic results in compact JSON.
+    """
+    if provider == "anthropic":
+        results = await async_anthropic_client().messages.batches.results(batch_id)
+        async for result in results:
+            yield result.to_json(indent=None)
+        return
+
+    client = async_openai_client()
+    batch = await client.batches.retrieve(batch_id)
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        async with client.files.with_streaming_response.content(file_id) as response:
+            async for line in response.iter_lines():
+                if line.strip():
+                    yield line
+
+
+async def fetch(
+    batch_id: str, provider: Provider = "openai", fanout: Optional[Path] = None
+) -> AsyncIterator[Dict]:
+    """
+    Stream the results of a finished batch, one dict per request. OpenAI error-file lines are included.
+    With the `fanout` map of a deduplicated batch, each result is followed by a copy for every duplicate
+    request that was dropped in its favour.
+    """
+    copies = read_fanout(fanout) if fanout else {}
+    async for line in fetch_lines(batch_id, provider):
+        result = loads(line)
+        yield result
+        for custom_id in copies.get(result.get("custom_id", ""), []):
+            yield {**result, "custom_id": custom_id}
+
+
+async def execute(
+    requests: Iterable[Dict], concurrency: int = 16, attempts: int = 10
+) -> AsyncIterator[Dict]:
+    """
+    Run chat requests synchronously (not batched) through litellm with bounded concurrency.
+    Takes batch request lines and yields `{"custom_id", "response"}` or `{"custom_id", "error"}` dicts
+    in completion order. The connection pools of the event loop are closed when it is done.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(request: Dict) -> Dict:
+        body = request["body"]
+        async with semaphore:
+            try:
+                async for attempt in AsyncRetrying(**retry_options(attempts)):
+                    with attempt, circuit(body.get("model", "")):
+                        response = await litellm.acompletion(
+                            **body, **acompletion_options(body)
+                        )
+            except Exception as e:
+                return {"custom_id": request["custom_id"], "error": str(e)}
+        return {"custom_id": request["custom_id"], "response": response.json()}  # type: ignore
+
+    # schedule lazily so a huge request iterator is never materialised as tasks all at once
+    pending: set = set()
+    try:
+        for request in requests:
+            pending.add(asyncio.create_task(run(request)))
+            if len(pending) >= concurrency * 2:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        await aclose_clients()
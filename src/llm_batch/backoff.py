@@ -0,0 +1,216 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+import litellm
+from tenacity import (
+    RetryCallState,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from llm_batch import CONFIG, item_log, logger
+from llm_batch.clients import provider_of
+
+# retries, fast failures and circuit-breaker rejections since start-up, by error class
+counts: Counter = Counter()
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Error classes
+# ---------------------------------------------------------------------------------------------------------------------
+def classify(exc: BaseException) -> str:
+    """
+    `rate_limit` (429), `server` (5xx), `transient` (timeouts, 408/409, dropped connections) or `fatal`
+    (other 4xx such as bad requests and authentication errors, and errors that are not from the API).
+    """
+    if isinstance(exc, CircuitOpenError):
+        return "fatal"
+    # before the status code: litellm gives connection errors a status_code of 500
+    if isinstance(exc, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return "transient"
+    if isinstance(exc, (litellm.APIConnectionError, litellm.Timeout)):
+        return "transient"
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        if status == 429:
+            return "rate_limit"
+        if status in (408, 409):
+            return "transient"
+        if status >= 500:
+            return "server"
+        if status >= 400:
+            return "fatal"
+    return "fatal"
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from the `retry-after-ms` or `retry-after` (seconds or HTTP date) response header."""
+    headers = getattr(exc, "litellm_response_headers", None)
+    if headers is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Circuit breakers
+# ---------------------------------------------------------------------------------------------------------------------
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive server errors from a provider; while open (for `cooldown` seconds)
+    calls fail fast with `CircuitOpenError`. The first call after the cooldown is let through as a probe.
+    """
+
+    def __init__(self, provider: str, threshold: int = 5, cooldown: float = 60.0):
+        self.provider = provider
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return (
+            self.opened_at is not None
+            and time.monotonic() - self.opened_at < self.cooldown
+        )
+
+    def check(self) -> None:
+        if self.is_open:
+            counts["circuit_open"] += 1
+            raise CircuitOpenError(
+                f"circuit breaker open for {self.provider} after {self.failures} consecutive server errors"
+            )
+
+    def success(self) -> None:
+        if self.opened_at is not None:
+            logger.warning(f"circuit breaker closed for {self.provider}")
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self, exc: BaseException) -> None:
+        if classify(exc) != "server":
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            # state changes are logged in full, unlike the sampled per-request retries
+            if self.opened_at is None:
+                logger.warning(
+                    f"circuit breaker opened for {self.provider} after {self.failures} consecutive server errors"
+                )
+            elif not self.is_open:
+                logger.warning(f"circuit breaker reopened for {self.provider}: probe failed")
+            self.opened_at = time.monotonic()
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(provider: str) -> CircuitBreaker:
+    if provider not in breakers:
+        policy = RetryPolicy.from_config()
+        breakers[provider] = CircuitBreaker(
+            provider, policy.breaker_threshold, policy.breaker_cooldown
+        )
+    return breakers[provider]
+
+
+@contextmanager
+def circuit(model: str):
+    """Guard one provider call: fail fast while the provider's breaker is open, and feed it the outcome."""
+    guard = breaker(provider_of(model))
+    guard.check()
+    try:
+        yield
+    except Exception as e:
+        guard.failure(e)
+        raise
+    guard.success()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Retry policy
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 10
+    min_wait: float = 1.0
+    max_wait: float = 60.0
+    # longest Retry-After honoured; longer ones are capped
+    max_retry_after: float = 300.0
+    breaker_threshold: int = 5
+    breaker_cooldown: float = 60.0
+
+    @classmethod
+    def from_config(cls) -> "RetryPolicy":
+        return cls(**(CONFIG.get("retries") or {}))
+
+    def wait(self, retry_state: RetryCallState) -> float:
+        """Retry-After when the provider sent one, else random exponential backoff."""
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        seconds = retry_after(exc) if exc is not None else None
+        if seconds is not None:
+            return min(seconds, self.max_retry_after)
+        return wait_random_exponential(min=self.min_wait, max=self.max_wait)(
+            retry_state
+        )
+
+    def options(self, attempts: Optional[int] = None) -> Dict:
+        """Keyword arguments for tenacity's `retry`, `Retrying` and `AsyncRetrying`."""
+        return dict(
+            retry=retry_if_exception(is_retryable),
+            wait=self.wait,
+            stop=stop_after_attempt(attempts or self.max_attempts),
+            before_sleep=count_retry,
+            reraise=True,
+        )
+
+
+def is_retryable(exc: BaseException) -> bool:
+    kind = classify(exc)
+    if kind == "fatal":
+        counts["fast_fail"] += 1
+        return False
+    return True
+
+
+def count_retry(retry_state: RetryCallState) -> None:
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    kind = classify(exc) if exc is not None else "unknown"
+    counts[f"retry_{kind}"] += 1
+    # sampled per error class, so a burst of 429s does not hide the first server error
+    item_log(
+        f"retry_{kind}",
+        "retrying %s after %s error (attempt %d): %s",
+        getattr(retry_state.fn, "__name__", "call"),
+        kind,
+        retry_state.attempt_number,
+        exc,
+    )
+
+
+def retry_options(attempts: Optional[int] = None) -> Dict:
+    """Tenacity options of the configured retry policy."""
+    return RetryPolicy.from_config().options(attempts)
@@ -1,19 +1,26 @@
-import json
 import os
 import openai
+from contextlib import ExitStack
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 from typing_extensions import Annotated
 from cyclopts import App, Parameter
 from anthropic import Anthropic
-from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
-from anthropic.types.messages.batch_create_params import Request
 
 from llm_batch import (
     __version__,
     console,
     logger,
 )
+from llm_batch import api
+from llm_batch.clients import client_options
+from llm_batch.fileio import Compression, compressed_name, open_file
+from llm_batch.records import RecordError
+from llm_batch.serialization import JSONDecodeError, loads
+from llm_batch.profiling import phase
+from llm_batch.progress import RunProgress
+from llm_batch.telemetry import Telemetry, event_from_batch_result
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Globals
@@ -21,38 +28,48 @@ from llm_batch import (
 anthropic_batch_app = App(help="Anthropic batching commands", version=__version__)
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+# Commands
 # ---------------------------------------------------------------------------------------------------------------------
 @anthropic_batch_app.command()
 def send(
     batch_file: Annotated[Path, Parameter(help="Batch file")] = None,  # type: ignore
+    dedup: Annotated[
+        bool,
+        Parameter(help="Submit only requests with unique bodies and write a fan-out map"),
+    ] = False,
+    cache: Annotated[
+        bool,
+        Parameter(help="Group requests by shared prompt prefix and add cache breakpoints"),
+    ] = True,
+    strict: Annotated[
+        bool,
+        Parameter(
+            help="Stop at the first invalid line (--no-strict: quarantine invalid lines and send the rest)"
+        ),
+    ] = True,
 ):
     """
     Upload a batch file to Anthropic and start processing it.
+    Every line is validated first; errors are reported with their line number.
     """
-    request_datas = []
-    with open(batch_file, "r") as f:    
-        for line in f:
-            request_datas.append(json.loads(line))
-
-    requests=[]
-    for idx, request_data in enumerate(request_datas):
-        body = request_data['body']
-        params=MessageCreateParamsNonStreaming(
-            model=body['model'],
-            max_tokens=body['max_tokens'],
-            messages=body['messages'],
-        )
-        requests.append(
-            Request(
-                custom_id=f"id-{idx}", 
-                params=params
+    try:
+        batch_id = api.run(
+            api.send(
+                batch_file,
+                "anthropic",
+                cache=cache,
+                dedup=dedup,
+                strict=strict,
+                on_prepared=lambda prepared: prepared.print(console),
             )
         )
-    client = Anthropic(
-        api_key=os.environ.get("ANTHROPIC_API_KEY")
-    )
-    message_batch = client.messages.batches.create(requests=requests)
-    console.print(f"[green]Batch {message_batch.id} created successfully.[/green]")
+    except (JSONDecodeError, RecordError) as e:
+        console.print(f"[red]Invalid batch file {batch_file}, {e}[/red]")
+        console.print("Fix the line, or send with --no-strict to quarantine invalid lines.")
+        logger.error(f"Invalid batch file {batch_file}, {e}")
+        return
+    console.print(f"[green]Batch {batch_id} created successfully.[/green]")
 
 # ---------------------------------------------------------------------------------------------------------------------
 @anthropic_batch_app.command()
@@ -65,7 +82,7 @@ def check(
     Display all Anthropic batches for your account
     """
     client = Anthropic(
-        api_key=os.environ.get("ANTHROPIC_API_KEY")
+        api_key=os.environ.get("ANTHROPIC_API_KEY"), **client_options("anthropic")
     )
     batches = client.messages.batches.list(limit=limit)
     batches = sorted(batches, key=lambda x: x.created_at)
@@ -79,24 +96,49 @@ def fetch(
     batch_id: Annotated[str, Parameter(help="Batch ID")] = None,  # type: ignore
     out: Annotated[Path, Parameter("--out", help="Path to output file")] = Path("."),
     batch_name: Annotated[str, Parameter("--batch", help="Batch name")] = "batch",
+    events: Annotated[
+        Optional[Path],
+        Parameter(help="Append per-request telemetry events to this JSONL file"),
+    ] = None,
+    compression: Annotated[
+        Compression, Parameter(help="Compress the results file (gzip: .gz, zstd: .zst)")
+    ] = "none",
 ):
     """
     Download batch results to a file if the batch job is completed, else job status is displayed.
+    Results are written one at a time as they stream in.
     """
+    api.run(fetch_results(batch_id, out, batch_name, events, compression))
+
+
+async def fetch_results(
+    batch_id: str,
+    out: Path,
+    batch_name: str,
+    events: Optional[Path] = None,
+    compression: Compression = "none",
+) -> None:
     if not out.exists():
         out.mkdir(parents=True)
-    out_file = out / f"{batch_name}-responses.jsonl"
-    out_file.write_text("")
+    out_file = out / compressed_name(f"{batch_name}-responses.jsonl", compression)
+
+    with ExitStack() as stack:
+        f = stack.enter_context(open_file(out_file, "w"))
+        telemetry = stack.enter_context(Telemetry(events)) if events else None
+        progress = stack.enter_context(
+            RunProgress("fetch", console=console, discount=0.5)
+        )
+        count = 0
+        async for line in api.fetch_lines(batch_id, "anthropic"):
+            with phase("write"):
+                f.write(("\n" if count else "") + line)
+            count += 1
+            data = loads(line)
+            progress.advance_result(data)
+            if telemetry:
+                telemetry.record(event_from_batch_result(data, "anthropic-batch"))
+        if telemetry:
+            telemetry.print_summary(console)
 
-    client = Anthropic(
-        api_key=os.environ.get("ANTHROPIC_API_KEY")
-    )
-    results = client.messages.batches.results(
-        message_batch_id=batch_id,
-    )
-    results_json = [result.to_json() for result in results]
-    out_file.write_text(",\n".join(results_json))
-    
     console.print(f"[orange1]writing json output to {out_file}")
     logger.info(f"writing json output to {out_file}")
-    
\ No newline at end of file
@@ -1,7 +1,8 @@
-import json
 import openai
+from contextlib import ExitStack
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 from typing_extensions import Annotated
 from cyclopts import App, Parameter
 from llm_batch import (
@@ -9,6 +10,15 @@ from llm_batch import (
     console,
     logger,
 )
+from llm_batch import api
+from llm_batch.clients import client_options
+from llm_batch.fileio import Compression, compressed_name, open_file
+from llm_batch.profiling import phase
+from llm_batch.embeddings import EmbeddingsWriter, embeddings_paths
+from llm_batch.records import EMBEDDINGS_URL, RecordError
+from llm_batch.serialization import JSONDecodeError, loads
+from llm_batch.progress import RunProgress
+from llm_batch.telemetry import Telemetry, event_from_batch_result
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Globals
@@ -25,24 +35,40 @@ def send(
     description: Annotated[
         str, Parameter("--desc", help="Description of the batch job")
     ] = "batch job from batch",  # type: ignore
+    dedup: Annotated[
+        bool,
+        Parameter(help="Upload only requests with unique bodies and write a fan-out map"),
+    ] = False,
+    strict: Annotated[
+        bool,
+        Parameter(
+            help="Stop at the first invalid line (--no-strict: quarantine invalid lines and upload the rest)"
+        ),
+    ] = True,
 ):
     """
-    Upload a batch file to OpenAI
+    Upload a batch file to OpenAI. Every line is validated first; errors are reported with their line number.
     """
-    client = openai.OpenAI()
-    batch_input_file = client.files.create(file=open(batch_file, "rb"), purpose="batch")
+    try:
+        batch_id = api.run(
+            api.send(
+                batch_file,
+                "openai",
+                description,
+                dedup=dedup,
+                strict=strict,
+                on_prepared=lambda prepared: prepared.print(console),
+            )
+        )
+    except (JSONDecodeError, RecordError) as e:
+        console.print(f"[red]Invalid batch file {batch_file}, {e}[/red]")
+        console.print("Fix the line, or send with --no-strict to quarantine invalid lines.")
+        logger.error(f"Invalid batch file {batch_file}, {e}")
+        return
     console.print(f"Uploaded batch file: {batch_file}")
-    console.print(f"[orange1]{batch_input_file}")
+    console.print(f"Batch created: {batch_id}")
     logger.info(f"Uploaded batch file: {batch_file}")
-    logger.info(f"{batch_input_file}")
-    batch_create_response = client.batches.create(
-        input_file_id=batch_input_file.id,
-        endpoint="/v1/chat/completions",
-        completion_window="24h",
-        metadata={"description": f"{description}: {batch_file.name}"},
-    )
-    console.print(f"Batch created: {batch_create_response.id}")
-    logger.info(f"Batch created: {batch_create_response.id}")
+    logger.info(f"Batch created: {batch_id}")
 
 # ---------------------------------------------------------------------------------------------------------------------
 @openai_batch_app.command()
@@ -50,21 +76,105 @@ def fetch(
     batch_id: Annotated[str, Parameter(help="Batch ID")] = None,  # type: ignore
     out: Annotated[Path, Parameter("--out", help="Path to output file")] = Path("."),
     batch_name: Annotated[str, Parameter("--batch", help="Batch name")] = "batch",
+    events: Annotated[
+        Optional[Path],
+        Parameter(help="Append per-request telemetry events to this JSONL file"),
+    ] = None,
+    compression: Annotated[
+        Compression, Parameter(help="Compress the results file (gzip: .gz, zstd: .zst)")
+    ] = "none",
 ):
     """
     Download batch results to a file if the batch job is completed, else job status is displayed.
+    Failed requests from the batch's error file follow the successful ones.
+    The results of an embeddings batch are decoded into `<batch>-embeddings.npy`, a float32 matrix,
+    with the custom ID of each row in `<batch>-embeddings-ids.jsonl`.
     """
-    client = openai.OpenAI()
-    batch_retrieve_response = client.batches.retrieve(batch_id)
-    logger.info(batch_retrieve_response)
-    console.print(batch_retrieve_response)
-    if batch_retrieve_response.status == "completed":
-        file_response = client.files.content(batch_retrieve_response.output_file_id)  # type: ignore
-        out.mkdir(parents=True, exist_ok=True)
-        out_file = out / f"{batch_name}-responses.jsonl"
-        out_file.write_text(file_response.text)
-        logger.info(f"writing json output to {out_file}")
-        console.print(f"[orange1]writing json output to {out_file}")
+    api.run(fetch_results(batch_id, out, batch_name, events, compression))
+
+
+async def fetch_results(
+    batch_id: str,
+    out: Path,
+    batch_name: str,
+    events: Optional[Path] = None,
+    compression: Compression = "none",
+) -> None:
+    with phase("network"):
+        batch = await api.retrieve(batch_id)
+    logger.info(batch)
+    console.print(batch)
+    if batch.status != "completed":
+        return
+    if batch.endpoint == EMBEDDINGS_URL:
+        return await fetch_embeddings(batch, out, batch_name, events)
+    out.mkdir(parents=True, exist_ok=True)
+    out_file = out / compressed_name(f"{batch_name}-responses.jsonl", compression)
+    logger.info(f"writing json output to {out_file}")
+    console.print(f"[orange1]writing json output to {out_file}")
+    total = getattr(batch.request_counts, "total", None)
+    with ExitStack() as stack:
+        telemetry = stack.enter_context(Telemetry(events)) if events else None
+        progress = stack.enter_context(
+            RunProgress(
+                "fetch",
+                total=total if isinstance(total, int) else None,
+                console=console,
+                discount=0.5,
+            )
+        )
+        f = stack.enter_context(open_file(out_file, "w"))
+        # stream the results to disk line by line instead of holding them in memory
+        count = 0
+        async for line in api.fetch_lines(batch_id):
+            f.write(("\n" if count else "") + line)
+            count += 1
+            result = loads(line)
+            progress.advance_result(result)
+            if telemetry:
+                telemetry.record(event_from_batch_result(result, "openai-batch"))
+    if telemetry:
+        telemetry.print_summary(console)
+
+
+async def fetch_embeddings(
+    batch,
+    out: Path,
+    batch_name: str,
+    events: Optional[Path] = None,
+) -> None:
+    """
+    Stream the results of an embeddings batch into a float32 matrix and its ID index, without
+    materializing the vectors as JSON lists of floats. Failed requests go to `<batch>-errors.jsonl`,
+    which is rewritten on every fetch.
+    """
+    out.mkdir(parents=True, exist_ok=True)
+    matrix, ids, errors = embeddings_paths(out, batch_name)
+    total = getattr(batch.request_counts, "total", None)
+    with ExitStack() as stack:
+        telemetry = stack.enter_context(Telemetry(events)) if events else None
+        progress = stack.enter_context(
+            RunProgress(
+                "fetch",
+                total=total if isinstance(total, int) else None,
+                console=console,
+                discount=0.5,
+            )
+        )
+        failed = stack.enter_context(open(errors, "w"))
+        writer = stack.enter_context(EmbeddingsWriter(matrix, ids, failed))
+        async for line in api.fetch_lines(batch.id):
+            result = loads(line)
+            progress.advance_result(result)
+            if telemetry:
+                telemetry.record(event_from_batch_result(result, "openai-batch"))
+            writer.write(result)
+    counts = writer.counts
+    message = f"{counts['rows']:,} embeddings of {counts['results']:,} requests written to {matrix}"
+    logger.info(message)
+    console.print(f"[orange1]{message}")
+    if telemetry:
+        telemetry.print_summary(console)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -77,7 +187,7 @@ def check(
     """
     Display all OpenAI batches for your account
     """
-    client = openai.OpenAI()
+    client = openai.OpenAI(**client_options("openai"))
     batches = client.batches.list(limit=limit)
     batches = sorted(batches, key=lambda x: x.created_at)
     for b in batches:
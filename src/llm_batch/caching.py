@@ -0,0 +1,231 @@
+import copy
+import hashlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import litellm
+from rich.console import Console
+from rich.table import Table
+
+from llm_batch import CONFIG
+from llm_batch.serialization import dumps
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Token estimates
+# ---------------------------------------------------------------------------------------------------------------------
+def count_tokens(text: str) -> int:
+    """
+    Token estimate with the tiktoken cl100k_base encoding bundled with litellm (no download needed).
+    Exact for OpenAI models of that generation and close enough for Anthropic savings estimates.
+    """
+    return len(litellm.encoding.encode(text, disallowed_special=()))
+
+
+def content_text(content) -> str:
+    """
+    Text of a message `content`, which is either a string or a list of content blocks.
+    """
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") if isinstance(block, dict) else str(block)
+        for block in content or []
+    )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Prefix detection
+# ---------------------------------------------------------------------------------------------------------------------
+def segments(body: Dict) -> List[Tuple[str, object]]:
+    """
+    Split a chat request body into the units a cache breakpoint can follow, in prompt order:
+    the system prompt, then each non-system message.
+    """
+    parts: List[Tuple[str, object]] = []
+    system = [m for m in body.get("messages", []) if m.get("role") == "system"]
+    if system:
+        parts.append(("system", [m["content"] for m in system]))
+    for message in body.get("messages", []):
+        if message.get("role") != "system":
+            parts.append(("message", message))
+    return parts
+
+
+def segment_text(kind: str, value) -> str:
+    if kind == "system":
+        return "".join(content_text(content) for content in value)
+    return content_text(value.get("content"))
+
+
+def prefix_keys(
+    body: Dict, memo: Optional[Dict[bytes, int]] = None
+) -> List[Tuple[bytes, int]]:
+    """
+    Digest and cumulative token count of every prefix of the request that ends on a segment boundary.
+    The model and tool definitions are part of every digest: provider caches are per model, and tools
+    come before the messages in the cached prompt. Token counts are memoized in `memo` by prefix digest,
+    so a prefix shared by many requests is only tokenized once.
+    """
+    if memo is None:
+        memo = {}
+    h = hashlib.blake2b(digest_size=16)
+    h.update(
+        dumps([body.get("model"), body.get("tools")], sort_keys=True).encode()
+    )
+    key = h.digest()
+    if key not in memo:
+        memo[key] = count_tokens(dumps(body["tools"])) if body.get("tools") else 0
+    tokens = memo[key]
+    keys = []
+    for kind, value in segments(body):
+        h.update(dumps([kind, value], sort_keys=True).encode())
+        key = h.digest()
+        if key not in memo:
+            memo[key] = tokens + count_tokens(segment_text(kind, value))
+        tokens = memo[key]
+        keys.append((key, tokens))
+    return keys
+
+
+@dataclass
+class CachePlan:
+    """Longest prefix a request shares with others in its batch, as a segment index and token count."""
+
+    segment: Optional[int] = None
+    key: Optional[bytes] = None
+    tokens: int = 0
+    input_tokens: int = 0
+
+
+def plan_prefixes(
+    bodies: Iterable[Dict], min_tokens: Optional[int] = None
+) -> List[CachePlan]:
+    """
+    Find, for each request, the longest prefix shared with at least one other request in the batch that is
+    long enough to be cached (`caching.min_prefix_tokens` in config.yml by default).
+    """
+    if min_tokens is None:
+        min_tokens = (CONFIG.get("caching") or {}).get("min_prefix_tokens", 1024)
+    memo: Dict[bytes, int] = {}
+    all_keys = [prefix_keys(body, memo) for body in bodies]
+    counts = Counter(key for keys in all_keys for key, _ in keys)
+    plans = []
+    for keys in all_keys:
+        plan = CachePlan(input_tokens=keys[-1][1] if keys else 0)
+        for idx, (key, tokens) in enumerate(keys):
+            if counts[key] < 2:
+                break
+            if tokens >= min_tokens:
+                plan.segment, plan.key, plan.tokens = idx, key, tokens
+        plans.append(plan)
+    return plans
+
+
+def cache_order(plans: Sequence[CachePlan]) -> List[int]:
+    """
+    Request order that puts requests sharing a prefix next to each other. Groups keep the position of their
+    first member and requests without a shared prefix stay where they are.
+    """
+    first: Dict[bytes, int] = {}
+    group = []
+    for idx, plan in enumerate(plans):
+        group.append(first.setdefault(plan.key, idx) if plan.key else idx)
+    return sorted(range(len(plans)), key=lambda idx: (group[idx], idx))
+
+
+def order_requests(requests: List[Dict]) -> Tuple[List[Dict], "CacheReport"]:
+    """
+    Reorder batch request lines so shared prefixes are adjacent, and estimate the cacheable tokens.
+    """
+    plans = plan_prefixes([request["body"] for request in requests])
+    ordered = [requests[idx] for idx in cache_order(plans)]
+    return ordered, CacheReport.from_plans(plans)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Savings report
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class CacheReport:
+    requests: int = 0
+    input_tokens: int = 0
+    shared_requests: int = 0
+    prefix_groups: int = 0
+    cached_tokens: int = 0
+
+    @classmethod
+    def from_plans(cls, plans: Sequence[CachePlan]) -> "CacheReport":
+        groups = Counter(plan.key for plan in plans if plan.key)
+        tokens = {plan.key: plan.tokens for plan in plans if plan.key}
+        return cls(
+            requests=len(plans),
+            input_tokens=sum(plan.input_tokens for plan in plans),
+            shared_requests=sum(groups.values()),
+            prefix_groups=len(groups),
+            # the first request of each group writes the cache, the others read it
+            cached_tokens=sum((n - 1) * tokens[key] for key, n in groups.items()),
+        )
+
+    @property
+    def savings(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def print(self, console: Console) -> None:
+        table = Table(title="Prompt caching estimate", show_header=False)
+        table.add_row(
+            "requests",
+            f"{self.requests:,} ({self.shared_requests:,} in {self.prefix_groups:,} shared-prefix groups)",
+        )
+        table.add_row("input tokens", f"{self.input_tokens:,}")
+        table.add_row(
+            "cacheable tokens",
+            f"{self.cached_tokens:,} ({self.savings:.1%} of input)",
+        )
+        console.print(table)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Request layout
+# ---------------------------------------------------------------------------------------------------------------------
+def with_cache_control(content) -> List[Dict]:
+    """Content blocks with a cache breakpoint after the last block."""
+    blocks = (
+        [{"type": "text", "text": content}]
+        if isinstance(content, str)
+        else copy.deepcopy(content)
+    )
+    if blocks:
+        blocks[-1]["cache_control"] = CACHE_CONTROL
+    return blocks
+
+
+def anthropic_layout(body: Dict, plan: Optional[CachePlan] = None) -> Dict:
+    """
+    Anthropic `system` and `messages` for an OpenAI-style request body: system messages move to the
+    `system` parameter, and a cache breakpoint is placed at the end of the planned shared prefix.
+    """
+    parts = segments(body)
+    breakpoint = plan.segment if plan else None
+    layout: Dict = {"messages": []}
+    for idx, (kind, value) in enumerate(parts):
+        cached = idx == breakpoint
+        if kind == "system":
+            blocks: List[Dict] = []
+            for content in value:
+                blocks += (
+                    [{"type": "text", "text": content}]
+                    if isinstance(content, str)
+                    else content
+                )
+            layout["system"] = with_cache_control(blocks) if cached else blocks
+        elif cached:
+            layout["messages"].append(
+                {**value, "content": with_cache_control(value["content"])}
+            )
+        else:
+            layout["messages"].append(value)
+    return layout
@@ -1,26 +1,54 @@
 import os
 import json
-import litellm
+import asyncio
 import jinja2
 import yaml
 import fitz
-import logging
-import logging.config
+import time
 from pathlib import Path
+from collections import Counter
 from itertools import product
-from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterator, List, Literal, Optional
 from typing_extensions import Annotated
 from cyclopts import App, Parameter
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_random_exponential,
-)
-from llm_batch import __version__, CONFIG, console, logger, app
+from tenacity import retry
+from llm_batch import __version__, CONFIG, console, item_log, logger, app
 from llm_batch.batch_openai import openai_batch_app
 from llm_batch.batch_anthropic import anthropic_batch_app
 from llm_batch.batch_gemini import gemini_batch_app
+from llm_batch.store import open_store, read_records
+from llm_batch.api import make_batch_file
+from llm_batch.clients import use_shared_pool
+from llm_batch.telemetry import RequestEvent, Telemetry, event_from_response
+from llm_batch.mock_server import MockConfig, MockProviderServer
+from llm_batch.profiling import phase, profiled
+from llm_batch.dedup import Deduplicator, expand_results, fanout_path
+from llm_batch.packing import Packer, unpack_results
+from llm_batch.retry import retry_batch
+from llm_batch.hybrid import run_hybrid
+from llm_batch.fanout import run_fanout, run_requests
+from llm_batch.analyze import analyze as run_analysis, print_tables
+from llm_batch.extract import extract as extract_responses, rejects_path
+from llm_batch.embeddings import embedding_requests, text_sources
+from llm_batch.streaming import StreamResult, stream_completion
+from llm_batch.backoff import circuit, retry_options
+from llm_batch.progress import RunProgress
+from llm_batch.index import OffsetIndex, build_index
+from llm_batch.fileio import (
+    Compression,
+    companion_path,
+    compressed_name,
+    open_file,
+    strip_compression,
+)
+from llm_batch.serialization import dumps, loads, loads_lenient
+from llm_batch.workqueue import (
+    WorkQueue,
+    combination_count,
+    merge,
+    run_worker,
+    run_workers,
+)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -36,6 +64,35 @@ batch_app.command(gemini_batch_app, name="gemini")
 utils_app = App(help="Utility commands", version=__version__)
 app.command(utils_app, name="utils")
 
+queue_app = App(help="Sharded template runs over a shared work queue", version=__version__)
+app.command(queue_app, name="queue")
+
+
+@app.meta.default
+def launcher(
+    *tokens: Annotated[str, Parameter(show=False, allow_leading_hyphen=True)],
+    profile: Annotated[
+        bool, Parameter(help="Profile the command and print a phase breakdown")
+    ] = False,
+    profiler: Annotated[
+        Literal["cprofile", "sampling"], Parameter(help="Profiler to use with --profile")
+    ] = "cprofile",
+    profile_out: Annotated[
+        Path, Parameter(help="Profile artifact path, the suffix is set by the profiler")
+    ] = Path("llm-batch-profile"),
+):
+    """
+    Commands to execute LLM batch jobs.
+    """
+    if not profile:
+        return app(tokens)
+    with profiled(profile_out, profiler, console):
+        return app(tokens)
+
+
+def main():
+    app.meta()
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Functions
@@ -54,10 +111,52 @@ def extract_combinations(dict_of_lists: Dict[str, List]) -> List[Dict[str, str]]
 
 
 # ---------------------------------------------------------------------------------------------------------------------
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(10))
-def completion_with_backoff(chat_params, console) -> Dict:
-    response = litellm.completion(**chat_params)
-    return response.json()  # type: ignore
+# 4xx errors fail fast, 429s wait for Retry-After and 5xx errors feed the provider's circuit breaker
+@retry(**retry_options())
+def stream_with_backoff(chat_params, partial: Optional[Path] = None) -> StreamResult:
+    with circuit(chat_params.get("model", "")):
+        return stream_completion(chat_params, partial)
+
+
+def timed_stream(
+    record_id: str,
+    chat_params: Dict,
+    telemetry: Telemetry,
+    partial: Optional[Path] = None,
+) -> Dict:
+    """
+    Run `stream_with_backoff` and record its latency, time to first token, retries and usage as a
+    telemetry event.
+    """
+    start = time.perf_counter()
+    try:
+        with phase("network"):
+            result = stream_with_backoff(chat_params, partial)
+    except Exception as e:
+        telemetry.record(
+            RequestEvent(
+                id=record_id,
+                source="template",
+                status="error",
+                model=chat_params.get("model"),
+                latency=time.perf_counter() - start,
+                retries=stream_with_backoff.statistics.get("attempt_number", 1) - 1,  # type: ignore
+                error=str(e),
+            )
+        )
+        raise
+    telemetry.record(
+        event_from_response(
+            record_id,
+            "template",
+            result.response,
+            latency=time.perf_counter() - start,
+            retries=stream_with_backoff.statistics.get("attempt_number", 1) - 1,  # type: ignore
+            ttft=result.ttft,
+            tokens_per_second=result.tokens_per_second,
+        )
+    )
+    return result.response
 
 
 
@@ -66,44 +165,339 @@ def completion_with_backoff(chat_params, console) -> Dict:
 # ---------------------------------------------------------------------------------------------------------------------
 @batch_app.command()
 def make(
-    in_dir: Annotated[Path, Parameter(help="Path to input files")] = Path("."),
+    in_dir: Annotated[
+        Path, Parameter(help="Path to input files, or a template output store")
+    ] = Path("."),
     out: Annotated[Path, Parameter(help="Path to output file")] = Path("."),
     batch_name: Annotated[str, Parameter("--batch", help="Batch name")] = "batch",
+    dedup: Annotated[
+        bool,
+        Parameter(help="Drop requests with identical bodies and write a fan-out map"),
+    ] = False,
+    cache_order: Annotated[
+        bool,
+        Parameter(
+            help="Put requests that share a prompt prefix next to each other for better cache hits"
+        ),
+    ] = False,
+    compression: Annotated[
+        Compression, Parameter(help="Compress the batch file (gzip: .gz, zstd: .zst)")
+    ] = "none",
 ) -> None:
     """
-    Make a batch requests file.
+    Make a batch requests file. Invalid requests are skipped and written to `<batch>-quarantine.jsonl`.
     """
-    json_files = [f for f in in_dir.glob("*.json")]
-    if not json_files:
-        console.print("[red]No JSON files found in the input directory.[/red]")
-        return
+    if in_dir.is_file():
+        console.print(f"[green]Reading output store:[/green] {in_dir}")
+        total = None
+    else:
+        total = len(list(in_dir.glob("*.json")))
+        if not total:
+            console.print("[red]No JSON files found in the input directory.[/red]")
+            return
 
-    # Create the output file
-    if not out.exists():
-        out.mkdir(parents=True)
-    out_file = out / f"{batch_name}-requests.jsonl"
-    out_file.write_text("")
+    with RunProgress("make", total=total, console=console) as progress:
 
-    # Loop through the JSON request files
-    requests = []
-    for f in json_files:
-        try:
-            console.print(f"[green]Found JSON file:[/green] {f}")
-            request_body = json.loads(f.read_text())
-            if "request" in request_body:
-                request_body = request_body["request"]
-            request = {
-                "custom_id": f"id_{f.name}",
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": request_body,
-            }
-            requests.append(request)
-        except json.JSONDecodeError as e:
+        def skip(f: Path, e: json.JSONDecodeError) -> None:
             console.print(f"[red]Error decoding JSON in file {f}: {e}[/red]")
-            continue
-    out_file.write_text("\n".join([json.dumps(r) for r in requests]))
-    console.print(f"Batch file created: {out_file}")
+            progress.advance("failed")
+
+        made = make_batch_file(
+            in_dir, out, batch_name, dedup, cache_order, compression, progress, skip
+        )
+    made.validator.print(console)
+    if made.deduplicator:
+        print_dedup(made.deduplicator, made.path)
+    if made.cache_report:
+        made.cache_report.print(console)
+    console.print(f"Batch file created: {made.path} ({made.count} requests)")
+
+
+def print_dedup(deduplicator: Deduplicator, out_file: Path) -> None:
+    console.print(
+        f"[green]Deduplicated {deduplicator.total} requests to {deduplicator.unique_count}[/green] "
+        f"({deduplicator.duplicate_count} duplicates, fan-out map: {fanout_path(out_file)})"
+    )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+@batch_app.command()
+def embed(
+    in_path: Annotated[
+        Path,
+        Parameter(
+            help="Text file, directory of .txt files (e.g. from pdf2text) or JSONL file with id and text"
+        ),
+    ],
+    out: Annotated[Path, Parameter(help="Path to output file")] = Path("."),
+    batch_name: Annotated[str, Parameter("--batch", help="Batch name")] = "batch",
+    model: Annotated[
+        Optional[str], Parameter(help="Embedding model (default: embeddings.model)")
+    ] = None,
+    chunk_tokens: Annotated[
+        Optional[int],
+        Parameter(help="Tokens per chunk (default: embeddings.chunk_tokens)"),
+    ] = None,
+    overlap: Annotated[
+        Optional[int],
+        Parameter(help="Tokens repeated between chunks (default: embeddings.overlap)"),
+    ] = None,
+    per_request: Annotated[
+        Optional[int],
+        Parameter(help="Chunks per request (default: embeddings.per_request)"),
+    ] = None,
+    compression: Annotated[
+        Compression, Parameter(help="Compress the batch file (gzip: .gz, zstd: .zst)")
+    ] = "none",
+) -> None:
+    """
+    Make an embeddings batch requests file (`/v1/embeddings`) from texts split into token chunks, and
+    `<batch>-chunks.jsonl` with the source, position and text of every chunk. Send it with
+    `batch openai send`; `batch openai fetch` decodes the vectors into a float32 matrix.
+    """
+    config = CONFIG.get("embeddings") or {}
+    options = {
+        k: config[k] for k in ("encoding_format", "dimensions") if config.get(k)
+    }
+    out.mkdir(parents=True, exist_ok=True)
+    out_file = out / compressed_name(f"{batch_name}-requests.jsonl", compression)
+    requests = embedding_requests(
+        text_sources(in_path),
+        model or config.get("model", "text-embedding-3-small"),
+        chunk_tokens or config.get("chunk_tokens", 512),
+        overlap if overlap is not None else config.get("overlap", 0),
+        per_request or config.get("per_request", 1),
+        options,
+    )
+    count = 0
+    with (
+        open_file(out_file, "w") as f,
+        open(companion_path(out_file, "chunks"), "w") as chunks_file,
+        RunProgress("embed", console=console) as progress,
+    ):
+        for request, chunks in requests:
+            with phase("serialize"):
+                line = dumps(request)
+            with phase("write"):
+                f.write(("\n" if count else "") + line)
+                for chunk in chunks:
+                    chunks_file.write(dumps(chunk) + "\n")
+            count += 1
+            progress.advance(n=len(chunks))
+    console.print(f"Batch file created: {out_file} ({count} requests)")
+
+
+@batch_app.command()
+def expand(
+    results: Annotated[Path, Parameter(help="Batch results file (JSONL)")],
+    fanout: Annotated[Path, Parameter(help="Fan-out map written by --dedup")],
+    out: Annotated[
+        Optional[Path],
+        Parameter(help="Expanded results file, defaults to <results>-expanded.jsonl"),
+    ] = None,
+) -> None:
+    """
+    Copy the results of a deduplicated batch back to every original custom_id.
+    """
+    out = out or results.with_name(f"{Path(strip_compression(results.name)).stem}-expanded.jsonl")
+    count = 0
+    with open_file(results) as f, open(out, "w") as out_f:
+        lines = (loads(line) for line in f if line.strip())
+        for result in expand_results(lines, fanout):
+            out_f.write(dumps(result) + "\n")
+            count += 1
+    console.print(f"Expanded results written: {out} ({count} results)")
+
+# ---------------------------------------------------------------------------------------------------------------------
+@batch_app.command()
+def pack(
+    in_path: Annotated[Path, Parameter(help="Template output directory or store")],
+    out: Annotated[
+        Path, Parameter(help="Packed output store (.jsonl, .jsonl.gz, .jsonl.zst, .sqlite)")
+    ],
+    budget: Annotated[
+        Optional[int], Parameter(help="Input token budget per packed request")
+    ] = None,
+    max_items: Annotated[
+        Optional[int], Parameter(help="Maximum items per packed request")
+    ] = None,
+) -> None:
+    """
+    Pack template records that share everything but their last user message into fewer requests.
+    Run `batch make` on the packed store, and `batch unpack` on the fetched results.
+    """
+    packer = Packer(budget, max_items)
+    with open_store(out.parent, out) as output:
+        for record in packer.pack(read_records(in_path)):
+            with phase("write"):
+                output.write(record)
+    console.print(f"Packed {packer.item_count} items into {packer.count} requests: {out}")
+
+
+@batch_app.command()
+def unpack(
+    results: Annotated[Path, Parameter(help="Batch results file (JSONL)")],
+    packed: Annotated[Path, Parameter(help="Packed store written by `batch pack`")],
+    out: Annotated[
+        Optional[Path],
+        Parameter(help="Per-item output file, defaults to <results>-items.jsonl"),
+    ] = None,
+) -> None:
+    """
+    Split the results of a packed batch back into one validated record per item.
+    """
+    out = out or results.with_name(f"{Path(strip_compression(results.name)).stem}-items.jsonl")
+    stats: Counter = Counter()
+    with open_file(results) as f, open(out, "w") as out_f:
+        lines = (loads(line) for line in f if line.strip())
+        for item in unpack_results(lines, packed, stats):
+            out_f.write(dumps(item) + "\n")
+    console.print(f"Unpacked {stats['ok']} items ({stats['error']} errors) to {out}")
+    if stats["unknown"]:
+        console.print(
+            f"[yellow]{stats['unknown']} results did not match a packed request[/yellow]"
+        )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+@batch_app.command(name="retry")
+def retry_failed(
+    batch_id: Annotated[
+        str, Parameter(help="Batch ID of the finished (or running) batch")
+    ],
+    requests: Annotated[
+        Path, Parameter(help="Batch requests file the batch was sent from")
+    ],
+    provider: Annotated[
+        Literal["openai", "anthropic"], Parameter(help="Batch provider")
+    ] = "openai",
+    out: Annotated[
+        Path, Parameter(help="Output directory for results and retry files")
+    ] = Path("."),
+    batch_name: Annotated[str, Parameter("--batch", help="Batch name")] = "batch",
+    max_rounds: Annotated[int, Parameter(help="Maximum number of retry batches")] = 3,
+    budget: Annotated[
+        Optional[int], Parameter(help="Maximum number of requests resubmitted in total")
+    ] = None,
+    interval: Annotated[float, Parameter(help="Seconds between status checks")] = 30.0,
+) -> None:
+    """
+    Fetch a batch's results, resubmit only the failed or expired requests as a new batch linked to
+    the parent, and repeat until everything succeeded or the retry budget is spent.
+    """
+
+    def report(entry: Dict) -> None:
+        console.print(
+            f"[green]round {entry['round']}[/green] {entry['batch_id']}: {entry['results']} results, "
+            f"{entry['failed']} failed, {entry['missing']} missing"
+        )
+        logger.info(f"retry round: {entry}")
+
+    lineage = asyncio.run(
+        retry_batch(
+            batch_id,
+            requests,
+            provider=provider,
+            out=out,
+            batch_name=batch_name,
+            max_rounds=max_rounds,
+            budget=budget,
+            interval=interval,
+            on_round=report,
+        )
+    )
+    console.print(
+        f"Stopped after {len(lineage)} rounds ({lineage[-1]['stopped']}), "
+        f"lineage: {out / f'{batch_name}-lineage.jsonl'}"
+    )
+
+
+@batch_app.command()
+def hybrid(
+    requests: Annotated[Path, Parameter(help="Batch requests file")],
+    provider: Annotated[
+        Literal["openai", "anthropic"], Parameter(help="Batch provider")
+    ] = "openai",
+    out: Annotated[Path, Parameter(help="Output directory for the merged results")] = Path(
+        "."
+    ),
+    batch_name: Annotated[str, Parameter("--batch", help="Batch name")] = "batch",
+    deadline: Annotated[
+        float, Parameter(help="Seconds from now by which every result is needed")
+    ] = 3600.0,
+    budget: Annotated[
+        Optional[float],
+        Parameter(help="Maximum estimated USD spent on the synchronous path"),
+    ] = None,
+    reserve: Annotated[
+        Optional[float],
+        Parameter(help="Seconds before the deadline at which stragglers move to the synchronous path"),
+    ] = None,
+    concurrency: Annotated[
+        Optional[int], Parameter(help="Concurrent synchronous requests")
+    ] = None,
+    interval: Annotated[float, Parameter(help="Seconds between status checks")] = 30.0,
+) -> None:
+    """
+    Send requests as a batch and, close to the deadline, finish the stragglers with concurrent synchronous
+    calls, merging both into one results file.
+    """
+
+    def progress(done: int, total: int) -> None:
+        console.print(f"[green]batch progress[/green] {done}/{total}")
+
+    report = asyncio.run(
+        run_hybrid(
+            requests,
+            out,
+            provider=provider,
+            batch_name=batch_name,
+            deadline=deadline,
+            budget=budget,
+            reserve=reserve,
+            concurrency=concurrency,
+            interval=interval,
+            on_progress=progress,
+        )
+    )
+    report.print(console)
+    logger.info(f"hybrid run: {report}")
+    console.print(f"Results written: {out / f'{batch_name}-responses.jsonl'}")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+@batch_app.command()
+def index(
+    files: Annotated[List[Path], Parameter(help="JSONL requests or responses files")],
+) -> None:
+    """
+    Build (or rebuild) the `<file>.idx` sidecar index used for lookups by custom_id.
+    """
+    for f in files:
+        with phase("index"):
+            try:
+                sidecar = build_index(f)
+            except ValueError as e:
+                console.print(f"[red]{e}[/red]")
+                continue
+        console.print(f"Index written: {sidecar}")
+
+
+@batch_app.command()
+def inspect(
+    file: Annotated[Path, Parameter(help="JSONL requests or responses file")],
+    custom_id: Annotated[str, Parameter(help="custom_id of the line to show")],
+) -> None:
+    """
+    Show a single request or result by custom_id, building the sidecar index on first use.
+    """
+    with OffsetIndex(file) as idx:
+        line = idx.get(custom_id)
+    if line is None:
+        console.print(f"[red]{custom_id} not found in {file}[/red]")
+        return
+    console.print_json(data=line)
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Commands: utils
@@ -138,24 +532,142 @@ def pdf2text(
     if not out.exists():
         out.mkdir(parents=True)
 
-    for pdf in in_dir.glob("*.pdf"):
-        console.print(f"processing pdf file: {pdf.name}")
-        logging.info(f"extracting text from: {pdf.name}")
-        try:
-            doc = fitz.open(pdf)
-            textfile = out / f"{pdf.stem}.txt"
-            pages = [page for page in doc if start <= page.number <= end]  # type: ignore
-            textfile.write_text(
-                chr(12).join([page.get_text(sort=True) for page in pages])  # type: ignore
-            )
-        except Exception as e:
-            logger.error(f"exception: {type(e)}: {e}")
-            continue
+    pdfs = sorted(in_dir.glob("*.pdf"))
+    with RunProgress("pdf2text", total=len(pdfs), console=console) as progress:
+        for pdf in pdfs:
+            item_log("pdf", "extracting text from: %s", pdf.name)
+            try:
+                with phase("load"):
+                    doc = fitz.open(pdf)
+                textfile = out / f"{pdf.stem}.txt"
+                with phase("extract"):
+                    pages = [page for page in doc if start <= page.number <= end]  # type: ignore
+                    text = chr(12).join([page.get_text(sort=True) for page in pages])  # type: ignore
+                with phase("write"):
+                    textfile.write_text(text)
+            except Exception as e:
+                logger.error(f"exception: {type(e)}: {e}")
+                progress.advance("failed")
+                continue
+            progress.advance()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+@utils_app.command()
+def mock_server(
+    host: Annotated[str, Parameter(help="Host to bind")] = "127.0.0.1",
+    port: Annotated[int, Parameter(help="Port to bind")] = 8000,
+    latency: Annotated[float, Parameter(help="Seconds added to every response")] = 0.0,
+    error_rate: Annotated[float, Parameter(help="Fraction of requests failing with 500")] = 0.0,
+    rate_limit_rate: Annotated[
+        float, Parameter(help="Fraction of requests failing with 429")
+    ] = 0.0,
+    retry_after: Annotated[float, Parameter(help="Retry-After seconds on 429")] = 1.0,
+    item_error_rate: Annotated[
+        float, Parameter(help="Fraction of batch items that fail")
+    ] = 0.0,
+    result_size: Annotated[int, Parameter(help="Characters per generated completion")] = 200,
+    batch_delay: Annotated[
+        float, Parameter(help="Seconds before a batch reports as finished")
+    ] = 0.0,
+    early_rate: Annotated[
+        float,
+        Parameter(help="Fraction of batch items done right away instead of after --batch-delay"),
+    ] = 0.0,
+    stream_delay: Annotated[
+        float, Parameter(help="Seconds between the chunks of streamed responses")
+    ] = 0.0,
+    seed: Annotated[Optional[int], Parameter(help="Random seed")] = None,
+) -> None:
+    """
+    Run a local mock of the OpenAI and Anthropic batch APIs for load and regression testing.
+    """
+    mock_config = MockConfig(
+        latency=latency,
+        error_rate=error_rate,
+        rate_limit_rate=rate_limit_rate,
+        retry_after=retry_after,
+        item_error_rate=item_error_rate,
+        result_size=result_size,
+        batch_delay=batch_delay,
+        early_rate=early_rate,
+        stream_delay=stream_delay,
+        seed=seed,
+    )
+    server = MockProviderServer((host, port), config=mock_config)
+    console.print(f"[green]Mock provider server listening on {server.url}[/green]")
+    console.print(f"  openai base_url:    {server.url}/v1")
+    console.print(f"  anthropic base_url: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Commands: template
 # ---------------------------------------------------------------------------------------------------------------------
+def render_records(t: jinja2.Template, yaml_data: Dict) -> Iterator[Dict]:
+    """Render the template once per combination into records without responses."""
+    for idx, combination in enumerate(extract_combinations(yaml_data)):
+        with phase("render"):
+            rendered = t.render(**combination)
+        with phase("serialize"):
+            chat_params = loads_lenient(rendered)
+        yield {
+            "id": f"{idx+1:05d}",
+            "template_params": combination,
+            "request": chat_params,
+        }
+
+
+async def write_fanout(
+    records: Iterator[Dict],
+    models: List[str],
+    output,
+    telemetry: Telemetry,
+    progress: RunProgress,
+) -> None:
+    async for record in run_fanout(records, models, telemetry):
+        with phase("write"):
+            output.write(record)
+        failed = ", ".join(record["errors"])
+        progress.advance(
+            "failed" if failed else "done", responses=record["responses"].values()
+        )
+        item_log(
+            "executed",
+            "Executed combination %s on %d models%s",
+            record["id"],
+            len(models),
+            f" (failed: {failed})" if failed else "",
+        )
+
+
+async def write_completions(
+    records: Iterator[Dict],
+    output,
+    telemetry: Telemetry,
+    progress: RunProgress,
+) -> None:
+    async for record in run_requests(records, telemetry):
+        if "error" in record:
+            console.print(
+                f"[bold red]Error processing combination {record['id']}: {record['error']}[/bold red]"
+            )
+            logger.error(f"Error processing combination {record['id']}: {record['error']}")
+            with phase("write"):
+                output.write(record)
+            progress.advance("failed")
+            continue
+        with phase("write"):
+            output.write(record)
+        progress.advance(responses=[record["response"]])
+        item_log("executed", "Executed combination %s", record["id"])
+
+
 @app.command()
 def template(
     template: Annotated[Path, Parameter(help="Prompt template")],
@@ -166,12 +678,52 @@ def template(
     execute: Annotated[
         bool, Parameter(help="Run the template and make synchronous API calls")
     ] = False,
+    store: Annotated[
+        Optional[Path],
+        Parameter(
+            help="Single output store (.jsonl, .jsonl.gz, .jsonl.zst, .sqlite) instead of one file per request"
+        ),
+    ] = None,
+    events: Annotated[
+        Optional[Path],
+        Parameter(help="Append per-request telemetry events to this JSONL file"),
+    ] = None,
+    metrics: Annotated[
+        Optional[Path],
+        Parameter(help="Write run metrics to this OpenMetrics/Prometheus textfile"),
+    ] = None,
+    pretty: Annotated[
+        bool,
+        Parameter(help="Indent the per-request JSON files (--no-pretty for large runs)"),
+    ] = True,
+    stream: Annotated[
+        bool,
+        Parameter(help="Stream the responses and record time to first token and tokens/s"),
+    ] = False,
+    partial: Annotated[
+        bool,
+        Parameter(
+            help="With --stream, write the text to out/partial/<id>.txt as it arrives (kept if a stream fails)"
+        ),
+    ] = False,
+    models: Annotated[
+        Optional[List[str]],
+        Parameter(
+            help="Send every rendered request to each of these models (repeatable), with the responses side by side"
+        ),
+    ] = None,
 ) -> None:
     """
     Generate prompts from a template and data file, and optionally make API calls.
     The template should be a Jinja2 template, and the data file should be a YAML file
     containing the parameters for the template.
+    Records are written to `out/<model>/` as one JSON file each, or to a single `--store`.
+    With `--models`, each combination is rendered once and sent to all models concurrently, with a
+    concurrency pool and rate limit per provider. Without `--stream`, single-model requests run
+    concurrently on the same pools and are written in combination order; streamed requests run one by one.
     """
+    if stream and models:
+        raise ValueError("--stream is not supported with --models")
     # validate input parameters
     assert template.is_file(), f"Template file {template} does not exist"
     assert data.is_file(), f"Data file {data} does not exist"
@@ -183,6 +735,7 @@ def template(
         console.print(
             "[bold yellow]Running in execute mode, API calls will be made[/bold yellow]"
         )
+        use_shared_pool()
     else:
         console.print(
             "[bold yellow]Running in dry-run mode, no API calls will be made[/bold yellow]"
@@ -193,53 +746,258 @@ def template(
         loader=jinja2.FileSystemLoader(str(template.parent)),
         undefined=jinja2.StrictUndefined,
     )
-    t = environment.get_template(template.name)
+    # load the template and its parameters
+    with phase("load"):
+        t = environment.get_template(template.name)
+        yaml_data = yaml.safe_load(open(data, "r"))
 
-    # load the template parameters
-    yaml_data = yaml.safe_load(open(data, "r"))
+    # fan each rendered combination out to several models
+    total = combination_count(yaml_data)
+    if models:
+        with (
+            open_store(out, store, pretty) as output,
+            Telemetry(events) as telemetry,
+            RunProgress("template", total=total, console=console) as progress,
+        ):
+            records = render_records(t, yaml_data)
+            if execute:
+                asyncio.run(write_fanout(records, models, output, telemetry, progress))
+            else:
+                for record in records:
+                    with phase("write"):
+                        output.write({**record, "models": models})
+                    progress.advance()
+        if execute:
+            telemetry.print_summary(console)
+        if metrics:
+            telemetry.write_openmetrics(metrics)
+        return
 
-    # extract combinations and render the template for each combination
-    for idx, combination in enumerate(extract_combinations(yaml_data)):
+    partial_dir = out / "partial"
+    if stream and partial:
+        partial_dir.mkdir(exist_ok=True)
 
-        # render the template with the current combination
-        chat_params = json.loads(t.render(**combination), strict=False)
-
-        # create the output file
-        model_name = chat_params.get("model", "unknown_model").replace("/", "_")
-        model_dir = out / model_name
-        model_dir.mkdir(parents=True, exist_ok=True)
-
-        out_file = model_dir / f"{datetime.now().timestamp()}.json"
-        out_file.write_text("")
-        with open(out_file, "a") as f:
-            f.write("\n{\n")
-            f.write('"template_params": ')
-            json.dump(combination, f, indent=2)
-            f.write(",\n")
-            f.write('"request": ')
-            json.dump(chat_params, f, indent=2)
-
-        if not execute:
-            response = None
+    # extract combinations and render the template for each combination
+    with (
+        open_store(out, store, pretty) as output,
+        Telemetry(events) as telemetry,
+        RunProgress("template", total=total, console=console) as progress,
+    ):
+        records = render_records(t, yaml_data)
+        if execute and not stream:
+            asyncio.run(write_completions(records, output, telemetry, progress))
         else:
-            try:
-                response = completion_with_backoff(chat_params, console=console)
-            except Exception as e:
-                console.print(
-                    f"[bold red]Error processing combination {idx+1:04d}: {e}[/bold red]"
-                )
-                logger.error(f"Error processing combination {idx+1:04d}: {e}")
-                continue
+            for idx, record in enumerate(records):
+                if execute:
+                    try:
+                        record["response"] = timed_stream(
+                            record["id"],
+                            record["request"],
+                            telemetry,
+                            partial=(
+                                partial_dir / f"{record['id']}.txt" if partial else None
+                            ),
+                        )
+                    except Exception as e:
+                        console.print(
+                            f"[bold red]Error processing combination {idx+1:04d}: {e}[/bold red]"
+                        )
+                        logger.error(f"Error processing combination {idx+1:04d}: {e}")
+                        record["error"] = str(e)
+                        with phase("write"):
+                            output.write(record)
+                        progress.advance("failed")
+                        continue
+
+                # write the combination, params, and response to the output store
+                with phase("write"):
+                    output.write(record)
+
+                progress.advance(responses=[record["response"]] if execute else ())
+                item_log("executed", "Executed combination %05d", idx + 1)
+
+    if execute:
+        telemetry.print_summary(console)
+    if metrics:
+        telemetry.write_openmetrics(metrics)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Commands: queue
+# ---------------------------------------------------------------------------------------------------------------------
+@queue_app.command(name="init")
+def queue_init(
+    queue: Annotated[Path, Parameter(help="Work queue database to create")],
+    template: Annotated[Path, Parameter(help="Prompt template")],
+    data: Annotated[Path, Parameter(help="Template data")],
+    chunk_size: Annotated[
+        Optional[int], Parameter(help="Combinations per shard")
+    ] = None,
+) -> None:
+    """
+    Split the combinations of a template run into shards in a SQLite work queue, for `queue work`
+    processes on this or other machines sharing the disk.
+    """
+    assert template.is_file(), f"Template file {template} does not exist"
+    assert data.is_file(), f"Data file {data} does not exist"
+    with WorkQueue.create(queue, template, data, chunk_size) as q:
+        console.print(
+            f"Work queue written: {queue} ({q.meta['total']} combinations, {sum(q.counts().values())} shards)"
+        )
+
+
+@queue_app.command(name="work")
+def queue_work(
+    queue: Annotated[Path, Parameter(help="Work queue database")],
+    out: Annotated[
+        Optional[Path],
+        Parameter(help="Directory for the shard files (default: <queue>-shards)"),
+    ] = None,
+    execute: Annotated[
+        bool, Parameter(help="Make synchronous API calls (--no-execute only renders)")
+    ] = True,
+    processes: Annotated[int, Parameter(help="Worker processes on this machine")] = 1,
+    concurrency: Annotated[
+        int, Parameter(help="Concurrent requests per worker")
+    ] = 16,
+    max_shards: Annotated[
+        Optional[int], Parameter(help="Stop after this many shards per worker")
+    ] = None,
+) -> None:
+    """
+    Claim shards from the work queue, render and run them, until the queue is drained.
+    """
+    options = dict(
+        out=out, execute=execute, concurrency=concurrency, max_shards=max_shards
+    )
+    if processes > 1:
+        done = run_workers(queue, processes, **options)
+    else:
+        done = run_worker(queue, **options)
+    console.print(f"[green]{done} shards done[/green]")
+    queue_status(queue)
+
+
+@queue_app.command(name="merge")
+def queue_merge(
+    queue: Annotated[Path, Parameter(help="Work queue database")],
+    store: Annotated[
+        Path, Parameter(help="Output store (.jsonl, .jsonl.gz, .jsonl.zst, .sqlite)")
+    ],
+    partial: Annotated[
+        bool, Parameter(help="Merge the finished shards even if others are not done")
+    ] = False,
+) -> None:
+    """
+    Merge the shard files, in combination order, into a single output store.
+    """
+    count = merge(queue, store, partial=partial)
+    console.print(f"{count} records written: {store}")
 
-            # write the combination, params, and respoonse to the output file
-            with open(out_file, "a") as f:
-                f.write(",\n")
-                f.write('"response": ')
-                json.dump(response, f, indent=2)
 
-        with open(out_file, "a") as f:
-            f.write("\n}\n")
+@queue_app.command(name="status")
+def queue_status(
+    queue: Annotated[Path, Parameter(help="Work queue database")],
+) -> None:
+    """
+    Show the shard counts of a work queue.
+    """
+    with WorkQueue(queue) as q:
+        counts = q.counts()
+    console.print(", ".join(f"{status}: {n}" for status, n in counts.items()))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Commands: analyze
+# ---------------------------------------------------------------------------------------------------------------------
+@app.command()
+def analyze(
+    paths: Annotated[
+        List[str],
+        Parameter(
+            help="Response files, directory stores or glob patterns (template stores, batch results, telemetry events)"
+        ),
+    ],
+    params: Annotated[
+        Optional[Path],
+        Parameter(help="Template store to take the template parameters of batch results from"),
+    ] = None,
+    requests: Annotated[
+        Optional[Path],
+        Parameter(
+            help="Submitted requests file of Anthropic batch results (<batch>-valid.jsonl if invalid lines were dropped), to map their positional custom IDs"
+        ),
+    ] = None,
+    by: Annotated[
+        Optional[List[str]],
+        Parameter(help="Template parameters to break down by (repeatable; default: all)"),
+    ] = None,
+    output: Annotated[
+        Optional[Path], Parameter(help="Also write the tables to this JSON file")
+    ] = None,
+) -> None:
+    """
+    Summarize response sets: finish reasons, token usage and error rates by model, breakdowns by template
+    parameter and, from telemetry event files of synchronous runs, latency percentiles.
+    The files are scanned lazily and in parallel by polars.
+    """
+    with phase("analyze"):
+        try:
+            results = run_analysis(paths, params, by, requests)
+        except ValueError as e:
+            console.print(f"[red]{e}[/red]")
+            return
+    if not results:
+        console.print("[red]No responses found.[/red]")
+        return
+    print_tables(results, console)
+    if output:
+        output.write_text(dumps({name: df.to_dicts() for name, df in results.items()}))
+        console.print(f"Analysis written: {output}")
 
-        message = f"Executed combination {idx+1:05d} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{'-'*60}"
-        console.print(f"[bold green]{message}[/bold green]")
-        logger.info(message)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Commands: extract
+# ---------------------------------------------------------------------------------------------------------------------
+@app.command()
+def extract(
+    paths: Annotated[
+        List[str],
+        Parameter(
+            help="Response files, directory stores or glob patterns (template stores or batch results)"
+        ),
+    ],
+    schema: Annotated[Path, Parameter(help="JSON Schema the response JSON must match")],
+    out: Annotated[Path, Parameter(help="Parquet output file")] = Path(
+        "extracted.parquet"
+    ),
+    rejects: Annotated[
+        Optional[Path],
+        Parameter(
+            help="Rejected responses with the reason (default: <out>-rejects.jsonl)"
+        ),
+    ] = None,
+    processes: Annotated[
+        Optional[int],
+        Parameter(help="Worker processes (default: extract.processes, or one per CPU)"),
+    ] = None,
+) -> None:
+    """
+    Parse the JSON in response texts, validate it against a JSON Schema in parallel worker processes, and
+    write it to a Parquet file with one typed column per top-level schema property. Responses without
+    valid JSON are written to a rejects file.
+    """
+    assert schema.is_file(), f"Schema file {schema} does not exist"
+    json_schema = loads(schema.read_bytes())
+    with RunProgress("extract", console=console) as progress:
+        try:
+            counts = extract_responses(
+                paths, json_schema, out, rejects, processes, progress
+            )
+        except ValueError as e:
+            console.print(f"[red]{e}[/red]")
+            return
+    console.print(
+        f"{counts['extracted']:,} responses extracted: {out}, "
+        f"{counts['rejected']:,} rejected: {rejects or rejects_path(out)}"
+    )
@@ -0,0 +1,188 @@
+import asyncio
+import importlib.util
+import weakref
+from functools import lru_cache
+from typing import Dict, Optional
+
+import httpx
+import litellm
+import openai
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+from llm_batch import CONFIG, logger
+
+# async pools are bound to the event loop they were created on, so they are shared per loop
+_async_pools: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]"
+) = weakref.WeakKeyDictionary()
+# per-call litellm clients over those pools, by provider
+_litellm_clients: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, object]]"
+) = weakref.WeakKeyDictionary()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Connection pools
+# ---------------------------------------------------------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def http2_available() -> bool:
+    """Whether httpx can speak HTTP/2, i.e. the h2 package is installed. Warns once when it is not."""
+    if importlib.util.find_spec("h2") is None:
+        logger.warning(
+            'http.http2 is set but the h2 package is not installed, using HTTP/1.1: pip install "llm-batch[http2]"'
+        )
+        return False
+    return True
+
+
+def http_options() -> Dict:
+    """
+    httpx client settings from the `http` section of config.yml.
+    """
+    http = CONFIG.get("http") or {}
+    return {
+        "timeout": httpx.Timeout(
+            http.get("timeout", 600.0), connect=http.get("connect_timeout", 10.0)
+        ),
+        "limits": httpx.Limits(
+            max_connections=http.get("max_connections", 100),
+            max_keepalive_connections=http.get("max_keepalive_connections", 20),
+            keepalive_expiry=http.get("keepalive_expiry", 30.0),
+        ),
+        "http2": bool(http.get("http2", False)) and http2_available(),
+        "follow_redirects": True,
+    }
+
+
+@lru_cache(maxsize=None)
+def http_client() -> httpx.Client:
+    """
+    Process-wide connection pool shared by every sync provider client, so repeated commands and
+    shards reuse keep-alive connections instead of repeating TLS handshakes.
+    """
+    return httpx.Client(**http_options())
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """
+    Connection pool shared by every async provider client on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_pools:
+        _async_pools[loop] = httpx.AsyncClient(**http_options())
+    return _async_pools[loop]
+
+
+async def aclose_clients() -> None:
+    """
+    Close the connection pool of the running event loop. Only the pool created here is closed; clients
+    litellm creates for itself are left to litellm. Call it before `asyncio.run` returns, or the pool's
+    connections leak until exit.
+    """
+    loop = asyncio.get_running_loop()
+    _litellm_clients.pop(loop, None)
+    pool = _async_pools.pop(loop, None)
+    if pool is not None:
+        await pool.aclose()
+
+
+class PooledHandler(AsyncHTTPHandler):
+    """litellm's async HTTP handler, sending over an existing connection pool instead of its own."""
+
+    def __init__(self, pool: httpx.AsyncClient):
+        self.pool = pool
+        super().__init__(timeout=pool.timeout)
+
+    def create_client(self, **kwargs) -> httpx.AsyncClient:
+        return self.pool
+
+
+def litellm_client(provider: str) -> Optional[object]:
+    """
+    Client to pass to `litellm.acompletion(client=...)` so the call uses the running loop's shared pool:
+    an AsyncOpenAI client for OpenAI and an HTTP handler for Anthropic. None for other providers, and for
+    OpenAI without an API key in the environment, which litellm then handles itself.
+    """
+    clients = _litellm_clients.setdefault(asyncio.get_running_loop(), {})
+    if provider not in clients:
+        if provider == "openai":
+            try:
+                clients[provider] = openai.AsyncOpenAI(
+                    **client_options("openai", asynchronous=True)
+                )
+            except openai.OpenAIError:
+                return None
+        elif provider == "anthropic":
+            clients[provider] = PooledHandler(async_http_client())
+        else:
+            return None
+    return clients[provider]
+
+
+def use_shared_pool() -> None:
+    """
+    Route litellm's OpenAI-compatible sync calls through the shared connection pool.
+    """
+    litellm.client_session = http_client()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def base_url(provider: str) -> Optional[str]:
+    """
+    Return the configured base URL for a provider, or None to use the SDK default.
+    """
+    return (CONFIG.get("providers", {}).get(provider) or {}).get("base_url")
+
+
+def client_options(provider: str, asynchronous: bool = False) -> Dict:
+    """
+    Keyword arguments for the provider SDK client constructors: the shared connection pool, the
+    configured timeout and, if set, the base URL.
+    """
+    options = {
+        "http_client": async_http_client() if asynchronous else http_client(),
+        "timeout": http_options()["timeout"],
+    }
+    url = base_url(provider)
+    if url:
+        options["base_url"] = url
+    return options
+
+
+def provider_of(model: str) -> str:
+    """The litellm provider of a model name, e.g. `openai` for `gpt-4o` and `anthropic` for `claude-...`."""
+    try:
+        _, provider, _, _ = litellm.get_llm_provider(model)
+    except Exception:
+        return model.split("/", 1)[0] if "/" in model else "unknown"
+    return provider
+
+
+def completion_options(chat_params: Dict) -> Dict:
+    """
+    Extra keyword arguments for `litellm.completion`, routing the call to the configured base URL.
+    """
+    if "api_base" in chat_params:
+        return {}
+    try:
+        _, provider, _, _ = litellm.get_llm_provider(chat_params.get("model", ""))
+    except Exception:
+        return {}
+    url = base_url(provider)
+    return {"api_base": url} if url else {}
+
+
+def acompletion_options(chat_params: Dict) -> Dict:
+    """
+    `completion_options` for `litellm.acompletion`, plus a client over the running loop's shared pool
+    unless the request brings its own endpoint or key.
+    """
+    options = completion_options(chat_params)
+    if "api_base" in chat_params or "api_key" in chat_params:
+        return options
+    client = litellm_client(provider_of(chat_params.get("model", "")))
+    if client is not None:
+        options["client"] = client
+    return options
@@ -0,0 +1,113 @@
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional
+
+from llm_batch.fileio import companion_path, open_file
+from llm_batch.serialization import dumps, loads
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def request_key(body: Dict) -> bytes:
+    """
+    Digest of the canonical JSON form of a request body: key order and whitespace do not matter.
+    """
+    canonical = dumps(body, sort_keys=True)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+def fanout_path(batch_file: Path) -> Path:
+    """
+    Fan-out map written next to a batch requests file: `batch-requests.jsonl` -> `batch-fanout.jsonl`.
+    """
+    return companion_path(batch_file, "fanout")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class Deduplicator:
+    """
+    Drops batch requests whose body was already seen, in one streaming pass.
+    A 16-byte digest and the kept custom_id are held per unique body, so memory is O(unique requests);
+    request bodies themselves are never kept. Every dropped request is written to the
+    fan-out map as `{"custom_id", "canonical", "index"}`, where `canonical` is the custom_id that was kept
+    and `index` its position in the deduplicated file, so results can be expanded back afterwards.
+    """
+
+    def __init__(self, fanout: Optional[IO[str]] = None):
+        self.fanout = fanout
+        self.seen: Dict[bytes, int] = {}
+        self.canonical: List[str] = []
+        self.total = 0
+
+    @property
+    def unique_count(self) -> int:
+        return len(self.canonical)
+
+    @property
+    def duplicate_count(self) -> int:
+        return self.total - self.unique_count
+
+    def unique(self, requests: Iterable[Dict]) -> Iterator[Dict]:
+        for request in requests:
+            self.total += 1
+            key = request_key(request["body"])
+            index = self.seen.get(key)
+            if index is None:
+                self.seen[key] = len(self.canonical)
+                self.canonical.append(request["custom_id"])
+                yield request
+            elif self.fanout is not None:
+                entry = {
+                    "custom_id": request["custom_id"],
+                    "canonical": self.canonical[index],
+                    "index": index,
+                }
+                self.fanout.write(dumps(entry) + "\n")
+
+
+def dedup_batch_file(
+    batch_file: Path, out_file: Path, fanout_file: Optional[Path] = None
+) -> Deduplicator:
+    """
+    Write the unique requests of `batch_file` to `out_file` and the fan-out map to `fanout_file`, by default
+    next to `batch_file`.
+    """
+    with (
+        open_file(batch_file) as f,
+        open_file(out_file, "w") as out,
+        open(fanout_file or fanout_path(batch_file), "w") as fanout,
+    ):
+        dedup = Deduplicator(fanout)
+        lines = (loads(line) for line in f if line.strip())
+        for request in dedup.unique(lines):
+            out.write(dumps(request) + "\n")
+    return dedup
+
+
+def read_fanout(fanout: Path) -> Dict[str, List[str]]:
+    """
+    Map each submitted custom_id to the duplicate custom_ids that share its result. Anthropic results are
+    keyed by position (`id-<index>`), so both forms are included.
+    """
+    copies: Dict[str, List[str]] = defaultdict(list)
+    with open(fanout) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = loads(line)
+            copies[entry["canonical"]].append(entry["custom_id"])
+            copies[f"id-{entry['index']}"].append(entry["custom_id"])
+    return copies
+
+
+def expand_results(results: Iterable[Dict], fanout: Path) -> Iterator[Dict]:
+    """
+    Yield every batch result, followed by a copy for each duplicate request that was dropped in its favour.
+    """
+    copies = read_fanout(fanout)
+    for result in results:
+        yield result
+        for custom_id in copies.get(result.get("custom_id", ""), []):
+            yield {**result, "custom_id": custom_id}
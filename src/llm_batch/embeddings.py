@@ -0,0 +1,227 @@
+import base64
+import struct
+import sys
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import litellm
+
+try:
+    import numpy
+except ImportError:  # optional: pip install "llm-batch[embeddings]"
+    numpy = None
+
+from llm_batch.api import batch_request
+from llm_batch.records import EMBEDDINGS_URL
+from llm_batch.serialization import dumps
+from llm_batch.store import read_records
+
+# bytes reserved for the .npy header, rewritten with the final shape when the matrix is closed
+NPY_HEADER = 128
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Requests
+# ---------------------------------------------------------------------------------------------------------------------
+def text_sources(in_path: Path) -> Iterator[Tuple[str, str]]:
+    """
+    `(source, text)` pairs of a text file, of the `.txt` files of a directory (as written by `pdf2text`),
+    or of the records of a JSONL file with `id` and `text` fields.
+    """
+    if in_path.is_dir():
+        for f in sorted(in_path.glob("*.txt")):
+            yield f.stem, f.read_text()
+    elif in_path.name.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst")):
+        for record in read_records(in_path):
+            yield str(record["id"]), record["text"]
+    else:
+        yield in_path.stem, in_path.read_text()
+
+
+def split_text(text: str, max_tokens: int, overlap: int = 0) -> List[str]:
+    """
+    Split a text into chunks of at most `max_tokens` tokens (cl100k_base, the encoding of OpenAI's
+    embedding models), each repeating the last `overlap` tokens of the one before.
+    """
+    if not 0 <= overlap < max_tokens:
+        raise ValueError("overlap must be at least 0 and less than max_tokens")
+    tokens = litellm.encoding.encode(text, disallowed_special=())
+    if not tokens:
+        return []
+    step = max_tokens - overlap
+    return [
+        litellm.encoding.decode(tokens[start : start + max_tokens])
+        for start in range(0, max(len(tokens) - overlap, 1), step)
+    ]
+
+
+def embedding_requests(
+    sources: Iterable[Tuple[str, str]],
+    model: str,
+    max_tokens: int,
+    overlap: int = 0,
+    per_request: int = 1,
+    options: Optional[Dict] = None,
+) -> Iterator[Tuple[Dict, List[Dict]]]:
+    """
+    Embeddings batch request lines with `per_request` text chunks each, and the chunks they hold as
+    `{"custom_id", "index", "source", "chunk", "text"}`; `index` is the chunk's position in the request
+    input. The custom ID of a request is `id_<source>-<chunk>` of its first chunk.
+    """
+    pending: List[Dict] = []
+
+    def request() -> Tuple[Dict, List[Dict]]:
+        custom_id = f"id_{pending[0]['source']}-{pending[0]['chunk']:05d}"
+        chunks = [
+            {"custom_id": custom_id, "index": i, **chunk}
+            for i, chunk in enumerate(pending)
+        ]
+        texts = [c["text"] for c in chunks]
+        body = {
+            "model": model,
+            "input": texts if per_request > 1 else texts[0],
+            **(options or {}),
+        }
+        return batch_request(custom_id, body, EMBEDDINGS_URL), chunks
+
+    for source, text in sources:
+        for idx, chunk in enumerate(split_text(text, max_tokens, overlap)):
+            pending.append({"source": source, "chunk": idx, "text": chunk})
+            if len(pending) >= per_request:
+                yield request()
+                pending = []
+    if pending:
+        yield request()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Vectors
+# ---------------------------------------------------------------------------------------------------------------------
+def vector_bytes(embedding) -> bytes:
+    """
+    Little-endian float32 bytes of an embedding: decoded from base64 (`encoding_format: base64`, already
+    float32) or packed from a list of floats.
+    """
+    if isinstance(embedding, str):
+        return base64.b64decode(embedding)
+    vector = array("f", embedding)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector.tobytes()
+
+
+def npy_header(rows: int, dim: int) -> bytes:
+    header = f"{{'descr': '<f4', 'fortran_order': False, 'shape': ({rows}, {dim}), }}"
+    header = header.ljust(NPY_HEADER - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
+
+
+class NpyWriter:
+    """
+    A float32 matrix streamed row by row to a `.npy` file, which `numpy.load(path, mmap_mode="r")` maps
+    without reading it. Needs no numpy: the header is written with the final shape on close.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.rows = 0
+        self.dim: Optional[int] = None
+        self._f = open(path, "wb")
+        self._f.write(b" " * NPY_HEADER)
+
+    def write(self, vector: bytes) -> None:
+        dim = len(vector) // 4
+        if self.dim is None:
+            self.dim = dim
+        elif dim != self.dim:
+            raise ValueError(
+                f"embedding of dimension {dim} in a matrix of dimension {self.dim}"
+            )
+        self._f.write(vector)
+        self.rows += 1
+
+    def close(self) -> None:
+        self._f.seek(0)
+        self._f.write(npy_header(self.rows, self.dim or 0))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def embeddings_paths(out: Path, batch_name: str) -> Tuple[Path, Path, Path]:
+    """The matrix, ID index and failed results of a fetched embeddings batch."""
+    return (
+        out / f"{batch_name}-embeddings.npy",
+        out / f"{batch_name}-embeddings-ids.jsonl",
+        out / f"{batch_name}-errors.jsonl",
+    )
+
+
+class EmbeddingsWriter:
+    """
+    Decodes OpenAI batch result lines of an embeddings batch one at a time into the float32 `matrix`, with
+    one `{"custom_id", "index"}` line per row in `ids`. Failed result lines are written to the open `errors`
+    file. `counts` holds the `rows`, `results` and `failed` results written so far.
+    """
+
+    def __init__(self, matrix: Path, ids: Path, errors: IO[str]):
+        self.errors = errors
+        self.counts: Counter = Counter(rows=0, results=0, failed=0)
+        self._writer = NpyWriter(matrix)
+        self._index = open(ids, "w")
+
+    def write(self, result: Dict) -> None:
+        self.counts["results"] += 1
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            self.errors.write(dumps(result) + "\n")
+            self.counts["failed"] += 1
+            return
+        data = (response.get("body") or {}).get("data") or []
+        for item in sorted(data, key=lambda d: d.get("index", 0)):
+            self._writer.write(vector_bytes(item["embedding"]))
+            row = {"custom_id": result["custom_id"], "index": item.get("index", 0)}
+            self._index.write(dumps(row) + "\n")
+            self.counts["rows"] += 1
+
+    def close(self) -> None:
+        self._writer.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_embeddings(
+    results: Iterable[Dict], matrix: Path, ids: Path, errors: IO[str]
+) -> Counter:
+    """
+    Decode the embeddings of OpenAI batch result lines into the float32 `matrix` (see `EmbeddingsWriter`).
+    Returns the counts of `rows`, `results` and `failed` results.
+    """
+    with EmbeddingsWriter(matrix, ids, errors) as writer:
+        for result in results:
+            writer.write(result)
+    return writer.counts
+
+
+def load_embeddings(matrix: Path, ids: Optional[Path] = None):
+    """
+    The memory-mapped matrix of a fetched embeddings batch and its ID index (from `ids`, by default the
+    `-ids.jsonl` file next to it). Needs numpy.
+    """
+    if numpy is None:
+        raise ImportError(
+            'Loading embeddings needs numpy: pip install "llm-batch[embeddings]"'
+        )
+    ids = ids or matrix.with_name(f"{matrix.stem}-ids.jsonl")
+    return numpy.load(matrix, mmap_mode="r"), list(read_records(ids))
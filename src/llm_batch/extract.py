@@ -0,0 +1,362 @@
+import os
+import re
+import shutil
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import polars as pl
+
+try:
+    import jsonschema
+except ImportError:  # optional: pip install "llm-batch[extract]"
+    jsonschema = None
+
+from llm_batch import CONFIG
+from llm_batch.analyze import detect, expand
+from llm_batch.fileio import open_file
+from llm_batch.progress import RunProgress
+from llm_batch.serialization import JSONDecodeError, dumps, loads
+from llm_batch.store import read_records
+
+# id, model, response text (None when there is none) and the request error, if any
+Item = Tuple[str, Optional[str], Optional[str], Optional[str]]
+# id, model, parsed data (None if rejected), reject reason and response text
+Extracted = Tuple[str, Optional[str], Any, Optional[str], Optional[str]]
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+DTYPES = {
+    "string": pl.Utf8,
+    "integer": pl.Int64,
+    "number": pl.Float64,
+    "boolean": pl.Boolean,
+}
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Response content
+# ---------------------------------------------------------------------------------------------------------------------
+def message_text(content: Any) -> Optional[str]:
+    """Text of a message `content`: a string, or the text parts (blocks) of a list."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = [
+            p.get("text") or ""
+            for p in content
+            if isinstance(p, dict) and p.get("type") == "text"
+        ]
+        return "".join(parts) if parts else None
+    return None
+
+
+def chat_text(response: Optional[Dict]) -> Optional[str]:
+    choices = (response or {}).get("choices") or [{}]
+    return message_text((choices[0].get("message") or {}).get("content"))
+
+
+def items(path: Path) -> Iterator[Item]:
+    """
+    The response text of each record of a template store (one item per model for multi-model records),
+    OpenAI batch results file or Anthropic batch results file.
+    """
+    kind = None
+    for record in read_records(path):
+        kind = kind or detect(record)
+        if kind == "template":
+            model = (record.get("request") or {}).get("model")
+            text = chat_text(record.get("response"))
+            yield record["id"], model, text, record.get("error")
+        elif kind == "fanout":
+            errors = record.get("errors") or {}
+            for model in record.get("models") or []:
+                response = (record.get("responses") or {}).get(model)
+                yield record["id"], model, chat_text(response), errors.get(model)
+        elif kind == "openai":
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            error = None
+            if response.get("status_code") != 200:
+                error = dumps(record.get("error") or body.get("error"))
+            yield record["custom_id"], body.get("model"), chat_text(body), error
+        elif kind == "anthropic":
+            result = record.get("result") or {}
+            message = result.get("message") or {}
+            error = None
+            if result.get("type") != "succeeded":
+                error = dumps(result.get("error") or result.get("type"))
+            text = message_text(message.get("content"))
+            yield record["custom_id"], message.get("model"), text, error
+        else:
+            raise ValueError(f"{path} holds telemetry events, not responses")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Parsing and validation
+# ---------------------------------------------------------------------------------------------------------------------
+def parse_json(text: str) -> Any:
+    """
+    Parse JSON from a response: the whole text, the first ```json fenced block, or else the span from the
+    first `{` or `[` to the last `}` or `]`. Raises `JSONDecodeError`.
+    """
+    text = text.strip()
+    fenced = FENCE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    try:
+        return loads(text)
+    except JSONDecodeError:
+        starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+        end = max(text.rfind("}"), text.rfind("]"))
+        if not starts or end < min(starts):
+            raise
+        return loads(text[min(starts) : end + 1])
+
+
+def make_validator(schema: Dict):
+    if jsonschema is None:
+        raise ImportError(
+            'Schema validation needs jsonschema: pip install "llm-batch[extract]"'
+        )
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def schema_error(validator, data: Any) -> Optional[str]:
+    """The most relevant validation error of `data`, with its location, or None if it is valid."""
+    error = jsonschema.exceptions.best_match(validator.iter_errors(data))
+    if error is None:
+        return None
+    location = "/".join(str(p) for p in error.absolute_path) or "(root)"
+    return f"{error.message} at {location}"
+
+
+_validator = None
+
+
+def init_worker(schema: Dict) -> None:
+    """Compile the schema once per worker process."""
+    global _validator
+    _validator = make_validator(schema)
+
+
+def extract_chunk(chunk: List[Item]) -> List[Extracted]:
+    """Parse and validate a chunk of items in a worker."""
+    results = []
+    for id, model, text, error in chunk:
+        if error is not None or text is None:
+            reason = f"request failed: {error}" if error is not None else "no text"
+            results.append((id, model, None, reason, text))
+            continue
+        try:
+            data = parse_json(text)
+        except JSONDecodeError as e:
+            results.append((id, model, None, f"invalid JSON: {e}", text))
+            continue
+        reason = schema_error(_validator, data)
+        results.append((id, model, None if reason else data, reason, text))
+    return results
+
+
+def map_chunks(
+    chunks: Iterable[List[Item]], schema: Dict, processes: int, window: int
+) -> Iterator[List[Extracted]]:
+    """
+    `extract_chunk` over the chunks in order, in `processes` worker processes (in this process when it
+    is 1). At most `window` chunks are in flight, so the input is streamed.
+    """
+    if processes <= 1:
+        init_worker(schema)
+        for chunk in chunks:
+            yield extract_chunk(chunk)
+        return
+    with ProcessPoolExecutor(
+        processes, initializer=init_worker, initargs=(schema,)
+    ) as pool:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(extract_chunk, chunk))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Typed output
+# ---------------------------------------------------------------------------------------------------------------------
+def polars_dtype(schema: Dict) -> pl.DataType:
+    """
+    Column type of a JSON Schema: scalars map to their types, arrays to lists and objects with properties
+    to structs; anything else (unions, free-form objects) is kept as JSON text.
+    """
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kinds = [k for k in kind if k != "null"]
+        kind = kinds[0] if len(kinds) == 1 else None
+    if kind in DTYPES:
+        return DTYPES[kind]
+    if kind == "array" and isinstance(schema.get("items"), dict):
+        return pl.List(polars_dtype(schema["items"]))
+    if kind == "object" and schema.get("properties"):
+        return pl.Struct({k: polars_dtype(v) for k, v in schema["properties"].items()})
+    return pl.Utf8
+
+
+def is_single_column(schema: Dict) -> bool:
+    """True if the data of `schema` is written to a single `data` column, not one column per property."""
+    return not isinstance(polars_dtype(schema), pl.Struct)
+
+
+def output_schema(schema: Dict) -> Dict[str, pl.DataType]:
+    """
+    Columns of the Parquet output: `id`, `model` and the top-level properties, or a single `data` column.
+    Properties named `id` or `model` would overwrite those columns, so they raise `ValueError`.
+    """
+    dtype = polars_dtype(schema)
+    columns = {"id": pl.Utf8, "model": pl.Utf8}
+    if is_single_column(schema):
+        return {**columns, "data": dtype}
+    clashes = [f.name for f in dtype.fields if f.name in columns]
+    if clashes:
+        raise ValueError(
+            f"Schema properties {', '.join(clashes)} clash with the id and model columns of the output; "
+            "rename them or nest them in an object"
+        )
+    return {**columns, **{f.name: f.dtype for f in dtype.fields}}
+
+
+def column_value(value: Any, dtype: pl.DataType) -> Any:
+    """`value` shaped for a column of `dtype`; values kept as text are serialized to JSON."""
+    if value is None:
+        return None
+    if isinstance(dtype, pl.Struct):
+        if not isinstance(value, dict):
+            return None
+        return {f.name: column_value(value.get(f.name), f.dtype) for f in dtype.fields}
+    if isinstance(dtype, pl.List):
+        if not isinstance(value, list):
+            return None
+        return [column_value(v, dtype.inner) for v in value]
+    if dtype == pl.Utf8 and not isinstance(value, str):
+        return dumps(value)
+    return value
+
+
+class ParquetWriter:
+    """
+    Writes rows to a Parquet file with the given schema. Rows are buffered and written as parts of
+    `row_group_size` rows, which are merged into the output (streaming) when the writer is closed. With
+    `single_column` the data goes to the `data` column as a whole, else its keys fill the other columns.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        schema: Dict[str, pl.DataType],
+        row_group_size: int = 100_000,
+        single_column: bool = False,
+    ):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.single_column = single_column
+        self.parts_dir = path.with_name(f"{path.name}.parts")
+        self.parts: List[Path] = []
+        self._rows: List[Dict] = []
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        self.parts_dir.mkdir(parents=True)
+
+    def write(self, id: str, model: Optional[str], data: Any) -> None:
+        if self.single_column:
+            data = {"data": data}
+        row = {"id": id, "model": model}
+        for name, dtype in list(self.schema.items())[2:]:
+            row[name] = column_value(data.get(name), dtype)
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows and self.parts:
+            return
+        part = self.parts_dir / f"part-{len(self.parts):06d}.parquet"
+        pl.DataFrame(
+            self._rows, schema=self.schema, orient="row", strict=False
+        ).write_parquet(part)
+        self.parts.append(part)
+        self._rows = []
+
+    def close(self) -> None:
+        self.flush()
+        pl.scan_parquet(self.parts).sink_parquet(self.path)
+        shutil.rmtree(self.parts_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if exc[0] is None:
+            self.close()
+        else:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+def rejects_path(out: Path) -> Path:
+    """Rejected responses next to the output: `results.parquet` -> `results-rejects.jsonl`."""
+    return out.with_name(f"{out.stem}-rejects.jsonl")
+
+
+def extract(
+    patterns: Iterable[str],
+    schema: Dict,
+    out: Path,
+    rejects: Optional[Path] = None,
+    processes: Optional[int] = None,
+    progress: Optional[RunProgress] = None,
+) -> Counter:
+    """
+    Parse the JSON in the responses matching `patterns`, validate it against `schema` in worker processes
+    and write the valid data to the Parquet file `out` and the rest, with the reason, to `rejects`.
+    Returns the counts of `extracted` and `rejected` responses.
+    """
+    config = CONFIG.get("extract") or {}
+    processes = processes or config.get("processes") or os.cpu_count() or 1
+    chunk_size = config.get("chunk_size", 500)
+    make_validator(schema)  # fail on an invalid schema before starting the workers
+
+    def chunks() -> Iterator[List[Item]]:
+        for path in expand(patterns):
+            stream = items(path)
+            while chunk := list(islice(stream, chunk_size)):
+                yield chunk
+
+    counts: Counter = Counter(extracted=0, rejected=0)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with (
+        ParquetWriter(
+            out,
+            output_schema(schema),
+            config.get("row_group_size", 100_000),
+            is_single_column(schema),
+        ) as writer,
+        open_file(rejects or rejects_path(out), "w") as rejected,
+    ):
+        for results in map_chunks(chunks(), schema, processes, 2 * processes):
+            for id, model, data, reason, text in results:
+                if reason is None:
+                    writer.write(id, model, data)
+                else:
+                    reject = {"id": id, "model": model, "reason": reason, "text": text}
+                    rejected.write(dumps(reject) + "\n")
+            n = sum(reason is None for *_, reason, _ in results)
+            counts["extracted"] += n
+            counts["rejected"] += len(results) - n
+            if progress:
+                progress.advance(n=n)
+                progress.advance("failed", n=len(results) - n)
+    return counts
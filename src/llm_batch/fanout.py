@@ -0,0 +1,238 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional
+
+import litellm
+from tenacity import AsyncRetrying
+
+from llm_batch import CONFIG
+from llm_batch.backoff import circuit, retry_options
+from llm_batch.clients import (
+    aclose_clients,
+    acompletion_options,
+    provider_of,
+)
+from llm_batch.telemetry import RequestEvent, Telemetry, event_from_response
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Provider pools
+# ---------------------------------------------------------------------------------------------------------------------
+class RateLimiter:
+    """
+    Spaces requests at least `1 / rate` seconds apart; no limit when `rate` is empty.
+    """
+
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        wait = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ProviderPool:
+    """
+    Concurrency limit and rate limiter of one provider. Limits come from the `fanout` config section,
+    where `limits.<provider>` overrides the defaults.
+    """
+
+    def __init__(self, provider: str):
+        config = CONFIG.get("fanout") or {}
+        limits = {
+            "concurrency": config.get("concurrency", 8),
+            "rate": config.get("rate"),
+            **((config.get("limits") or {}).get(provider) or {}),
+        }
+        self.provider = provider
+        self.semaphore = asyncio.Semaphore(limits["concurrency"])
+        self.limiter = RateLimiter(limits["rate"])
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        await self.limiter.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.semaphore.release()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+async def call_model(
+    body: Dict,
+    event_id: str,
+    pools: Dict[str, ProviderPool],
+    telemetry: Optional[Telemetry] = None,
+    attempts: Optional[int] = None,
+) -> Dict:
+    """
+    Send one chat request through its provider's pool (created in `pools` on first use), retrying with the
+    configured backoff, and record it as a telemetry event. Returns `{"response"}` or `{"error"}`.
+    """
+    model = body.get("model", "")
+    provider = provider_of(model)
+    if provider not in pools:
+        pools[provider] = ProviderPool(provider)
+    pool = pools[provider]
+    start = time.perf_counter()
+    retries = 0
+    try:
+        async for attempt in AsyncRetrying(**retry_options(attempts)):
+            with attempt, circuit(model):
+                retries = attempt.retry_state.attempt_number - 1
+                # a slot per attempt, so backoff sleeps do not hold the provider's pool
+                async with pool:
+                    response = (
+                        await litellm.acompletion(**body, **acompletion_options(body))
+                    ).json()  # type: ignore
+    except Exception as e:
+        if telemetry:
+            telemetry.record(
+                RequestEvent(
+                    id=event_id,
+                    source="template",
+                    status="error",
+                    model=model,
+                    latency=time.perf_counter() - start,
+                    retries=retries,
+                    error=str(e),
+                )
+            )
+        return {"error": str(e)}
+    if telemetry:
+        telemetry.record(
+            event_from_response(
+                event_id,
+                "template",
+                response,
+                latency=time.perf_counter() - start,
+                retries=retries,
+            )
+        )
+    return {"response": response}
+
+
+async def run_requests(
+    records: Iterable[Dict],
+    telemetry: Optional[Telemetry] = None,
+    attempts: Optional[int] = None,
+    window: int = 64,
+) -> AsyncIterator[Dict]:
+    """
+    Send the rendered request of each template record to its own model, with up to `window` calls in
+    flight and the `ProviderPool` limits of `run_fanout`. Yields each record in input order, with its
+    `response` or `error`; a slow call holds back the records behind it, but not their calls.
+    """
+    pools: Dict[str, ProviderPool] = {}
+    pending: Deque = deque()
+
+    def finish(record: Dict, result: Dict) -> Dict:
+        record.update(result)
+        return record
+
+    try:
+        for record in records:
+            call = call_model(record["request"], record["id"], pools, telemetry, attempts)
+            pending.append((record, asyncio.create_task(call)))
+            if len(pending) >= window:
+                record, task = pending.popleft()
+                yield finish(record, await task)
+        while pending:
+            record, task = pending.popleft()
+            yield finish(record, await task)
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await aclose_clients()
+
+
+async def run_fanout(
+    records: Iterable[Dict],
+    models: List[str],
+    telemetry: Optional[Telemetry] = None,
+    attempts: Optional[int] = None,
+    window: int = 64,
+) -> AsyncIterator[Dict]:
+    """
+    Send the rendered request of each template record to every model in `models`. Each provider has its own
+    queue of calls, with at most `window` of them in flight, and its own `ProviderPool`, so a slow provider
+    does not hold back a fast one. Yields each record, once all its models are done, with `models` and the
+    side-by-side `responses` and `errors` keyed by model.
+    """
+    models = list(dict.fromkeys(models))
+    pools: Dict[str, ProviderPool] = {}
+
+    async def call(record: Dict, model: str) -> Dict:
+        body = {**record["request"], "model": model}
+        return await call_model(
+            body, f"{record['id']}:{model}", pools, telemetry, attempts
+        )
+
+    queues = {provider: asyncio.Queue(window) for provider in map(provider_of, models)}
+    # per-model results of the records still waiting for some of their models, keyed by id(record)
+    joining: Dict[int, Dict[str, Dict]] = {}
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def join(record: Dict, model: str) -> None:
+        results = joining[id(record)]
+        results[model] = await call(record, model)
+        if len(results) == len(models):
+            del joining[id(record)]
+            record["models"] = models
+            record["responses"] = {
+                m: results[m]["response"] for m in models if "response" in results[m]
+            }
+            record["errors"] = {
+                m: results[m]["error"] for m in models if "error" in results[m]
+            }
+            finished.put_nowait(record)
+
+    async def produce() -> None:
+        for record in records:
+            joining[id(record)] = {}
+            for model in models:
+                await queues[provider_of(model)].put((record, model))
+        for queue in queues.values():
+            await queue.put(None)
+
+    async def dispatch(queue: asyncio.Queue) -> None:
+        in_flight: set = set()
+        try:
+            while (item := await queue.get()) is not None:
+                in_flight.add(asyncio.create_task(join(*item)))
+                if len(in_flight) >= window:
+                    _, in_flight = await asyncio.wait(
+                        in_flight, return_when=asyncio.FIRST_COMPLETED
+                    )
+            await asyncio.gather(*in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def feed() -> None:
+        tasks = [
+            asyncio.create_task(produce()),
+            *(asyncio.create_task(dispatch(queue)) for queue in queues.values()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            finished.put_nowait(None)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while (record := await finished.get()) is not None:
+            yield record
+        await feeder
+    finally:
+        feeder.cancel()
+        await aclose_clients()
@@ -0,0 +1,132 @@
+import gzip
+import io
+import os
+from pathlib import Path
+from typing import IO, Literal
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install "llm-batch[zstd]"
+    zstandard = None
+
+Compression = Literal["none", "gzip", "zstd"]
+
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+CHUNK_SIZE = 1 << 20
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def compression_of(path: Path) -> Compression:
+    """Compression of a file, detected from its extension."""
+    for compression, suffix in SUFFIXES.items():
+        if path.name.endswith(suffix):
+            return compression  # type: ignore
+    return "none"
+
+
+def strip_compression(name: str) -> str:
+    """File name without its compression suffix: `batch-requests.jsonl.gz` -> `batch-requests.jsonl`."""
+    for suffix in SUFFIXES.values():
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def compressed_name(name: str, compression: Compression = "none") -> str:
+    """File name with the suffix of `compression` added."""
+    return name + SUFFIXES.get(compression, "")
+
+
+def companion_path(batch_file: Path, kind: str) -> Path:
+    """
+    File written next to a batch requests file: `batch-requests.jsonl.gz` -> `batch-<kind>.jsonl`.
+    """
+    name = strip_compression(batch_file.name)
+    for suffix in ("-requests.jsonl", ".jsonl"):
+        if name.endswith(suffix):
+            return batch_file.with_name(f"{name[: -len(suffix)]}-{kind}.jsonl")
+    return batch_file.with_name(f"{name}-{kind}.jsonl")
+
+
+def open_file(path: Path, mode: str = "r") -> IO:
+    """
+    Open a plain, gzip (`.gz`) or zstd (`.zst`) file. Compressed files are read and written as streams,
+    so the whole file is never held in memory. Text mode uses UTF-8. zstd needs the optional `zstandard`
+    package.
+    """
+    compression = compression_of(Path(path))
+    binary = "b" in mode
+    text_kwargs = {} if binary else {"encoding": "utf-8"}
+    if compression == "none":
+        return open(path, mode, **text_kwargs)
+    mode = mode if binary or "t" in mode else mode + "t"
+    if compression == "gzip":
+        return gzip.open(path, mode, **text_kwargs)
+    if zstandard is None:
+        raise ImportError(
+            f"Reading or writing {path} needs the zstandard package: pip install 'llm-batch[zstd]'"
+        )
+    return zstandard.open(path, mode, **text_kwargs)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class DecompressedUpload(io.RawIOBase):
+    """
+    Read-only stream of a compressed file's decompressed bytes, for uploads. Its length is measured with one
+    decompression pass up front, so the HTTP client can send a Content-Length and stream the body in chunks
+    without holding the file in memory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.name = strip_compression(Path(path).name)
+        with open_file(path, "rb") as f:
+            self.length = sum(
+                len(chunk) for chunk in iter(lambda: f.read(CHUNK_SIZE), b"")
+            )
+        self._f = open_file(path, "rb")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        # only the moves an HTTP client makes: measure the length, and rewind before (re)sending
+        if whence == os.SEEK_END and offset == 0:
+            return self.length
+        if whence == os.SEEK_SET and offset == self._position:
+            return self._position
+        if whence == os.SEEK_SET and offset == 0:
+            self._f.close()
+            self._f = open_file(self.path, "rb")
+            self._position = 0
+            return 0
+        raise io.UnsupportedOperation("DecompressedUpload can only rewind")
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+def upload_file(path: Path) -> IO[bytes]:
+    """
+    File object for uploading a batch file: the file itself, or its decompressed stream when compressed.
+    """
+    if compression_of(path) == "none":
+        return open(path, "rb")
+    return DecompressedUpload(path)
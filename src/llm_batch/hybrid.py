@@ -0,0 +1,225 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import litellm
+from rich.console import Console
+from rich.table import Table
+
+from llm_batch import CONFIG, api, logger
+from llm_batch.caching import content_text, count_tokens
+from llm_batch.clients import aclose_clients
+from llm_batch.index import OffsetIndex
+from llm_batch.retry import is_failed
+from llm_batch.serialization import dumps, loads
+
+# output tokens assumed for requests without max_tokens when estimating the cost of the synchronous path
+DEFAULT_OUTPUT_TOKENS = 1024
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def estimate_cost(body: Dict) -> float:
+    """
+    Upper estimate of the synchronous (list price) cost of a request in USD: prompt tokens plus
+    `max_tokens` of output. Models without a known price count as free.
+    """
+    prompt = "".join(content_text(m.get("content")) for m in body.get("messages", []))
+    try:
+        prompt_cost, output_cost = litellm.cost_per_token(
+            model=body.get("model", ""),
+            prompt_tokens=count_tokens(prompt),
+            completion_tokens=body.get("max_tokens") or DEFAULT_OUTPUT_TOKENS,
+        )
+    except Exception:
+        return 0.0
+    return prompt_cost + output_cost
+
+
+def sync_line(result: Dict) -> Dict:
+    """
+    Result of `api.execute` as an OpenAI batch result line, so both paths merge into one file.
+    """
+    line: Dict = {"custom_id": result["custom_id"], "source": "sync"}
+    if "response" in result:
+        line["response"] = {"status_code": 200, "body": result["response"]}
+        line["error"] = None
+    else:
+        line["response"] = None
+        line["error"] = {"message": result["error"]}
+    return line
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class HybridReport:
+    batch_id: str
+    total: int = 0
+    # results taken from the batch
+    batch_done: int = 0
+    # stragglers and batch failures answered on the synchronous path
+    sync_done: int = 0
+    # still failing after the synchronous path
+    failed: int = 0
+    # stragglers left for a later batch because of the budget
+    deferred: int = 0
+    sync_cost: float = 0.0
+    cancelled: bool = False
+    elapsed: float = 0.0
+
+    def print(self, console: Console) -> None:
+        table = Table(title=f"Hybrid run {self.batch_id}", show_header=False)
+        table.add_row("requests", f"{self.total:,}")
+        table.add_row(
+            "batch", f"{self.batch_done:,}" + (" (cancelled)" if self.cancelled else "")
+        )
+        table.add_row("synchronous", f"{self.sync_done:,} (~${self.sync_cost:.4f})")
+        table.add_row("failed", f"{self.failed:,}")
+        table.add_row("deferred (budget)", f"{self.deferred:,}")
+        table.add_row("elapsed", f"{self.elapsed:.1f}s")
+        console.print(table)
+
+
+async def run_hybrid(
+    requests_file: Path,
+    out: Path,
+    provider: api.Provider = "openai",
+    batch_name: str = "batch",
+    deadline: float = 3600.0,
+    budget: Optional[float] = None,
+    reserve: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    interval: float = 30.0,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> HybridReport:
+    """
+    Submit a requests file as a batch and, `reserve` seconds before the `deadline` (seconds from now), cancel
+    it and run whatever is not done, or failed, through the concurrent synchronous path. Results of both
+    paths are merged into `<batch_name>-responses.jsonl` under the original custom_ids, tagged with their
+    `source`. The synchronous path only takes stragglers while their estimated cost fits in `budget` (USD);
+    the others are written to `<batch_name>-deferred-requests.jsonl` for a later batch. The synchronous path
+    starts while the cancelled batch winds down and skips requests the batch has answered once its partial
+    results are in; a batch still cancelling at the deadline contributes no results. The connection pools
+    of the event loop are closed at the end.
+    """
+    hybrid = CONFIG.get("hybrid") or {}
+    reserve = hybrid.get("reserve", 900.0) if reserve is None else reserve
+    concurrency = concurrency or hybrid.get("concurrency", 16)
+    start = time.monotonic()
+    cutover = start + max(deadline - reserve, 0.0)
+
+    try:
+        batch_id = await api.send(
+            requests_file, provider=provider, description="hybrid run"
+        )
+        report = HybridReport(batch_id)
+        while True:
+            finished, done, total = await api.progress(batch_id, provider)
+            if on_progress:
+                on_progress(done, total)
+            if finished:
+                break
+            now = time.monotonic()
+            if now >= cutover:
+                await api.cancel(batch_id, provider)
+                report.cancelled = True
+                break
+            await asyncio.sleep(min(interval, cutover - now))
+
+        out.mkdir(parents=True, exist_ok=True)
+        deferred_file = out / f"{batch_name}-deferred-requests.jsonl"
+        with (
+            OffsetIndex(requests_file) as index,
+            open(out / f"{batch_name}-responses.jsonl", "w") as f,
+        ):
+            report.total = len(index)
+            # set once a position has a result from either path; the first one wins
+            answered = bytearray(len(index))
+            failures: Dict[int, Dict] = {}
+            deferred: List[int] = []
+
+            async def take_batch_results() -> None:
+                if report.cancelled:
+                    # a cancelled batch can take a while to wind down; wait only until the deadline
+                    try:
+                        await api.poll(
+                            batch_id,
+                            provider=provider,
+                            interval=min(interval, 1.0),
+                            timeout=max(0.0, start + deadline - time.monotonic()),
+                        )
+                    except TimeoutError:
+                        logger.warning(
+                            f"batch {batch_id} is still cancelling at the deadline, its results are not used"
+                        )
+                        return
+                async for result in api.fetch(batch_id, provider=provider):
+                    position = index.position(result.get("custom_id", ""))
+                    if position is None or is_failed(result) or answered[position]:
+                        continue
+                    result["custom_id"] = loads(index.line(position))["custom_id"]
+                    result["source"] = "batch"
+                    f.write(dumps(result) + "\n")
+                    answered[position] = 1
+                    report.batch_done += 1
+
+            def stragglers() -> Iterator[Dict]:
+                # lazy, so requests the batch answers while the cancel winds down are skipped
+                for position in range(len(index)):
+                    if answered[position]:
+                        continue
+                    request = loads(index.line(position))
+                    cost = estimate_cost(request["body"])
+                    if budget is not None and report.sync_cost + cost > budget:
+                        deferred.append(position)
+                        continue
+                    report.sync_cost += cost
+                    yield request
+
+            batch_results = asyncio.create_task(take_batch_results())
+            try:
+                if not report.cancelled:
+                    # a finished batch: only its failed requests go synchronous
+                    await batch_results
+                else:
+                    # most cancels end within a poll or two; give the batch that long before paying list price
+                    remaining = start + deadline - time.monotonic()
+                    await asyncio.wait(
+                        {batch_results}, timeout=max(0.0, min(interval, remaining))
+                    )
+                async for result in api.execute(
+                    stragglers(), concurrency=concurrency, attempts=3
+                ):
+                    position = index.position(result["custom_id"])
+                    if position is None or answered[position]:
+                        continue
+                    line = sync_line(result)
+                    if line["error"]:
+                        failures[position] = line
+                        continue
+                    f.write(dumps(line) + "\n")
+                    answered[position] = 1
+                    report.sync_done += 1
+                await batch_results
+            finally:
+                batch_results.cancel()
+
+            # failures and deferrals only count if the batch did not answer them in the meantime
+            for position, line in sorted(failures.items()):
+                if not answered[position]:
+                    f.write(dumps(line) + "\n")
+                    report.failed += 1
+            with open(deferred_file, "wb") as deferred_f:
+                for position in deferred:
+                    if not answered[position]:
+                        deferred_f.write(index.line(position))
+                        report.deferred += 1
+        if not report.deferred:
+            deferred_file.unlink()
+        report.elapsed = time.monotonic() - start
+        return report
+    finally:
+        await aclose_clients()
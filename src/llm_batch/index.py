@@ -0,0 +1,208 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Dict, Optional
+
+from llm_batch.fileio import compression_of, open_file, strip_compression
+from llm_batch.serialization import loads
+
+ANTHROPIC_ID = re.compile(r"id-(\d+)")
+
+
+def key_pattern(key: str) -> "re.Pattern[bytes]":
+    """First `"<key>": "<string>"` pair of a raw JSON line."""
+    return re.compile(b'"' + re.escape(key.encode()) + rb'"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+CUSTOM_ID = key_pattern("custom_id")
+
+# Sidecar layout: the header; one entry per line in file order; the key count; then the keys, sorted.
+# header: magic, data file size, data file mtime_ns, line count
+# entry:  byte offset, line length without the newline
+# key:    32-bit custom_id hash << 32 | line position
+MAGIC = b"LLMBIDX1"
+HEADER = struct.Struct("<8sQQQ")
+ENTRY = struct.Struct("<QI")
+KEY = struct.Struct("<Q")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def index_path(path: Path, key: str = "custom_id") -> Path:
+    """Sidecar of `path`: `<file>.idx` for custom_id lookups, `<file>.<key>.idx` for another key."""
+    return path.with_name(path.name + (".idx" if key == "custom_id" else f".{key}.idx"))
+
+
+def line_custom_id(
+    line: bytes, pattern: "re.Pattern[bytes]" = CUSTOM_ID
+) -> Optional[str]:
+    """
+    custom_id (or the key of `pattern`) of a request or result line. Batch lines put custom_id before the
+    (large) body, so the first match is the top-level key and the line never has to be fully parsed.
+    """
+    match = pattern.search(line)
+    if match is None:
+        return None
+    value = match.group(1)
+    return json.loads(b'"' + value + b'"') if b"\\" in value else value.decode()
+
+
+def id_hash(custom_id: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(custom_id.encode(), digest_size=4).digest(), "little"
+    )
+
+
+def build_index(path: Path, key: str = "custom_id") -> Path:
+    """
+    Write the sidecar index of a JSONL requests or responses file to `<file>.idx` in one streaming pass;
+    with another `key` (e.g. the `id` of template store records) to `<file>.<key>.idx`. Offsets are into
+    the file's bytes, so compressed files are rejected.
+    """
+    if compression_of(path) != "none":
+        raise ValueError(
+            f"{path} is compressed: a sidecar index needs a plain JSONL file, decompress it first"
+        )
+    entries = array("Q")
+    lengths = array("I")
+    keys = array("Q")
+    pattern = key_pattern(key)
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            content = line.rstrip(b"\r\n")
+            if content.strip():
+                custom_id = line_custom_id(content, pattern)
+                position = len(entries)
+                entries.append(offset)
+                lengths.append(len(content))
+                if custom_id is not None:
+                    keys.append(id_hash(custom_id) << 32 | position)
+            offset += len(line)
+    keys = array("Q", sorted(keys))
+
+    stat = os.stat(path)
+    sidecar = index_path(path, key)
+    tmp = sidecar.with_name(sidecar.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, len(entries)))
+        for start in range(0, len(entries), 65536):
+            chunk = zip(entries[start : start + 65536], lengths[start : start + 65536])
+            f.write(b"".join(ENTRY.pack(o, n) for o, n in chunk))
+        f.write(KEY.pack(len(keys)))
+        f.write(keys.tobytes())
+    tmp.replace(sidecar)
+    return sidecar
+
+
+def is_current(path: Path, key: str = "custom_id") -> bool:
+    """True if the sidecar index of `path` exists and matches the file's size and modification time."""
+    sidecar = index_path(path, key)
+    if not sidecar.exists():
+        return False
+    with open(sidecar, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return False
+    magic, size, mtime_ns, _ = HEADER.unpack(header)
+    stat = os.stat(path)
+    return magic == MAGIC and size == stat.st_size and mtime_ns == stat.st_mtime_ns
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class OffsetIndex:
+    """
+    Random access to single lines of a batch requests or responses file through its sidecar index
+    (built, or rebuilt when stale, on first use). Both files are memory-mapped, so a lookup is a binary
+    search over the sorted id hashes plus one slice; lines are found by custom_id or, for Anthropic
+    results, by position (`id-<n>`). With another `key`, lines are found by that top-level string key.
+    A gzip or zstd file is decompressed to a temporary plain copy, which is indexed instead and removed
+    on close.
+    """
+
+    def __init__(self, path: Path, key: str = "custom_id"):
+        self.path = path
+        self.key = key
+        self._pattern = key_pattern(key)
+        self._tmp = None
+        if compression_of(path) != "none":
+            self._tmp = tempfile.TemporaryDirectory()
+            path = Path(self._tmp.name) / strip_compression(path.name)
+            with open_file(self.path, "rb") as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        if not is_current(path, key):
+            build_index(path, key)
+        self._files = [open(path, "rb"), open(index_path(path, key), "rb")]
+        self._data = (
+            mmap.mmap(self._files[0].fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.getsize(path)
+            else b""
+        )
+        self._index = mmap.mmap(self._files[1].fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, self.count = HEADER.unpack_from(self._index, 0)
+        self._keys_start = HEADER.size + self.count * ENTRY.size + KEY.size
+        (self._key_count,) = KEY.unpack_from(self._index, self._keys_start - KEY.size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, position: int):
+        return ENTRY.unpack_from(self._index, HEADER.size + position * ENTRY.size)
+
+    def _key(self, i: int) -> int:
+        return KEY.unpack_from(self._index, self._keys_start + i * KEY.size)[0]
+
+    def position(self, custom_id: str) -> Optional[int]:
+        h = id_hash(custom_id)
+        lo, hi = 0, self._key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) >> 32 < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        # equal hashes are rare; check each candidate's custom_id
+        while lo < self._key_count and self._key(lo) >> 32 == h:
+            position = self._key(lo) & 0xFFFFFFFF
+            if line_custom_id(self._raw(position), self._pattern) == custom_id:
+                return position
+            lo += 1
+        match = ANTHROPIC_ID.fullmatch(custom_id) if self.key == "custom_id" else None
+        if match and int(match.group(1)) < self.count:
+            return int(match.group(1))
+        return None
+
+    def _raw(self, position: int) -> bytes:
+        offset, length = self._entry(position)
+        return self._data[offset : offset + length]
+
+    def line(self, position: int) -> bytes:
+        """Raw line at `position`, newline included."""
+        return self._raw(position) + b"\n"
+
+    def get(self, custom_id: str) -> Optional[Dict]:
+        position = self.position(custom_id)
+        return None if position is None else loads(self._raw(position))
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._index.close()
+        for f in self._files:
+            f.close()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,109 @@
+import atexit
+import itertools
+import logging
+import logging.config
+import os
+import queue
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Union
+
+# one background listener per logger whose handlers were moved behind a queue
+listeners: List[QueueListener] = []
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Queued logging
+# ---------------------------------------------------------------------------------------------------------------------
+def queue_handlers(names: List[Optional[str]]) -> None:
+    """
+    Replace the handlers of the named loggers (None for the root logger) with a `QueueHandler`. The original
+    handlers are served by a `QueueListener` thread, so logging calls only enqueue the record and never wait
+    on file or terminal I/O.
+    """
+    for name in names:
+        log = logging.getLogger(name)
+        handlers = [h for h in log.handlers if not isinstance(h, QueueHandler)]
+        if not handlers:
+            continue
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        for handler in handlers:
+            log.removeHandler(handler)
+        log.addHandler(QueueHandler(records))
+        listener = QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        listeners.append(listener)
+
+
+def stop_listeners() -> None:
+    """Flush the queues and stop the listener threads."""
+    while listeners:
+        listeners.pop().stop()
+
+
+def _restart_listeners() -> None:
+    # a forked child inherits the queues but not the listener threads
+    for idx, listener in enumerate(listeners):
+        listeners[idx] = QueueListener(
+            listener.queue, *listener.handlers, respect_handler_level=True
+        )
+        listeners[idx].start()
+
+
+def setup_logging(config: Dict) -> None:
+    """
+    Configure logging from the `logging` section and, unless `logging_options.queue` is off, move the
+    configured handlers behind queues.
+    """
+    logging.config.dictConfig(config["logging"])
+    if (config.get("logging_options") or {}).get("queue", True):
+        stop_listeners()
+        queue_handlers([None, *(config["logging"].get("loggers") or {})])
+
+
+atexit.register(stop_listeners)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Per-item messages
+# ---------------------------------------------------------------------------------------------------------------------
+class ItemLog:
+    """
+    Per-item messages of hot loops. They are logged at `logging_options.item_level`, and only the first
+    of every `logging_options.sample_every` messages of a kind; arguments are formatted only for messages
+    that are logged.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        level: Optional[Union[int, str]] = None,
+        sample_every: Optional[int] = None,
+        config: Optional[Dict] = None,
+    ):
+        options = (config or {}).get("logging_options") or {}
+        level = level if level is not None else options.get("item_level", "INFO")
+        self.logger = logger
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.sample_every = max(sample_every or options.get("sample_every", 1), 1)
+        self._counts: Dict[str, itertools.count] = defaultdict(
+            lambda: itertools.count(1)
+        )
+
+    def __call__(self, kind: str, msg: str, *args) -> None:
+        if not self.logger.isEnabledFor(self.level):
+            return
+        n = next(self._counts[kind])
+        if self.sample_every == 1:
+            self.logger.log(self.level, msg, *args)
+        elif n % self.sample_every == 1:
+            self.logger.log(
+                self.level,
+                msg + " (%s #%d, 1 in %d logged)",
+                *args,
+                kind,
+                n,
+                self.sample_every,
+            )
@@ -0,0 +1,670 @@
+import base64
+import random
+import struct
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from llm_batch.serialization import dumps, loads
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# A local stand-in for the OpenAI files/batches/chat/embeddings endpoints and the Anthropic messages/message-batches endpoints.
+# Point the clients at it with `providers.openai.base_url: http://127.0.0.1:<port>/v1` and
+# `providers.anthropic.base_url: http://127.0.0.1:<port>` in config.yml (or OPENAI_BASE_URL / ANTHROPIC_BASE_URL).
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class MockConfig:
+    latency: float = 0.0  # seconds added to every HTTP response
+    error_rate: float = 0.0  # fraction of HTTP requests answered with a 500
+    rate_limit_rate: float = 0.0  # fraction of HTTP requests answered with a 429
+    retry_after: float = 1.0  # Retry-After seconds sent with 429s
+    requests_limit: int = 10_000  # advertised in the rate-limit headers
+    item_error_rate: float = 0.0  # fraction of batch items that fail
+    result_size: int = 200  # characters of generated completion text
+    batch_delay: float = 0.0  # seconds before a batch reports as finished
+    early_rate: float = 0.0  # fraction of batch items done right away rather than after batch_delay
+    cancel_delay: float = 0.0  # seconds a cancelled batch stays cancelling before it ends
+    stream_chunk_size: int = 20  # characters of completion text per streamed chunk
+    stream_delay: float = 0.0  # seconds between streamed chunks
+    embedding_dim: int = 8  # dimensions of generated embeddings
+    seed: Optional[int] = None
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def _iso(ts: float) -> str:
+    return (
+        datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+    )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class MockProviderServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the uploaded files and batches in memory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 0), config: MockConfig = None):  # type: ignore
+        super().__init__(address, MockHandler)
+        self.config = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.request_count = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockProviderServer":
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -----------------------------------------------------------------------------------------------------------------
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.random.random() < rate
+
+    def completion_text(self) -> str:
+        words = "lorem ipsum dolor sit amet consectetur adipiscing elit".split()
+        text = ""
+        while len(text) < self.config.result_size:
+            text += words[len(text) % len(words)] + " "
+        return text[: self.config.result_size]
+
+    def chat_completion(self, body: Dict) -> Dict:
+        content = self.completion_text()
+        prompt_tokens = len(dumps(body.get("messages", []))) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": _now(),
+            "model": body.get("model", "mock-model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embeddings(self, body: Dict) -> Dict:
+        """Embeddings of the input texts, the same vector for the same text; base64 with `encoding_format`."""
+        texts = body.get("input", "")
+        texts = [texts] if isinstance(texts, str) else texts
+        data = []
+        for idx, text in enumerate(texts):
+            rng = random.Random(text)
+            vector = [rng.uniform(-1, 1) for _ in range(self.config.embedding_dim)]
+            if body.get("encoding_format") == "base64":
+                packed = struct.pack(f"<{len(vector)}f", *vector)
+                embedding = base64.b64encode(packed).decode()
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": idx, "embedding": embedding})
+        prompt_tokens = sum(len(t) for t in texts) // 4
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "mock-model"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    def message(self, params: Dict) -> Dict:
+        content = self.completion_text()
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model", "mock-model"),
+            "content": [{"type": "text", "text": content}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": len(dumps(params.get("messages", []))) // 4,
+                "output_tokens": len(content) // 4,
+            },
+        }
+
+    def chat_completion_events(self, body: Dict) -> Iterator[Tuple[Optional[str], Dict]]:
+        """The completion as OpenAI `chat.completion.chunk` server-sent events."""
+        completion = self.chat_completion(body)
+        content = completion["choices"][0]["message"]["content"]
+        size = self.config.stream_chunk_size
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+            return {
+                "id": completion["id"],
+                "object": "chat.completion.chunk",
+                "created": completion["created"],
+                "model": completion["model"],
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+
+        yield None, chunk({"role": "assistant", "content": ""})
+        for i in range(0, len(content), size):
+            yield None, chunk({"content": content[i : i + size]})
+        yield None, chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield None, {**chunk({}), "choices": [], "usage": completion["usage"]}
+
+    def message_events(self, params: Dict) -> Iterator[Tuple[Optional[str], Dict]]:
+        """The message as Anthropic streaming events."""
+        message = self.message(params)
+        text = message["content"][0]["text"]
+        size = self.config.stream_chunk_size
+        yield "message_start", {
+            "type": "message_start",
+            "message": {
+                **message,
+                "content": [],
+                "stop_reason": None,
+                "usage": {**message["usage"], "output_tokens": 1},
+            },
+        }
+        yield "content_block_start", {
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        }
+        for i in range(0, len(text), size):
+            yield "content_block_delta", {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": text[i : i + size]},
+            }
+        yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+        yield "message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]},
+        }
+        yield "message_stop", {"type": "message_stop"}
+
+    def batch_finished(self, batch: Dict) -> bool:
+        cancelled_at = batch.get("_cancelled_at")
+        if cancelled_at is not None:
+            return time.time() - cancelled_at >= self.config.cancel_delay
+        return time.time() - batch["_created"] >= self.config.batch_delay
+
+    def done_times(self, count: int, created: float) -> List[float]:
+        """When each batch item is done: right away for `early_rate` of them, else after `batch_delay`."""
+        done_at = created + self.config.batch_delay
+        if not self.config.early_rate:
+            return [done_at] * count
+        return [
+            created if self.roll(self.config.early_rate) else done_at
+            for _ in range(count)
+        ]
+
+    def items_done(self, batch: Dict) -> List[bool]:
+        cancelled_at = batch.get("_cancelled_at")
+        now = time.time() if cancelled_at is None else cancelled_at
+        return [done_at <= now for done_at in batch["_done_at"]]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class MockHandler(BaseHTTPRequestHandler):
+    server: MockProviderServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:  # silence the default stderr logging
+        pass
+
+    # -----------------------------------------------------------------------------------------------------------------
+    def do_GET(self) -> None:
+        self.dispatch("GET")
+
+    def do_POST(self) -> None:
+        self.dispatch("POST")
+
+    def dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        with self.server.lock:
+            self.server.request_count += 1
+        config = self.server.config
+        if config.latency:
+            time.sleep(config.latency)
+        if self.server.roll(config.rate_limit_rate):
+            return self.send_error_json(429, "rate_limit_error", "Rate limit exceeded")
+        if self.server.roll(config.error_rate):
+            return self.send_error_json(500, "api_error", "Internal server error")
+
+        parts = [p for p in url.path.split("/") if p]
+        route = self.route(method, parts)
+        if route is None:
+            return self.send_error_json(
+                404, "not_found_error", f"No route for {method} {url.path}"
+            )
+        try:
+            route()
+        except (KeyError, ValueError) as e:
+            self.send_error_json(
+                400, "invalid_request_error", f"{type(e).__name__}: {e}"
+            )
+
+    def route(self, method: str, parts: List[str]):
+        match method, parts:
+            case "POST", ["v1", "files"]:
+                return self.openai_create_file
+            case "GET", ["v1", "files", file_id, "content"]:
+                return lambda: self.openai_file_content(file_id)
+            case "POST", ["v1", "batches"]:
+                return self.openai_create_batch
+            case "GET", ["v1", "batches"]:
+                return self.openai_list_batches
+            case "GET", ["v1", "batches", batch_id]:
+                return lambda: self.openai_retrieve_batch(batch_id)
+            case "POST", ["v1", "batches", batch_id, "cancel"]:
+                return lambda: self.openai_cancel_batch(batch_id)
+            case "POST", ["v1", "chat", "completions"]:
+                return self.openai_chat_completion
+            case "POST", ["v1", "embeddings"]:
+                return self.openai_embeddings
+            case "POST", ["v1", "messages"]:
+                return self.anthropic_message
+            case "POST", ["v1", "messages", "batches"]:
+                return self.anthropic_create_batch
+            case "GET", ["v1", "messages", "batches"]:
+                return self.anthropic_list_batches
+            case "GET", ["v1", "messages", "batches", batch_id]:
+                return lambda: self.anthropic_retrieve_batch(batch_id)
+            case "GET", ["v1", "messages", "batches", batch_id, "results"]:
+                return lambda: self.anthropic_results(batch_id)
+            case "POST", ["v1", "messages", "batches", batch_id, "cancel"]:
+                return lambda: self.anthropic_cancel_batch(batch_id)
+        return None
+
+    # -----------------------------------------------------------------------------------------------------------------
+    def rate_limit_headers(self) -> Dict[str, str]:
+        limit = self.server.config.requests_limit
+        remaining = max(limit - self.server.request_count, 0)
+        return {
+            "x-ratelimit-limit-requests": str(limit),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": "60s",
+            "anthropic-ratelimit-requests-limit": str(limit),
+            "anthropic-ratelimit-requests-remaining": str(remaining),
+            "anthropic-ratelimit-requests-reset": _iso(time.time() + 60),
+        }
+
+    def send_bytes(self, status: int, payload: bytes, content_type: str, headers: Dict = None) -> None:  # type: ignore
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-request-id", f"req_{uuid.uuid4().hex}")
+        for key, value in {**self.rate_limit_headers(), **(headers or {})}.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, obj: Dict, status: int = 200) -> None:
+        self.send_bytes(status, dumps(obj).encode(), "application/json")
+
+    def send_error_json(self, status: int, error_type: str, message: str) -> None:
+        headers = {}
+        if status == 429:
+            headers["retry-after"] = str(self.server.config.retry_after)
+        payload = {"type": "error", "error": {"type": error_type, "message": message}}
+        self.send_bytes(
+            status, dumps(payload).encode(), "application/json", headers
+        )
+
+    def send_events(self, events: Iterator[Tuple[Optional[str], Dict]], done: bool = False) -> None:
+        """Stream server-sent events, `stream_delay` apart, then close the connection."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.send_header("x-request-id", f"req_{uuid.uuid4().hex}")
+        for key, value in self.rate_limit_headers().items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.close_connection = True
+        for idx, (event, data) in enumerate(events):
+            if idx and self.server.config.stream_delay:
+                time.sleep(self.server.config.stream_delay)
+            prefix = f"event: {event}\n" if event else ""
+            self.wfile.write(f"{prefix}data: {dumps(data)}\n\n".encode())
+            self.wfile.flush()
+        if done:
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def send_page(self, items: List[Dict], after_key: str) -> None:
+        limit = int(self.query.get("limit", 20))
+        after = self.query.get(after_key)
+        start = 0
+        if after is not None:
+            start = next(
+                (i + 1 for i, item in enumerate(items) if item["id"] == after),
+                len(items),
+            )
+        page = items[start : start + limit]
+        self.send_json(
+            {
+                "object": "list",
+                "data": page,
+                "has_more": start + limit < len(items),
+                "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None,
+            }
+        )
+
+    # -----------------------------------------------------------------------------------------------------------------
+    # OpenAI
+    # -----------------------------------------------------------------------------------------------------------------
+    def openai_chat_completion(self) -> None:
+        body = loads(self.body)
+        if body.get("stream"):
+            return self.send_events(self.server.chat_completion_events(body), done=True)
+        self.send_json(self.server.chat_completion(body))
+
+    def openai_embeddings(self) -> None:
+        self.send_json(self.server.embeddings(loads(self.body)))
+
+    def openai_create_file(self) -> None:
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self.body
+        )
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in message.iter_parts()
+        }
+        upload = fields["file"]
+        content = upload.get_payload(decode=True)
+        file_obj = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": _now(),
+            "filename": upload.get_filename(),
+            "purpose": fields["purpose"].get_payload(decode=True).decode(),
+            "status": "processed",
+        }
+        with self.server.lock:
+            self.server.files[file_obj["id"]] = {"meta": file_obj, "content": content}
+        self.send_json(file_obj)
+
+    def openai_file_content(self, file_id: str) -> None:
+        content = self.server.files[file_id]["content"]
+        self.send_bytes(200, content, "application/octet-stream")
+
+    def openai_create_batch(self) -> None:
+        params = loads(self.body)
+        lines = (
+            self.server.files[params["input_file_id"]]["content"].decode().splitlines()
+        )
+        items = []
+        for line in filter(str.strip, lines):
+            request = loads(line)
+            item = {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "error": None,
+            }
+            if self.server.roll(self.server.config.item_error_rate):
+                body = {
+                    "error": {"message": "Mock item failure", "type": "server_error"}
+                }
+                item["response"] = {
+                    "status_code": 500,
+                    "request_id": uuid.uuid4().hex,
+                    "body": body,
+                }
+            else:
+                if request.get("url") == "/v1/embeddings":
+                    body = self.server.embeddings(request["body"])
+                else:
+                    body = self.server.chat_completion(request["body"])
+                item["response"] = {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": body,
+                }
+            items.append(item)
+
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": params["endpoint"],
+            "errors": None,
+            "input_file_id": params["input_file_id"],
+            "completion_window": params.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": _now(),
+            "metadata": params.get("metadata"),
+            "request_counts": {"total": len(items), "completed": 0, "failed": 0},
+            "_created": time.time(),
+            "_items": items,
+        }
+        batch["_done_at"] = self.server.done_times(len(items), batch["_created"])
+        with self.server.lock:
+            self.server.batches[batch["id"]] = batch
+        self.send_json(self.openai_batch_view(batch))
+
+    def openai_results(self, batch: Dict) -> Dict:
+        """Output and error files of the items done so far, created once the batch is finished."""
+        if "_files" not in batch:
+            done = self.server.items_done(batch)
+            items = [item for item, ok in zip(batch["_items"], done) if ok]
+            outputs = [i for i in items if i["response"]["status_code"] == 200]
+            errors = [i for i in items if i["response"]["status_code"] != 200]
+            batch["_files"] = {}
+            for kind, kind_items in (("output", outputs), ("error", errors)):
+                if kind_items:
+                    file_id = f"file-{uuid.uuid4().hex}"
+                    content = "".join(dumps(i) + "\n" for i in kind_items).encode()
+                    self.server.files[file_id] = {
+                        "meta": {"id": file_id},
+                        "content": content,
+                    }
+                    batch["_files"][f"{kind}_file_id"] = file_id
+            batch["_counts"] = {
+                "total": len(batch["_items"]),
+                "completed": len(outputs),
+                "failed": len(errors),
+            }
+        return batch["_files"]
+
+    def openai_batch_view(self, batch: Dict) -> Dict:
+        view = {k: v for k, v in batch.items() if not k.startswith("_")}
+        if self.server.batch_finished(batch):
+            with self.server.lock:
+                files = self.openai_results(batch)
+            cancelled = batch.get("_cancelled_at") is not None
+            view.update(
+                status="cancelled" if cancelled else "completed",
+                completed_at=None if cancelled else _now(),
+                cancelled_at=int(batch["_cancelled_at"]) if cancelled else None,
+                request_counts=batch["_counts"],
+                **files,
+            )
+        else:
+            done = sum(self.server.items_done(batch))
+            if batch.get("_cancelled_at") is not None:
+                view["status"] = "cancelling"
+            view["request_counts"] = {
+                "total": len(batch["_items"]),
+                "completed": done,
+                "failed": 0,
+            }
+        return view
+
+    def openai_retrieve_batch(self, batch_id: str) -> None:
+        self.send_json(self.openai_batch_view(self.server.batches[batch_id]))
+
+    def openai_cancel_batch(self, batch_id: str) -> None:
+        batch = self.server.batches[batch_id]
+        if batch.get("_cancelled_at") is None and not self.server.batch_finished(batch):
+            batch["_cancelled_at"] = time.time()
+        view = self.openai_batch_view(batch)
+        if view["status"] == "cancelled":
+            view["status"] = "cancelling"
+        self.send_json(view)
+
+    def openai_list_batches(self) -> None:
+        batches = [
+            self.openai_batch_view(b)
+            for b in self.server.batches.values()
+            if b.get("object") == "batch"
+        ]
+        self.send_page(
+            sorted(batches, key=lambda b: b["created_at"], reverse=True), "after"
+        )
+
+    # -----------------------------------------------------------------------------------------------------------------
+    # Anthropic
+    # -----------------------------------------------------------------------------------------------------------------
+    def anthropic_message(self) -> None:
+        params = loads(self.body)
+        if params.get("stream"):
+            return self.send_events(self.server.message_events(params))
+        self.send_json(self.server.message(params))
+
+    def anthropic_create_batch(self) -> None:
+        requests = loads(self.body)["requests"]
+        results = []
+        for request in requests:
+            if self.server.roll(self.server.config.item_error_rate):
+                error = {
+                    "type": "error",
+                    "error": {"type": "api_error", "message": "Mock item failure"},
+                }
+                result = {"type": "errored", "error": error}
+            else:
+                result = {
+                    "type": "succeeded",
+                    "message": self.server.message(request["params"]),
+                }
+            results.append({"custom_id": request["custom_id"], "result": result})
+
+        created = time.time()
+        batch = {
+            "id": f"msgbatch_{uuid.uuid4().hex}",
+            "type": "message_batch",
+            "processing_status": "in_progress",
+            "request_counts": {
+                "processing": len(results),
+                "succeeded": 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _iso(created),
+            "expires_at": _iso(created + 86400),
+            "ended_at": None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": None,
+            "_created": created,
+            "_results": results,
+            "_done_at": self.server.done_times(len(results), created),
+        }
+        with self.server.lock:
+            self.server.batches[batch["id"]] = batch
+        self.send_json(self.anthropic_batch_view(batch))
+
+    def anthropic_batch_results(self, batch: Dict) -> List[Dict]:
+        """Results of the items done so far; the rest are canceled."""
+        done = self.server.items_done(batch)
+        return [
+            r if ok else {"custom_id": r["custom_id"], "result": {"type": "canceled"}}
+            for r, ok in zip(batch["_results"], done)
+        ]
+
+    def anthropic_batch_view(self, batch: Dict) -> Dict:
+        view = {k: v for k, v in batch.items() if not k.startswith("_")}
+        results = self.anthropic_batch_results(batch)
+        counts = {
+            kind: sum(r["result"]["type"] == kind for r in results)
+            for kind in ("succeeded", "errored", "canceled", "expired")
+        }
+        if self.server.batch_finished(batch):
+            view.update(
+                processing_status="ended",
+                ended_at=_iso(time.time()),
+                results_url=f"{self.server.url}/v1/messages/batches/{batch['id']}/results",
+                request_counts={"processing": 0, **counts},
+            )
+        else:
+            # items not done yet show as canceled in the results, but are still processing
+            processing, counts["canceled"] = counts["canceled"], 0
+            view["request_counts"] = {"processing": processing, **counts}
+            if batch.get("_cancelled_at") is not None:
+                view["processing_status"] = "canceling"
+        if batch.get("_cancelled_at") is not None:
+            view["cancel_initiated_at"] = _iso(batch["_cancelled_at"])
+        return view
+
+    def anthropic_retrieve_batch(self, batch_id: str) -> None:
+        self.send_json(self.anthropic_batch_view(self.server.batches[batch_id]))
+
+    def anthropic_cancel_batch(self, batch_id: str) -> None:
+        batch = self.server.batches[batch_id]
+        if batch.get("_cancelled_at") is None and not self.server.batch_finished(batch):
+            batch["_cancelled_at"] = time.time()
+            view = self.anthropic_batch_view(batch)
+            view["processing_status"] = "canceling"
+            return self.send_json(view)
+        self.send_json(self.anthropic_batch_view(batch))
+
+    def anthropic_list_batches(self) -> None:
+        batches = [
+            self.anthropic_batch_view(b)
+            for b in self.server.batches.values()
+            if b.get("type") == "message_batch"
+        ]
+        self.send_page(
+            sorted(batches, key=lambda b: b["created_at"], reverse=True), "after_id"
+        )
+
+    def anthropic_results(self, batch_id: str) -> None:
+        batch = self.server.batches[batch_id]
+        if not self.server.batch_finished(batch):
+            return self.send_error_json(
+                404, "not_found_error", f"Batch {batch_id} has not ended"
+            )
+        results = self.anthropic_batch_results(batch)
+        payload = "".join(dumps(r) + "\n" for r in results).encode()
+        self.send_bytes(200, payload, "application/binary")
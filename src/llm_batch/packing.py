@@ -0,0 +1,251 @@
+import copy
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from llm_batch import CONFIG
+from llm_batch.caching import content_text, count_tokens
+from llm_batch.dedup import request_key
+from llm_batch.records import BatchResult
+from llm_batch.serialization import JSONDecodeError, loads
+from llm_batch.store import read_records
+
+PACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "answer": {"type": "string"},
+                },
+                "required": ["id", "answer"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["items"],
+    "additionalProperties": False,
+}
+
+PACK_INSTRUCTIONS = (
+    "Handle each of the items below independently, as if it were the only one. "
+    'Reply with JSON only, in the form {"items": [{"id": "<item id>", "answer": "<answer>"}]}, '
+    "with exactly one entry per item id."
+)
+
+# tokens added per item by the <item> wrapper
+ITEM_OVERHEAD = 12
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Packing
+# ---------------------------------------------------------------------------------------------------------------------
+def item_index(body: Dict) -> Optional[int]:
+    """Position of the last user message, the per-item part of a request, or None if there is none."""
+    for idx in range(len(body.get("messages", [])) - 1, -1, -1):
+        if body["messages"][idx].get("role") == "user":
+            return idx
+    return None
+
+
+def packed_request(body: Dict, items: List[Tuple[str, str]]) -> Dict:
+    """
+    Request body answering every `(id, text)` item in one call. The shared part of `body` is kept, the last
+    user message lists the items, and a JSON schema asks for one answer per item id.
+    """
+    body = copy.deepcopy(body)
+    listing = "\n".join(f'<item id="{id}">\n{text}\n</item>' for id, text in items)
+    body["messages"][item_index(body)] = {
+        "role": "user",
+        "content": f"{PACK_INSTRUCTIONS}\n\n{listing}",
+    }
+    if body.get("max_tokens"):
+        body["max_tokens"] = body["max_tokens"] * len(items)
+    body["response_format"] = {
+        "type": "json_schema",
+        "json_schema": {"name": "packed_items", "strict": True, "schema": PACK_SCHEMA},
+    }
+    return body
+
+
+@dataclass
+class Pack:
+    body: Dict
+    base_tokens: int
+    items: List[Tuple[str, str]] = field(default_factory=list)
+    tokens: int = 0
+
+
+class Packer:
+    """
+    Packs template records whose requests differ only in the last user message into shared requests,
+    up to `budget` input tokens and `max_items` items each (`packing` in config.yml by default).
+    """
+
+    def __init__(self, budget: Optional[int] = None, max_items: Optional[int] = None):
+        packing = CONFIG.get("packing") or {}
+        self.budget = budget or packing.get("max_input_tokens", 4000)
+        self.max_items = max_items or packing.get("max_items", 50)
+        self.open: Dict[bytes, Pack] = {}
+        self.count = 0
+        self.item_count = 0
+
+    def add(self, record: Dict) -> Iterator[Dict]:
+        """Add one template record, yielding any packed records that are full."""
+        body = record["request"]
+        idx = item_index(body)
+        if idx is None or not isinstance(
+            body["messages"][idx].get("content"), (str, list)
+        ):
+            # nothing to pack: pass the request through on its own
+            yield self.emit(body, [record["id"]], packed=False)
+            return
+        text = content_text(body["messages"][idx]["content"])
+        shared = copy.deepcopy(body)
+        shared["messages"][idx] = {"role": "user", "content": ""}
+        key = request_key(shared)
+        tokens = count_tokens(text) + ITEM_OVERHEAD
+
+        pack = self.open.get(key)
+        if pack and (
+            len(pack.items) >= self.max_items
+            or pack.base_tokens + pack.tokens + tokens > self.budget
+        ):
+            yield self.close(key)
+            pack = None
+        if pack is None:
+            base = count_tokens(PACK_INSTRUCTIONS) + sum(
+                count_tokens(content_text(m.get("content"))) for m in shared["messages"]
+            )
+            pack = self.open[key] = Pack(body=body, base_tokens=base)
+        pack.items.append((record["id"], text))
+        pack.tokens += tokens
+        self.item_count += 1
+
+    def close(self, key: bytes) -> Dict:
+        pack = self.open.pop(key)
+        return self.emit(
+            packed_request(pack.body, pack.items), [id for id, _ in pack.items]
+        )
+
+    def emit(self, request: Dict, item_ids: List[str], packed: bool = True) -> Dict:
+        self.count += 1
+        return {
+            "id": f"p{self.count:06d}",
+            "template_params": {},
+            "request": request,
+            "items": item_ids,
+            "packed": packed,
+        }
+
+    def flush(self) -> Iterator[Dict]:
+        for key in list(self.open):
+            yield self.close(key)
+
+    def pack(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        for record in records:
+            yield from self.add(record)
+        yield from self.flush()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Unpacking
+# ---------------------------------------------------------------------------------------------------------------------
+def response_text(result: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Completion text of one OpenAI or Anthropic batch result line, as `(text, error)`.
+    """
+    outcome = BatchResult.from_dict(result)
+    return outcome.text, outcome.error
+
+
+def parse_answers(text: Optional[str]) -> Dict[str, str]:
+    """
+    Validate a packed response against the pack schema and return its answers by item id.
+    Raises ValueError if the response is not JSON in the expected shape.
+    """
+    if not text:
+        raise ValueError("empty response")
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = loads(text)
+    except JSONDecodeError as e:
+        raise ValueError(f"response is not JSON: {e}") from e
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+        raise ValueError('response has no "items" list')
+    answers: Dict[str, str] = {}
+    for entry in data["items"]:
+        if not isinstance(entry, dict) or "id" not in entry or "answer" not in entry:
+            raise ValueError(f"invalid item entry: {entry!r}")
+        answers.setdefault(str(entry["id"]), entry["answer"])
+    return answers
+
+
+def read_packs(packed: Path) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    The packed records (without their requests) and their positions keyed by batch custom_id. Anthropic
+    results are keyed by position (`id-<n>`), so both forms are included.
+    """
+    packs, positions = [], {}
+    for idx, record in enumerate(read_records(packed)):
+        packs.append({"items": record["items"], "packed": record["packed"]})
+        positions[f"id_{record['id']}"] = positions[f"id-{idx}"] = idx
+    return packs, positions
+
+
+def unpack_results(
+    results: Iterable[Dict], packed: Path, stats: Optional[Counter] = None
+) -> Iterator[Dict]:
+    """
+    Split packed batch results back into one record per item: `{"id", "custom_id", "answer"}`, or
+    `{"id", "custom_id", "error"}` when the request failed or has no result, or when the response did not
+    validate or left the item out. Requests passed through unpacked yield their response text as the answer.
+    """
+    stats = stats if stats is not None else Counter()
+    packs, positions = read_packs(packed)
+    seen = set()
+
+    def split(pack: Dict, custom_id: str, answers: Dict, error: Optional[str]):
+        for item_id in pack["items"]:
+            if item_id in answers:
+                stats["ok"] += 1
+                yield {
+                    "id": item_id,
+                    "custom_id": custom_id,
+                    "answer": answers[item_id],
+                }
+            else:
+                stats["error"] += 1
+                yield {
+                    "id": item_id,
+                    "custom_id": custom_id,
+                    "error": error or "item missing from packed response",
+                }
+
+    for result in results:
+        custom_id = result.get("custom_id", "")
+        if custom_id not in positions:
+            stats["unknown"] += 1
+            continue
+        seen.add(positions[custom_id])
+        pack = packs[positions[custom_id]]
+        text, error = response_text(result)
+        answers: Dict = {}
+        if error is None and not pack["packed"]:
+            answers = {pack["items"][0]: text}
+        elif error is None:
+            try:
+                answers = parse_answers(text)
+            except ValueError as e:
+                error = str(e)
+        yield from split(pack, custom_id, answers, error)
+
+    for idx, pack in enumerate(packs):
+        if idx not in seen:
+            yield from split(pack, f"id-{idx}", {}, "no result for packed request")
@@ -0,0 +1,154 @@
+import cProfile
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from rich.console import Console
+from rich.table import Table
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Phase timers
+# ---------------------------------------------------------------------------------------------------------------------
+class PhaseTimer:
+    """
+    Accumulates wall and CPU time per named phase (load, render, serialize, write, network, ...).
+    Timing only happens while enabled, so the `phase` calls left in the hot loops cost next to nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.calls: Counter = Counter()
+        self.wall: Dict[str, float] = defaultdict(float)
+        self.cpu: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.wall.clear()
+        self.cpu.clear()
+
+    def add(self, name: str, wall: float, cpu: float) -> None:
+        with self._lock:
+            self.calls[name] += 1
+            self.wall[name] += wall
+            self.cpu[name] += cpu
+
+    def print_table(self, console: Console, total_wall: float) -> None:
+        table = Table(title="Phase breakdown")
+        for column in ["phase", "calls", "wall (s)", "cpu (s)", "% wall"]:
+            table.add_column(column, justify="left" if column == "phase" else "right")
+        for name, wall in sorted(self.wall.items(), key=lambda x: -x[1]):
+            share = 100 * wall / total_wall if total_wall else 0.0
+            table.add_row(
+                name,
+                f"{self.calls[name]:,}",
+                f"{wall:.3f}",
+                f"{self.cpu[name]:.3f}",
+                f"{share:.1f}",
+            )
+        other = total_wall - sum(self.wall.values())
+        if other > 0:
+            table.add_row(
+                "[dim]other[/dim]",
+                "",
+                f"{other:.3f}",
+                "",
+                f"{100 * other / total_wall:.1f}",
+            )
+        console.print(table)
+
+
+PHASES = PhaseTimer()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Time a named phase of a command when profiling is enabled.
+    """
+    if not PHASES.enabled:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        PHASES.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Profilers
+# ---------------------------------------------------------------------------------------------------------------------
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler: a background thread snapshots the profiled thread's stack at a fixed
+    interval. The output uses the folded-stack format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def enable(self) -> None:
+        self._thread.start()
+
+    def disable(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump_stats(self, path: Path) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profiled(out: Path, profiler: str, console: Console) -> Iterator[None]:
+    """
+    Run the enclosed block under cProfile (`.prof`, readable by pstats/snakeviz) or the sampling
+    profiler (`.folded`), then write the artifact and print the phase breakdown.
+    """
+    if profiler == "cprofile":
+        prof, artifact = cProfile.Profile(), out.with_suffix(".prof")
+    elif profiler == "sampling":
+        prof, artifact = SamplingProfiler(), out.with_suffix(".folded")
+    else:
+        raise ValueError(f"Unknown profiler: {profiler}")
+
+    PHASES.reset()
+    PHASES.enabled = True
+    start = time.perf_counter()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        total = time.perf_counter() - start
+        PHASES.enabled = False
+        artifact.parent.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(artifact)
+        PHASES.print_table(console, total)
+        console.print(
+            f"[orange1]{profiler} profile written to {artifact} ({total:.2f}s wall)"
+        )
@@ -0,0 +1,195 @@
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import litellm
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeElapsedColumn,
+    TimeRemainingColumn,
+)
+
+from llm_batch import CONFIG, logger
+from llm_batch.telemetry import (
+    RequestEvent,
+    event_from_batch_result,
+    event_from_response,
+)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def event_cost(event: RequestEvent) -> float:
+    """List price of a request's tokens in USD; 0 for unknown models."""
+    if not event.model or not (event.prompt_tokens or event.completion_tokens):
+        return 0.0
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=event.model,
+            prompt_tokens=event.prompt_tokens,
+            completion_tokens=event.completion_tokens,
+        )
+    except Exception:
+        return 0.0
+    return prompt_cost + completion_cost
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return (
+        f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class RunProgress:
+    """
+    Progress of a long run: done/failed/cached counts, requests/s, tokens/s, ETA and estimated cost.
+    On a terminal it is a `rich.progress` display, updated at most `refresh_per_second` times a second, so
+    counting an item is a few increments rather than a console write; elsewhere (CI, pipes) a summary line
+    is printed every `log_interval` seconds and at the end. Safe to update from several threads or tasks.
+    `discount` scales the cost estimate (0.5 for batch results).
+    """
+
+    def __init__(
+        self,
+        description: str,
+        total: Optional[int] = None,
+        console: Optional[Console] = None,
+        discount: float = 1.0,
+    ):
+        config = CONFIG.get("progress") or {}
+        self.description = description
+        self.console = console
+        self.total = total
+        self.discount = discount
+        self.log_interval = config.get("log_interval", 30.0)
+        self.counts = {"done": 0, "failed": 0, "cached": 0}
+        self.tokens = 0
+        self.cost = 0.0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._logged = self.started
+        self._drawn = 0.0
+        self._redraw = 1.0 / config.get("refresh_per_second", 4)
+        self._progress: Optional[Progress] = None
+        if isinstance(console, Console) and console.is_terminal:
+            self._progress = Progress(
+                SpinnerColumn(),
+                TextColumn("[bold]{task.description}"),
+                BarColumn(),
+                MofNCompleteColumn(),
+                TextColumn("{task.fields[stats]}"),
+                TimeElapsedColumn(),
+                TextColumn("ETA"),
+                TimeRemainingColumn(),
+                console=console,
+                refresh_per_second=config.get("refresh_per_second", 4),
+                transient=False,
+            )
+            self._task = self._progress.add_task(description, total=total, stats="")
+
+    # -----------------------------------------------------------------------------------------------------------------
+    def advance(
+        self,
+        status: str = "done",
+        responses: Iterable[Dict] = (),
+        events: Iterable[RequestEvent] = (),
+        n: int = 1,
+    ) -> None:
+        """
+        Count `n` finished items, with the usage of their chat `responses` or telemetry `events`.
+        """
+        events = [*events, *(event_from_response("", "", r) for r in responses)]
+        tokens = sum(e.prompt_tokens + e.completion_tokens for e in events)
+        cost = sum(event_cost(e) for e in events) * self.discount
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + n
+            self.counts["cached"] += sum(e.cache_hit for e in events)
+            self.tokens += tokens
+            self.cost += cost
+        self._update()
+
+    def advance_result(self, result: Dict) -> None:
+        """Count one OpenAI or Anthropic batch result line."""
+        event = event_from_batch_result(result, "")
+        self.advance("failed" if event.status == "error" else "done", events=[event])
+
+    @property
+    def completed(self) -> int:
+        return self.counts["done"] + self.counts["failed"]
+
+    def stats(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        rate = self.completed / elapsed if elapsed else 0.0
+        eta = None
+        if self.total is not None and rate:
+            eta = max(self.total - self.completed, 0) / rate
+        return {
+            **self.counts,
+            "elapsed": elapsed,
+            "requests_per_second": rate,
+            "tokens_per_second": self.tokens / elapsed if elapsed else 0.0,
+            "eta": eta,
+            "cost": self.cost,
+        }
+
+    def line(self) -> str:
+        s = self.stats()
+        total = f"/{self.total:,}" if self.total is not None else ""
+        return (
+            f"{self.description}: {self.completed:,}{total} "
+            f"({s['failed']:,} failed, {s['cached']:,} cached) "
+            f"{s['requests_per_second']:,.1f} req/s, {s['tokens_per_second']:,.0f} tokens/s, "
+            f"ETA {format_duration(s['eta'])}, ~${s['cost']:.4f}"
+        )
+
+    def _update(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if self._progress is not None:
+            if not force and now - self._drawn < self._redraw:
+                return
+            self._drawn = now
+            s = self.stats()
+            self._progress.update(
+                self._task,
+                completed=self.completed,
+                stats=(
+                    f"[red]{s['failed']:,} failed[/red] {s['cached']:,} cached "
+                    f"{s['requests_per_second']:,.1f} req/s {s['tokens_per_second']:,.0f} tok/s "
+                    f"~${s['cost']:.4f}"
+                ),
+            )
+            return
+        if now - self._logged >= self.log_interval:
+            self._logged = now
+            self.log()
+
+    def log(self) -> None:
+        line = self.line()
+        logger.info(line)
+        if self.console is not None:
+            self.console.print(line, highlight=False)
+
+    # -----------------------------------------------------------------------------------------------------------------
+    def __enter__(self):
+        if self._progress is not None:
+            self._progress.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._progress is not None:
+            self._update(force=True)
+            self._progress.stop()
+            logger.info(self.line())
+        else:
+            self.log()
@@ -0,0 +1,359 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
+
+from rich.console import Console
+
+from llm_batch.caching import content_text
+from llm_batch.fileio import companion_path, open_file
+from llm_batch.serialization import JSONDecodeError, dumps, loads
+
+ROLES = {"system", "developer", "user", "assistant", "tool"}
+CHAT_URL = "/v1/chat/completions"
+EMBEDDINGS_URL = "/v1/embeddings"
+
+
+class RecordError(ValueError):
+    """An invalid batch request line, with its 1-based line number."""
+
+    def __init__(self, message: str, line: Optional[int] = None):
+        self.message = message
+        self.line = line
+        super().__init__(f"line {line}: {message}" if line else message)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Records
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass(slots=True)
+class Message:
+    role: str
+    content: Any
+    # tool_calls, name, tool_call_id and the like; None when there are none
+    extra: Optional[Dict] = None
+
+    @classmethod
+    def from_dict(cls, data: Any, idx: int) -> "Message":
+        if not isinstance(data, dict):
+            raise RecordError(f"body.messages[{idx}] is not an object")
+        role = data.get("role")
+        if role not in ROLES:
+            raise RecordError(f"body.messages[{idx}].role is invalid: {role!r}")
+        content = data.get("content")
+        if not (
+            isinstance(content, (str, list))
+            or (content is None and role == "assistant")
+        ):
+            raise RecordError(
+                f"body.messages[{idx}].content must be a string or a list"
+            )
+        extra = {k: v for k, v in data.items() if k not in ("role", "content")}
+        return cls(role, content, extra or None)
+
+    def to_dict(self) -> Dict:
+        return {"role": self.role, "content": self.content, **(self.extra or {})}
+
+
+@dataclass(slots=True)
+class ChatRequest:
+    """
+    One validated line of a batch requests file. Much smaller in memory than the nested dicts it is read
+    from; `to_dict()` gives the line back.
+    """
+
+    custom_id: str
+    model: str
+    messages: Tuple[Message, ...]
+    max_tokens: Optional[int] = None
+    # temperature, tools, response_format and the like; None when there are none
+    params: Optional[Dict] = None
+    url: str = CHAT_URL
+
+    @classmethod
+    def from_dict(cls, data: Any, provider: Optional[str] = None) -> "ChatRequest":
+        """
+        Validate a batch request line. Anthropic requests must set `max_tokens`.
+        """
+        if not isinstance(data, dict):
+            raise RecordError("request is not an object")
+        custom_id = data.get("custom_id")
+        if not isinstance(custom_id, str) or not custom_id:
+            raise RecordError("custom_id is missing")
+        body = data.get("body")
+        if not isinstance(body, dict):
+            raise RecordError("body is missing")
+        model = body.get("model")
+        if not isinstance(model, str) or not model:
+            raise RecordError("body.model is missing")
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            raise RecordError("body.messages must be a non-empty list")
+        max_tokens = body.get("max_tokens")
+        if max_tokens is None and provider == "anthropic":
+            raise RecordError("body.max_tokens is required for Anthropic")
+        if max_tokens is not None and (
+            not isinstance(max_tokens, int)
+            or isinstance(max_tokens, bool)
+            or max_tokens < 1
+        ):
+            raise RecordError("body.max_tokens must be a positive integer")
+        params = {
+            k: v
+            for k, v in body.items()
+            if k not in ("model", "messages", "max_tokens")
+        }
+        return cls(
+            custom_id=custom_id,
+            model=model,
+            messages=tuple(Message.from_dict(m, idx) for idx, m in enumerate(messages)),
+            max_tokens=max_tokens,
+            params=params or None,
+            url=data.get("url") or CHAT_URL,
+        )
+
+    @property
+    def body(self) -> Dict:
+        body: Dict = {
+            "model": self.model,
+            "messages": [m.to_dict() for m in self.messages],
+        }
+        if self.max_tokens is not None:
+            body["max_tokens"] = self.max_tokens
+        return {**body, **(self.params or {})}
+
+    def to_dict(self) -> Dict:
+        return {
+            "custom_id": self.custom_id,
+            "method": "POST",
+            "url": self.url,
+            "body": self.body,
+        }
+
+
+@dataclass(slots=True)
+class EmbeddingRequest:
+    """
+    One validated line of an embeddings batch requests file; `input` is one text or a tuple of texts.
+    """
+
+    custom_id: str
+    model: str
+    input: Union[str, Tuple[str, ...]]
+    # encoding_format, dimensions and the like; None when there are none
+    params: Optional[Dict] = None
+    url: str = EMBEDDINGS_URL
+
+    @classmethod
+    def from_dict(cls, data: Any, provider: Optional[str] = None) -> "EmbeddingRequest":
+        """
+        Validate an embeddings batch request line. Anthropic batches have no embeddings endpoint.
+        """
+        if provider == "anthropic":
+            raise RecordError("Anthropic batches do not support embeddings")
+        if not isinstance(data, dict):
+            raise RecordError("request is not an object")
+        custom_id = data.get("custom_id")
+        if not isinstance(custom_id, str) or not custom_id:
+            raise RecordError("custom_id is missing")
+        body = data.get("body")
+        if not isinstance(body, dict):
+            raise RecordError("body is missing")
+        model = body.get("model")
+        if not isinstance(model, str) or not model:
+            raise RecordError("body.model is missing")
+        texts = body.get("input")
+        if (
+            isinstance(texts, list)
+            and texts
+            and all(isinstance(t, str) and t for t in texts)
+        ):
+            texts = tuple(texts)
+        elif not isinstance(texts, str) or not texts:
+            raise RecordError(
+                "body.input must be a non-empty string or list of strings"
+            )
+        params = {k: v for k, v in body.items() if k not in ("model", "input")}
+        return cls(custom_id, model, texts, params or None)
+
+    @property
+    def body(self) -> Dict:
+        texts = list(self.input) if isinstance(self.input, tuple) else self.input
+        return {"model": self.model, "input": texts, **(self.params or {})}
+
+    def to_dict(self) -> Dict:
+        return {
+            "custom_id": self.custom_id,
+            "method": "POST",
+            "url": self.url,
+            "body": self.body,
+        }
+
+
+Request = Union[ChatRequest, EmbeddingRequest]
+
+
+def parse_request(data: Any, provider: Optional[str] = None) -> Request:
+    """Validate a batch request line of the endpoint named by its `url` (chat completions by default)."""
+    if isinstance(data, dict) and data.get("url") == EMBEDDINGS_URL:
+        return EmbeddingRequest.from_dict(data, provider)
+    return ChatRequest.from_dict(data, provider)
+
+
+@dataclass(slots=True)
+class BatchResult:
+    """
+    Outcome of one OpenAI (output or error file) or Anthropic batch result line.
+    """
+
+    custom_id: str
+    ok: bool
+    text: Optional[str] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "BatchResult":
+        custom_id = result.get("custom_id", "")
+        if "response" in result:  # OpenAI
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                return cls(
+                    custom_id,
+                    False,
+                    error=dumps(result.get("error") or response.get("body")),
+                )
+            choices = (response.get("body") or {}).get("choices") or [{}]
+            return cls(
+                custom_id, True, text=(choices[0].get("message") or {}).get("content")
+            )
+        outcome = result.get("result") or {}  # Anthropic
+        if outcome.get("type") != "succeeded":
+            return cls(
+                custom_id,
+                False,
+                error=dumps(outcome.get("error") or outcome.get("type")),
+            )
+        return cls(
+            custom_id,
+            True,
+            text=content_text((outcome.get("message") or {}).get("content")),
+        )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------------------------------------------------------
+def batch_url(batch_file: Path) -> str:
+    """Endpoint of a batch requests file, from its first request."""
+    with open_file(batch_file) as f:
+        for line in f:
+            if line.strip():
+                return loads(line).get("url") or CHAT_URL
+    return CHAT_URL
+
+
+def quarantine_path(batch_file: Path) -> Path:
+    """Invalid lines of a batch requests file: `batch-requests.jsonl` -> `batch-quarantine.jsonl`."""
+    return companion_path(batch_file, "quarantine")
+
+
+class Validator:
+    """
+    Validates batch request lines in one streaming pass. Without a `quarantine` file the first invalid line
+    raises (`json.JSONDecodeError` or `RecordError`, with its line number). With one, invalid lines are
+    written there as `{"line", "error", "text"}` and skipped. Duplicate custom_ids are invalid too, and so
+    are requests to another endpoint than the first one (a batch has a single endpoint).
+    """
+
+    def __init__(
+        self, provider: Optional[str] = None, quarantine: Optional[Path] = None
+    ):
+        self.provider = provider
+        self.quarantine = quarantine
+        self.total = 0
+        self.invalid = 0
+        self.url: Optional[str] = None
+        self._ids: Set[str] = set()
+        self._f: Optional[IO[str]] = None
+
+    def validate(self, data: Any) -> Request:
+        request = parse_request(data, self.provider)
+        if request.custom_id in self._ids:
+            raise RecordError(f"duplicate custom_id {request.custom_id!r}")
+        if self.url is None:
+            self.url = request.url
+        elif request.url != self.url:
+            raise RecordError(
+                f"url {request.url!r} differs from the batch endpoint {self.url!r}"
+            )
+        self._ids.add(request.custom_id)
+        return request
+
+    def reject(self, line: int, error: Exception, text: str) -> None:
+        if self.quarantine is None:
+            raise error
+        if self._f is None:
+            self._f = open(self.quarantine, "w")
+        self.invalid += 1
+        self._f.write(dumps({"line": line, "error": str(error), "text": text}) + "\n")
+
+    def _parse(self, lines: Iterable[str]) -> Iterator[Tuple[str, Request]]:
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            self.total += 1
+            try:
+                yield line, self.validate(loads(line))
+            except JSONDecodeError as e:
+                self.reject(
+                    line_no,
+                    JSONDecodeError(f"line {line_no}: {e.msg}", e.doc, e.pos),
+                    line.rstrip("\n"),
+                )
+            except RecordError as e:
+                self.reject(line_no, RecordError(e.message, line_no), line.rstrip("\n"))
+
+    def parse(self, lines: Iterable[str]) -> Iterator[Request]:
+        """Typed requests from raw JSONL lines. Blank lines are skipped, but count towards line numbers."""
+        for _, request in self._parse(lines):
+            yield request
+
+    def valid_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """The valid raw JSONL lines, unchanged."""
+        for line, _ in self._parse(lines):
+            yield line if line.endswith("\n") else line + "\n"
+
+    def check(self, requests: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass valid request dicts through unchanged; `line` is the position in the stream."""
+        for line_no, data in enumerate(requests, start=1):
+            self.total += 1
+            try:
+                self.validate(data)
+            except RecordError as e:
+                self.reject(line_no, RecordError(e.message, line_no), dumps(data))
+                continue
+            yield data
+
+    def print(self, console: Console) -> None:
+        if self.invalid:
+            console.print(
+                f"[yellow]{self.invalid} of {self.total} requests were invalid and skipped[/yellow] "
+                f"(quarantined in {self.quarantine})"
+            )
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_requests(
+    batch_file: Path, provider: Optional[str] = None, quarantine: Optional[Path] = None
+) -> Iterator[Request]:
+    """Stream the validated requests of a batch file (see `Validator`)."""
+    with open_file(batch_file) as f, Validator(provider, quarantine) as validator:
+        yield from validator.parse(f)
@@ -0,0 +1,135 @@
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from llm_batch import api
+from llm_batch.clients import aclose_clients
+from llm_batch.index import OffsetIndex
+from llm_batch.serialization import dumps, loads
+from llm_batch.records import BatchResult
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def is_failed(result: Dict) -> bool:
+    """
+    True for OpenAI error-file lines and non-200 responses, and for errored, expired or canceled
+    Anthropic results.
+    """
+    return not BatchResult.from_dict(result).ok
+
+
+def results_name(batch_name: str, round: int) -> str:
+    if round == 0:
+        return f"{batch_name}-responses.jsonl"
+    return f"{batch_name}-retry{round}-responses.jsonl"
+
+
+async def collect_round(
+    batch_id: str,
+    provider: api.Provider,
+    index: OffsetIndex,
+    results_file: Path,
+    retry_file: Path,
+) -> Dict:
+    """
+    Stream one batch's results to `results_file` under their original custom_ids, and write the requests
+    that failed or never came back to `retry_file`. Returns the round counts.
+    """
+    seen = bytearray(len(index))
+    failed = 0
+    with open(results_file, "w") as out, open(retry_file, "wb") as retry:
+        async for result in api.fetch(batch_id, provider=provider):
+            position = index.position(result.get("custom_id", ""))
+            if position is None:
+                continue
+            request = loads(index.line(position))
+            result["custom_id"] = request["custom_id"]
+            out.write(dumps(result) + "\n")
+            seen[position] = 1
+            if is_failed(result):
+                retry.write(index.line(position))
+                failed += 1
+        # requests without any result (a failed or cancelled batch) are retried too
+        missing = 0
+        for position, returned in enumerate(seen):
+            if not returned:
+                retry.write(index.line(position))
+                missing += 1
+    return {"results": int(sum(seen)), "failed": failed, "missing": missing}
+
+
+async def retry_batch(
+    batch_id: str,
+    requests_file: Path,
+    provider: api.Provider = "openai",
+    out: Path = Path("."),
+    batch_name: str = "batch",
+    max_rounds: int = 3,
+    budget: Optional[int] = None,
+    interval: float = 30.0,
+    on_round: Optional[Callable[[Dict], None]] = None,
+) -> List[Dict]:
+    """
+    Wait for a batch, fetch its results and resubmit only the failed requests as a new batch linked to its
+    parent; repeat until nothing fails, `max_rounds` retries were made or more than `budget` requests in
+    total would be resubmitted. Every round is appended to `<batch_name>-lineage.jsonl` and returned.
+    The connection pools of the event loop are closed at the end.
+    """
+    out.mkdir(parents=True, exist_ok=True)
+    lineage_file = out / f"{batch_name}-lineage.jsonl"
+    lineage: List[Dict] = []
+    parent: Optional[str] = None
+    resubmitted = 0
+    round = 0
+    try:
+        while True:
+            await api.poll(batch_id, provider=provider, interval=interval)
+            retry_file = out / f"{batch_name}-retry{round + 1}-requests.jsonl"
+            with OffsetIndex(requests_file) as index:
+                counts = await collect_round(
+                    batch_id,
+                    provider,
+                    index,
+                    out / results_name(batch_name, round),
+                    retry_file,
+                )
+            entry = {
+                "batch_id": batch_id,
+                "parent_batch_id": parent,
+                "round": round,
+                "provider": provider,
+                "requests_file": str(requests_file),
+                "results_file": str(out / results_name(batch_name, round)),
+                **counts,
+                "timestamp": time.time(),
+            }
+            to_retry = counts["failed"] + counts["missing"]
+            if to_retry == 0:
+                entry["stopped"] = "done"
+            elif round >= max_rounds:
+                entry["stopped"] = "max rounds"
+            elif budget is not None and resubmitted + to_retry > budget:
+                entry["stopped"] = "budget"
+            lineage.append(entry)
+            with open(lineage_file, "a") as f:
+                f.write(dumps(entry) + "\n")
+            if on_round:
+                on_round(entry)
+            if "stopped" in entry:
+                if to_retry == 0:
+                    retry_file.unlink()
+                return lineage
+
+            round += 1
+            resubmitted += to_retry
+            parent, requests_file = batch_id, retry_file
+            batch_id = await api.send(
+                retry_file,
+                provider=provider,
+                description=f"retry {round} of {parent}",
+                metadata={"parent_batch_id": parent, "retry_round": str(round)},
+            )
+    finally:
+        await aclose_clients()
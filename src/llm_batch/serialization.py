@@ -0,0 +1,126 @@
+import json
+from typing import Any, Callable, Dict, Literal
+
+from llm_batch import CONFIG
+
+try:
+    import orjson
+except ImportError:  # optional: pip install "llm-batch[fast]"
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional: pip install "llm-batch[msgspec]"
+    msgspec = None
+
+Backend = Literal["auto", "orjson", "msgspec", "json"]
+
+JSONDecodeError = json.JSONDecodeError
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------------------------------------------------
+# Every backend writes compact JSON (no spaces after separators) with non-ASCII characters kept as UTF-8.
+# Output is equivalent across backends but not byte-for-byte: floats, for one, are formatted differently.
+def _json_dumps(obj: Any, sort_keys: bool = False) -> str:
+    return json.dumps(
+        obj, separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys
+    )
+
+
+def _orjson_dumps(obj: Any, sort_keys: bool = False) -> str:
+    try:
+        return orjson.dumps(
+            obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0
+        ).decode()
+    except TypeError:
+        # non-string keys, integers over 64 bits and the like
+        return _json_dumps(obj, sort_keys)
+
+
+def _msgspec_dumps(obj: Any, sort_keys: bool = False) -> str:
+    try:
+        data = msgspec.json.encode(obj, order="sorted" if sort_keys else None)
+    except (TypeError, msgspec.EncodeError):
+        return _json_dumps(obj, sort_keys)
+    return data.decode()
+
+
+def _msgspec_loads(data) -> Any:
+    try:
+        return msgspec.json.decode(data)
+    except msgspec.DecodeError as e:
+        doc = data.decode(errors="replace") if isinstance(data, bytes) else data
+        raise JSONDecodeError(str(e), doc, 0) from None
+
+
+BACKENDS: Dict[str, Callable[[], bool]] = {
+    "orjson": lambda: orjson is not None,
+    "msgspec": lambda: msgspec is not None,
+    "json": lambda: True,
+}
+
+backend: str = "json"
+_dumps: Callable[..., str] = _json_dumps
+_loads: Callable[[Any], Any] = json.loads
+
+
+def use_backend(name: Backend = "auto") -> str:
+    """
+    Select the JSON backend: `auto` picks orjson, then msgspec, then the standard library.
+    Returns the backend in use.
+    """
+    global backend, _dumps, _loads
+    if name == "auto":
+        name = next(b for b, available in BACKENDS.items() if available())  # type: ignore
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    if not BACKENDS[name]():
+        raise ImportError(f"JSON backend {name} is not installed")
+    backend = name
+    _dumps, _loads = {
+        "orjson": (_orjson_dumps, lambda data: orjson.loads(data)),
+        "msgspec": (_msgspec_dumps, _msgspec_loads),
+        "json": (_json_dumps, json.loads),
+    }[name]
+    return backend
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """Compact JSON text of `obj`."""
+    return _dumps(obj, sort_keys)
+
+
+def loads(data) -> Any:
+    """
+    Parse JSON text or bytes. Invalid input raises `json.JSONDecodeError` with every backend.
+    """
+    return _loads(data)
+
+
+def loads_lenient(text: str) -> Any:
+    """
+    Parse JSON that may hold raw control characters (newlines, tabs) inside strings, as rendered prompt
+    templates often do. Strict parsing with the fast backend is tried first.
+    """
+    try:
+        return _loads(text)
+    except JSONDecodeError:
+        return json.loads(text, strict=False)
+
+
+def dumps_pretty(obj: Any) -> str:
+    """Indented JSON for files meant to be read by people."""
+    if backend == "orjson":
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+use_backend((CONFIG.get("serialization") or {}).get("backend", "auto"))
@@ -0,0 +1,176 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from llm_batch.fileio import open_file
+from llm_batch.index import OffsetIndex
+from llm_batch.serialization import dumps, dumps_pretty, loads
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Output stores for template runs
+# ---------------------------------------------------------------------------------------------------------------------
+class OutputStore:
+    """
+    Base class for template output stores. Records are dicts with an `id` (the combination ID),
+    `template_params`, `request` and optionally `response` or `error`.
+    """
+
+    def write(self, record: Dict) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class DirectoryStore(OutputStore):
+    """
+    One JSON file per combination under `<out>/<model>/`, pretty-printed unless `pretty` is off. Records
+    of a multi-model run go to `<out>/<model1>__vs__<model2>/`.
+    """
+
+    def __init__(self, out: Path, pretty: bool = True):
+        self.out = out
+        self.pretty = pretty
+
+    def write(self, record: Dict) -> None:
+        models = record.get("models") or [
+            record["request"].get("model", "unknown_model")
+        ]
+        model_name = "__vs__".join(models).replace("/", "_")
+        model_dir = self.out / model_name
+        model_dir.mkdir(parents=True, exist_ok=True)
+        # the combination ID keeps names unique when timestamps collide in fast loops
+        out_file = model_dir / f"{datetime.now().timestamp()}-{record['id']}.json"
+        body = {k: v for k, v in record.items() if k != "id"}
+        out_file.write_text(dumps_pretty(body) if self.pretty else dumps(body))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class JsonlStore(OutputStore):
+    """
+    All records appended to a single JSONL file, stream-compressed when the name ends in `.gz` or `.zst`.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open_file(path, "w")
+
+    def write(self, record: Dict) -> None:
+        self._f.write(dumps(record) + "\n")
+
+    def close(self) -> None:
+        self._f.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class SQLiteStore(OutputStore):
+    """
+    Records in a SQLite table keyed (and indexed) by combination ID.
+    """
+
+    def __init__(self, path: Path, commit_every: int = 1000):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("DROP TABLE IF EXISTS records")
+        self.conn.execute(
+            "CREATE TABLE records (id TEXT PRIMARY KEY, model TEXT, record TEXT NOT NULL)"
+        )
+        self.commit_every = commit_every
+        self._pending = 0
+
+    def write(self, record: Dict) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO records (id, model, record) VALUES (?, ?, ?)",
+            (record["id"], record["request"].get("model"), dumps(record)),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def is_sqlite(path: Path) -> bool:
+    return path.suffix in (".sqlite", ".sqlite3", ".db")
+
+
+def open_store(
+    out: Path, store: Optional[Path] = None, pretty: bool = True
+) -> OutputStore:
+    """
+    Open an output store. Without `store` the per-file directory layout under `out` is used,
+    otherwise the backend is chosen by extension: `.jsonl`, `.jsonl.gz`, `.jsonl.zst` or `.sqlite`/`.db`.
+    """
+    if store is None:
+        return DirectoryStore(out, pretty)
+    if is_sqlite(store):
+        return SQLiteStore(store)
+    if store.name.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst")):
+        return JsonlStore(store)
+    raise ValueError(f"Unsupported output store: {store}")
+
+
+def read_records(path: Path) -> Iterator[Dict]:
+    """
+    Stream records back from any output store. Directory stores yield one record per JSON file,
+    using the file name as the record ID.
+    """
+    if path.is_dir():
+        for f in sorted(path.glob("**/*.json")):
+            record = loads(f.read_bytes())
+            record.setdefault("id", f.name)
+            yield record
+    elif is_sqlite(path):
+        conn = sqlite3.connect(path)
+        try:
+            for (record,) in conn.execute("SELECT record FROM records ORDER BY id"):
+                yield loads(record)
+        finally:
+            conn.close()
+    else:
+        with open_file(path) as f:
+            for line in f:
+                if line.strip():
+                    yield loads(line)
+
+
+def get_record(path: Path, record_id: str) -> Optional[Dict]:
+    """
+    Look up a single record by combination ID. SQLite stores use their primary key and plain JSONL stores
+    a sidecar offset index (`<file>.id.idx`, built on first use); compressed JSONL and directory stores
+    are scanned linearly.
+    """
+    if path.is_file() and path.suffix == ".jsonl":
+        with OffsetIndex(path, key="id") as index:
+            record = index.get(record_id)
+        return record if record is not None and record.get("id") == record_id else None
+    if is_sqlite(path):
+        conn = sqlite3.connect(path)
+        try:
+            row = conn.execute(
+                "SELECT record FROM records WHERE id = ?", (record_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return loads(row[0]) if row else None
+    for record in read_records(path):
+        if record.get("id") == record_id:
+            return record
+    return None
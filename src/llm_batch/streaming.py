@@ -0,0 +1,78 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import litellm
+
+from llm_batch.clients import completion_options
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Streaming completions
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class StreamResult:
+    # the assembled response, shaped like a non-streaming chat completion
+    response: Dict
+    latency: float
+    # seconds to the first content chunk; None when nothing was generated
+    ttft: Optional[float] = None
+    # completion tokens per second after the first chunk
+    tokens_per_second: Optional[float] = None
+
+
+def chunk_text(chunk) -> Optional[str]:
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return None
+    return getattr(choices[0].delta, "content", None)
+
+
+def stream_completion(
+    chat_params: Dict, partial: Optional[Path] = None
+) -> StreamResult:
+    """
+    Run a chat completion with `stream=True` and assemble the chunks into a regular response, timing the
+    first token. With `partial`, the text is appended to that file as it arrives; the file is removed once
+    the response is complete and kept (with what was received) if the stream fails.
+    """
+    start = time.perf_counter()
+    ttft = None
+    chunks = []
+    out = open(partial, "w") if partial else None
+    try:
+        stream = litellm.completion(
+            **chat_params,
+            stream=True,
+            stream_options={"include_usage": True},
+            **completion_options(chat_params),
+        )
+        for chunk in stream:
+            chunks.append(chunk)
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            if out:
+                out.write(text)
+                out.flush()
+    finally:
+        if out:
+            out.close()
+    latency = time.perf_counter() - start
+    response = litellm.stream_chunk_builder(
+        chunks, messages=chat_params.get("messages")
+    ).json()  # type: ignore
+    if partial:
+        partial.unlink()
+
+    completion_tokens = (response.get("usage") or {}).get("completion_tokens") or 0
+    generating = latency - ttft if ttft is not None else 0.0
+    return StreamResult(
+        response=response,
+        latency=latency,
+        ttft=ttft,
+        tokens_per_second=completion_tokens / generating if generating > 0 else None,
+    )
@@ -0,0 +1,290 @@
+import math
+import time
+from array import array
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from llm_batch import backoff
+from llm_batch.serialization import dumps
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Per-request events
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class RequestEvent:
+    id: str
+    source: str
+    status: str = "ok"
+    model: Optional[str] = None
+    latency: Optional[float] = None
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cache_hit: bool = False
+    request_id: Optional[str] = None
+    error: Optional[str] = None
+    # streamed requests only: seconds to the first token and completion tokens per second after it
+    ttft: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def event_from_response(id: str, source: str, response: Dict, **kwargs) -> RequestEvent:
+    """
+    Build an event from an OpenAI chat completion or an Anthropic message body.
+    """
+    usage = response.get("usage") or {}
+    if "input_tokens" in usage:  # Anthropic
+        prompt_tokens = usage.get("input_tokens") or 0
+        completion_tokens = usage.get("output_tokens") or 0
+        cached_tokens = usage.get("cache_read_input_tokens") or 0
+    else:
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get(
+            "cached_tokens"
+        ) or 0
+    kwargs.setdefault("request_id", response.get("id"))
+    return RequestEvent(
+        id=id,
+        source=source,
+        model=response.get("model"),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached_tokens=cached_tokens,
+        cache_hit=cached_tokens > 0,
+        **kwargs,
+    )
+
+
+def event_from_batch_result(result: Dict, source: str) -> RequestEvent:
+    """
+    Build an event from one line of an OpenAI batch output/error file or an Anthropic batch results file.
+    """
+    custom_id = result.get("custom_id", "")
+    if "response" in result:  # OpenAI
+        response = result.get("response") or {}
+        body = response.get("body") or {}
+        ok = response.get("status_code") == 200
+        request_id = response.get("request_id")
+        error = None if ok else dumps(result.get("error") or body.get("error"))
+    else:  # Anthropic
+        outcome = result.get("result")
+        outcome = outcome if isinstance(outcome, dict) else {}
+        ok = outcome.get("type") == "succeeded"
+        body = outcome.get("message") or {}
+        request_id = body.get("id")
+        error = None if ok else dumps(outcome.get("error") or outcome.get("type"))
+    if not ok:
+        return RequestEvent(
+            id=custom_id,
+            source=source,
+            status="error",
+            request_id=request_id,
+            error=error,
+        )
+    return event_from_response(custom_id, source, body, request_id=request_id)
+
+
+def percentile(values, q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not values:
+        return None
+    rank = max(math.ceil(q / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+class Telemetry:
+    """
+    Collects request events for a run: optionally streams them to a JSONL file, and keeps running totals
+    for the end-of-run summary and the OpenMetrics dump.
+    """
+
+    def __init__(self, events: Optional[Path] = None):
+        self._events = open(events, "a") if events else None
+        self.started = time.perf_counter()
+        self.latencies = array("d")
+        self.ttfts = array("d")
+        self.generation_rates = array("d")
+        self.status: Counter = Counter()
+        self.models: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self.retries = 0
+        self.cache_hits = 0
+        self._backoff_start = Counter(backoff.counts)
+
+    def record(self, event: RequestEvent) -> None:
+        if self._events:
+            self._events.write(dumps(asdict(event)) + "\n")
+        self.status[event.status] += 1
+        self.models[event.model or "unknown"] += 1
+        self.tokens["prompt"] += event.prompt_tokens
+        self.tokens["completion"] += event.completion_tokens
+        self.tokens["cached"] += event.cached_tokens
+        self.retries += event.retries
+        self.cache_hits += event.cache_hit
+        if event.latency is not None:
+            self.latencies.append(event.latency)
+        if event.ttft is not None:
+            self.ttfts.append(event.ttft)
+        if event.tokens_per_second is not None:
+            self.generation_rates.append(event.tokens_per_second)
+
+    def close(self) -> None:
+        if self._events:
+            self._events.close()
+            self._events = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def retry_counts(self) -> Counter:
+        """Retries by error class, fast failures and circuit-breaker rejections during this run."""
+        return Counter(backoff.counts) - self._backoff_start
+
+    # -----------------------------------------------------------------------------------------------------------------
+    def summary(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        ttfts = sorted(self.ttfts)
+        total = sum(self.status.values())
+        return {
+            "requests": total,
+            "errors": total - self.status["ok"],
+            "retries": self.retries,
+            "retry_counts": dict(self.retry_counts()),
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.tokens["prompt"],
+            "completion_tokens": self.tokens["completion"],
+            "cached_tokens": self.tokens["cached"],
+            "elapsed": elapsed,
+            "throughput": total / elapsed if elapsed else 0.0,
+            "tokens_per_second": (
+                (self.tokens["prompt"] + self.tokens["completion"]) / elapsed
+                if elapsed
+                else 0.0
+            ),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+            "ttft_p99": percentile(ttfts, 99),
+            "generation_tokens_per_second": (
+                sum(self.generation_rates) / len(self.generation_rates)
+                if self.generation_rates
+                else None
+            ),
+        }
+
+    def print_summary(self, console: Console) -> None:
+        s = self.summary()
+        table = Table(title="Run summary", show_header=False)
+        table.add_row(
+            "requests",
+            f"{s['requests']:,} ({s['errors']:,} errors, {s['retries']:,} retries)",
+        )
+        if s["retry_counts"]:
+            table.add_row(
+                "retry policy",
+                ", ".join(f"{k}: {v:,}" for k, v in sorted(s["retry_counts"].items())),
+            )
+        table.add_row(
+            "throughput",
+            f"{s['throughput']:,.2f} req/s, {s['tokens_per_second']:,.0f} tokens/s",
+        )
+        table.add_row(
+            "tokens",
+            f"{s['prompt_tokens']:,} prompt / {s['completion_tokens']:,} completion / {s['cached_tokens']:,} cached",
+        )
+        if s["latency_p50"] is not None:
+            table.add_row(
+                "latency",
+                f"p50 {s['latency_p50']:.2f}s  p95 {s['latency_p95']:.2f}s  p99 {s['latency_p99']:.2f}s",
+            )
+        if s["ttft_p50"] is not None:
+            table.add_row(
+                "time to first token",
+                f"p50 {s['ttft_p50']:.2f}s  p95 {s['ttft_p95']:.2f}s  p99 {s['ttft_p99']:.2f}s",
+            )
+        if s["generation_tokens_per_second"] is not None:
+            table.add_row(
+                "generation", f"{s['generation_tokens_per_second']:,.1f} tokens/s per request"
+            )
+        table.add_row("elapsed", f"{s['elapsed']:.1f}s")
+        console.print(table)
+
+    def write_openmetrics(self, path: Path) -> None:
+        """
+        Write the run metrics in the OpenMetrics text format (readable by the Prometheus textfile collector).
+        """
+        s = self.summary()
+        lines = ["# TYPE llm_batch_requests counter"]
+        lines += [
+            f'llm_batch_requests_total{{status="{k}"}} {v}'
+            for k, v in sorted(self.status.items())
+        ]
+        lines += ["# TYPE llm_batch_model_requests counter"]
+        lines += [
+            f'llm_batch_model_requests_total{{model="{k}"}} {v}'
+            for k, v in sorted(self.models.items())
+        ]
+        lines += [
+            "# TYPE llm_batch_retries counter",
+            f"llm_batch_retries_total {self.retries}",
+        ]
+        lines += ["# TYPE llm_batch_retry_policy_events counter"]
+        lines += [
+            f'llm_batch_retry_policy_events_total{{event="{k}"}} {v}'
+            for k, v in sorted(s["retry_counts"].items())
+        ]
+        lines += [
+            "# TYPE llm_batch_cache_hits counter",
+            f"llm_batch_cache_hits_total {self.cache_hits}",
+        ]
+        lines += ["# TYPE llm_batch_tokens counter"]
+        lines += [
+            f'llm_batch_tokens_total{{type="{k}"}} {v}'
+            for k, v in sorted(self.tokens.items())
+        ]
+        lines += ["# TYPE llm_batch_request_latency_seconds summary"]
+        for q in (50, 95, 99):
+            value = s[f"latency_p{q}"]
+            if value is not None:
+                lines.append(
+                    f'llm_batch_request_latency_seconds{{quantile="{q / 100}"}} {value}'
+                )
+        lines += [
+            f"llm_batch_request_latency_seconds_sum {sum(self.latencies)}",
+            f"llm_batch_request_latency_seconds_count {len(self.latencies)}",
+        ]
+        if self.ttfts:
+            lines += ["# TYPE llm_batch_time_to_first_token_seconds summary"]
+            lines += [
+                f'llm_batch_time_to_first_token_seconds{{quantile="{q / 100}"}} {s[f"ttft_p{q}"]}'
+                for q in (50, 95, 99)
+            ]
+            lines += [
+                f"llm_batch_time_to_first_token_seconds_sum {sum(self.ttfts)}",
+                f"llm_batch_time_to_first_token_seconds_count {len(self.ttfts)}",
+            ]
+        lines += [
+            "# TYPE llm_batch_run_seconds gauge",
+            f"llm_batch_run_seconds {s['elapsed']}",
+            "# EOF",
+        ]
+        # write-then-rename so a collector never reads a half-written file
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text("\n".join(lines) + "\n")
+        tmp.replace(path)
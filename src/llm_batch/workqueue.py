@@ -0,0 +1,366 @@
+import asyncio
+import math
+import os
+import re
+import socket
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import jinja2
+import yaml
+
+from llm_batch import CONFIG, api, logger
+from llm_batch.serialization import dumps, loads, loads_lenient
+from llm_batch.store import open_store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (status, id);
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------
+def combination_count(data: Dict[str, List]) -> int:
+    return math.prod(len(values) for values in data.values())
+
+
+def combinations(data: Dict[str, List], start: int, stop: int) -> Iterator[Dict]:
+    """
+    Combinations `start` to `stop` of the cartesian product of the template data, in `template` order.
+    Each one is computed from its index, read as a mixed-radix number whose digits index the value lists
+    (the last key varies fastest), so a shard never walks the combinations before its `start`.
+    """
+    keys = list(data.keys())
+    columns = list(data.values())
+    for index in range(start, min(stop, combination_count(data))):
+        values = []
+        for column in reversed(columns):
+            index, digit = divmod(index, len(column))
+            values.append(column[digit])
+        yield dict(zip(keys, reversed(values)))
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseLostError(RuntimeError):
+    """Raised when a worker's shard was handed to another worker after its lease expired."""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+@dataclass
+class Shard:
+    id: int
+    start: int
+    stop: int
+    attempts: int
+    worker: str
+
+
+class WorkQueue:
+    """
+    Combination ranges of one template run in a SQLite database in WAL mode, on local or shared disk.
+    Workers claim a shard in a write transaction, so no two get the same one; a shard whose worker stops
+    sending heartbeats for `lease` seconds is handed out again, up to `max_attempts` times. WAL needs shared
+    memory between the workers; on network file systems set `queue.journal_mode` to DELETE.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        lease: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        create: bool = False,
+    ):
+        if not create and not path.exists():
+            raise FileNotFoundError(f"Work queue {path} does not exist")
+        config = CONFIG.get("queue") or {}
+        self.path = path
+        self.lease = config.get("lease", 300.0) if lease is None else lease
+        self.max_attempts = max_attempts or config.get("max_attempts", 3)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute(f"PRAGMA journal_mode={config.get('journal_mode', 'WAL')}")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def create(
+        cls, path: Path, template: Path, data: Path, chunk_size: Optional[int] = None
+    ) -> "WorkQueue":
+        """Create a queue with one shard per `chunk_size` combinations of `template` and `data`."""
+        if path.exists():
+            raise FileExistsError(f"Work queue {path} already exists")
+        chunk_size = chunk_size or (CONFIG.get("queue") or {}).get("chunk_size", 100)
+        queue = cls(path, create=True)
+        total = combination_count(yaml.safe_load(data.read_text()))
+        with queue.transaction():
+            queue.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("template", str(template.resolve())),
+                    ("data", str(data.resolve())),
+                    ("total", str(total)),
+                    ("chunk_size", str(chunk_size)),
+                ],
+            )
+            queue.conn.executemany(
+                "INSERT INTO shards (start, stop) VALUES (?, ?)",
+                [
+                    (start, min(start + chunk_size, total))
+                    for start in range(0, total, chunk_size)
+                ],
+            )
+        return queue
+
+    def transaction(self):
+        return _Transaction(self.conn)
+
+    @property
+    def meta(self) -> Dict[str, str]:
+        return dict(self.conn.execute("SELECT key, value FROM meta"))
+
+    def claim(self, worker: str) -> Optional[Shard]:
+        """Claim the next pending shard, or one whose lease expired; None when there is nothing left."""
+        now = time.time()
+        with self.transaction():
+            row = self.conn.execute(
+                "SELECT id, start, stop, attempts FROM shards WHERE status = 'pending' "
+                "OR (status = 'claimed' AND heartbeat < ?) ORDER BY id LIMIT 1",
+                (now - self.lease,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE shards SET status = 'claimed', worker = ?, heartbeat = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker, now, row[0]),
+            )
+        return Shard(row[0], row[1], row[2], row[3] + 1, worker)
+
+    # Updates of a claimed shard only apply while the worker still holds it: once its lease expired and the
+    # shard was claimed again (or finished by the new worker), they return False and change nothing.
+    def heartbeat(self, shard: Shard) -> bool:
+        return self._update(shard, "heartbeat = ?", time.time())
+
+    def complete(self, shard: Shard, output: Path) -> bool:
+        # absolute, so merges from another working directory (or machine sharing the disk) find it
+        return self._update(
+            shard, "status = 'done', output = ?, error = NULL", str(output.resolve())
+        )
+
+    def fail(self, shard: Shard, error: str) -> bool:
+        """Put a shard back in the queue, or mark it failed after `max_attempts`."""
+        status = "failed" if shard.attempts >= self.max_attempts else "pending"
+        return self._update(shard, "status = ?, error = ?", status, error)
+
+    def _update(self, shard: Shard, assignments: str, *values) -> bool:
+        cursor = self.conn.execute(
+            f"UPDATE shards SET {assignments} "
+            "WHERE id = ? AND worker = ? AND status = 'claimed'",
+            (*values, shard.id, shard.worker),
+        )
+        return cursor.rowcount == 1
+
+    def counts(self) -> Dict[str, int]:
+        counts = {"pending": 0, "claimed": 0, "done": 0, "failed": 0}
+        counts.update(
+            self.conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status")
+        )
+        return counts
+
+    def outputs(self) -> List[Tuple[int, Optional[str]]]:
+        return self.conn.execute(
+            "SELECT id, output FROM shards WHERE status = 'done' ORDER BY id"
+        ).fetchall()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _Transaction:
+    """`BEGIN IMMEDIATE` ... `COMMIT`: takes the write lock up front, so claims never interleave."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, *exc) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Workers
+# ---------------------------------------------------------------------------------------------------------------------
+def shards_dir(queue_path: Path) -> Path:
+    return queue_path.with_name(f"{queue_path.stem}-shards")
+
+
+async def run_shard(
+    queue: WorkQueue,
+    shard: Shard,
+    template: jinja2.Template,
+    data: Dict[str, List],
+    out: Path,
+    execute: bool,
+    concurrency: int,
+) -> Path:
+    """
+    Render the shard's combinations and, with `execute`, run them with bounded concurrency. Records are
+    written to the shard file as a whole (via a temporary file of this worker's own) so a crashed worker
+    never leaves half a shard behind. Raises `LeaseLostError`, and stops the calls, as soon as a heartbeat
+    finds the shard was handed to another worker.
+    """
+    records: Dict[str, Dict] = {}
+    for idx, combination in enumerate(
+        combinations(data, shard.start, shard.stop), start=shard.start
+    ):
+        record_id = f"{idx + 1:05d}"
+        records[record_id] = {
+            "id": record_id,
+            "template_params": combination,
+            "request": loads_lenient(template.render(**combination)),
+        }
+
+    async def beat() -> None:
+        while True:
+            await asyncio.sleep(queue.lease / 3)
+            if not queue.heartbeat(shard):
+                raise LeaseLostError(
+                    f"shard {shard.id} was handed to another worker after the lease of {shard.worker} expired"
+                )
+
+    async def run() -> None:
+        requests = (api.batch_request(r["id"], r["request"]) for r in records.values())
+        async for result in api.execute(requests, concurrency=concurrency):
+            record = records[result["custom_id"]]
+            if "response" in result:
+                record["response"] = result["response"]
+            else:
+                record["error"] = result["error"]
+
+    if execute:
+        work = asyncio.create_task(run())
+        heartbeat = asyncio.create_task(beat())
+        try:
+            await asyncio.wait({work, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            if heartbeat.done():
+                heartbeat.result()
+            await work
+        finally:
+            work.cancel()
+            heartbeat.cancel()
+
+    out.mkdir(parents=True, exist_ok=True)
+    path = out / f"shard-{shard.id:06d}.jsonl"
+    # per worker and process: a worker that lost its lease may still be writing the same shard
+    owner = re.sub(r"[^\w.-]", "_", shard.worker)
+    tmp = path.with_name(f"{path.name}.{owner}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        for record in records.values():
+            f.write(dumps(record) + "\n")
+    tmp.replace(path)
+    return path
+
+
+def run_worker(
+    queue_path: Path,
+    out: Optional[Path] = None,
+    worker: Optional[str] = None,
+    execute: bool = True,
+    concurrency: int = 16,
+    lease: Optional[float] = None,
+    max_shards: Optional[int] = None,
+) -> int:
+    """
+    Claim and run shards until the queue is drained (or `max_shards` were run); returns the shards run.
+    Shard files go to `out`, by default `<queue>-shards/` next to the queue.
+    """
+    worker = worker or default_worker_id()
+    out = out or shards_dir(queue_path)
+    done = 0
+    with WorkQueue(queue_path, lease=lease) as queue:
+        meta = queue.meta
+        template_path = Path(meta["template"])
+        environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(str(template_path.parent)),
+            undefined=jinja2.StrictUndefined,
+        )
+        template = environment.get_template(template_path.name)
+        data = yaml.safe_load(Path(meta["data"]).read_text())
+        while max_shards is None or done < max_shards:
+            shard = queue.claim(worker)
+            if shard is None:
+                break
+            try:
+                path = asyncio.run(
+                    run_shard(queue, shard, template, data, out, execute, concurrency)
+                )
+            except LeaseLostError as e:
+                # the shard is another worker's now; failing it would change nothing
+                logger.warning(str(e))
+                continue
+            except Exception as e:
+                queue.fail(shard, f"{type(e).__name__}: {e}")
+                continue
+            if queue.complete(shard, path):
+                done += 1
+    return done
+
+
+def run_workers(queue_path: Path, processes: int, **kwargs) -> int:
+    """`run_worker` in several local processes; returns the shards run by all of them."""
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(run_worker, queue_path, **kwargs) for _ in range(processes)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def merge(queue_path: Path, store: Path, partial: bool = False) -> int:
+    """
+    Concatenate the shard files, in combination order, into one output store; returns the record count.
+    Refuses while shards are unfinished unless `partial` is set.
+    """
+    with WorkQueue(queue_path) as queue:
+        counts = queue.counts()
+        unfinished = counts["pending"] + counts["claimed"] + counts["failed"]
+        if unfinished and not partial:
+            raise RuntimeError(
+                f"{unfinished} shards are not done ({counts}); use partial to merge anyway"
+            )
+        outputs = queue.outputs()
+    count = 0
+    with open_store(store.parent, store) as output:
+        for _, path in outputs:
+            with open(path) as f:  # type: ignore
+                for line in f:
+                    if line.strip():
+                        output.write(loads(line))
+                        count += 1
+    return count
@@ -3,8 +3,9 @@ import tempfile
 import json
 import yaml
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 from llm_batch import CONFIG
+from llm_batch.mock_server import MockConfig, MockProviderServer
 
 
 @pytest.fixture
@@ -116,6 +117,50 @@ def mock_openai_client():
         yield mock_instance
 
 
+async def async_iter(items):
+    for item in items:
+        yield item
+
+
+@pytest.fixture
+def mock_async_openai_client():
+    """
+    Mock AsyncOpenAI client of the async API, which the send and fetch commands run on.
+    Set `file_lines` to the lines of the batch files it downloads, or to a dict of lines by file ID.
+    """
+
+    def content(file_id):
+        lines = mock_instance.file_lines
+        response = MagicMock()
+        response.__aenter__.return_value.iter_lines = lambda: async_iter(
+            lines[file_id] if isinstance(lines, dict) else lines
+        )
+        return response
+
+    with patch("openai.AsyncOpenAI") as mock_client:
+        mock_instance = AsyncMock()
+        mock_instance.file_lines = []
+        mock_instance.files.with_streaming_response.content = Mock(side_effect=content)
+        mock_client.return_value = mock_instance
+        yield mock_instance
+
+
+@pytest.fixture
+def mock_async_anthropic_client():
+    """
+    Mock AsyncAnthropic client of the async API, which the send and fetch commands run on.
+    Set `results` to the batch results it streams.
+    """
+    with patch("llm_batch.api.AsyncAnthropic") as mock_client:
+        mock_instance = AsyncMock()
+        mock_instance.results = []
+        mock_instance.messages.batches.results.side_effect = lambda *args: async_iter(
+            mock_instance.results
+        )
+        mock_client.return_value = mock_instance
+        yield mock_instance
+
+
 @pytest.fixture
 def mock_anthropic_client():
     """Mock Anthropic client for testing."""
@@ -136,3 +181,20 @@ def mock_litellm():
 def sample_config():
     """Sample configuration for testing."""
     return CONFIG
+
+
+@pytest.fixture
+def mock_providers():
+    """Run the mock provider server and point the configured base URLs at it."""
+    with MockProviderServer(config=MockConfig(seed=0)) as server:
+        config = {
+            "openai": {"base_url": f"{server.url}/v1"},
+            "anthropic": {"base_url": server.url},
+        }
+        with (
+            patch.dict(CONFIG, {"providers": config}),
+            patch.dict(
+                "os.environ", {"OPENAI_API_KEY": "test", "ANTHROPIC_API_KEY": "test"}
+            ),
+        ):
+            yield server
@@ -0,0 +1,251 @@
+import json
+import pytest
+from unittest.mock import patch
+from llm_batch.analyze import analyze, detect, expand, scan
+from llm_batch.cli import analyze as analyze_command, app
+from llm_batch.store import open_store
+
+
+def chat(model, finish_reason, prompt_tokens, completion_tokens):
+    return {
+        "model": model,
+        "choices": [{"finish_reason": finish_reason, "message": {"content": "x"}}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        },
+    }
+
+
+RECORDS = [
+    {
+        "id": "00001",
+        "template_params": {"size": 1, "tone": "plain"},
+        "request": {"model": "gpt-4o-mini"},
+        "response": chat("gpt-4o-mini", "stop", 10, 5),
+    },
+    {
+        "id": "00002",
+        "template_params": {"size": 2, "tone": "plain"},
+        "request": {"model": "gpt-4o-mini"},
+        "response": chat("gpt-4o-mini", "length", 20, 50),
+    },
+    {
+        "id": "00003",
+        "template_params": {"size": 2, "tone": "formal"},
+        "request": {"model": "gpt-4o-mini"},
+        "error": "rate limited",
+    },
+]
+OPENAI_RESULTS = [
+    {
+        "custom_id": "id_00001",
+        "response": {"status_code": 200, "body": chat("gpt-4o", "stop", 7, 3)},
+        "error": None,
+    },
+    {
+        "custom_id": "id_00002",
+        "response": {"status_code": 400, "body": {"error": {"message": "bad"}}},
+        "error": None,
+    },
+]
+ANTHROPIC_RESULTS = [
+    {
+        "custom_id": "id_00003",
+        "result": {
+            "type": "succeeded",
+            "message": {
+                "model": "claude-3-haiku-20240307",
+                "stop_reason": "end_turn",
+                "content": [{"type": "text", "text": "x"}],
+                "usage": {"input_tokens": 4, "output_tokens": 6},
+            },
+        },
+    },
+    {"custom_id": "id_00004", "result": {"type": "expired"}},
+]
+EVENTS = [
+    {
+        "id": "00001",
+        "source": "template",
+        "status": "ok",
+        "model": "gpt-4o-mini",
+        "latency": latency,
+    }
+    for latency in (0.1, 0.2, 0.3, 0.4)
+]
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows))
+    return path
+
+
+@pytest.fixture
+def responses(temp_dir):
+    write_jsonl(temp_dir / "run.jsonl", RECORDS)
+    write_jsonl(temp_dir / "openai-results.jsonl", OPENAI_RESULTS)
+    write_jsonl(temp_dir / "anthropic-results.jsonl", ANTHROPIC_RESULTS)
+    write_jsonl(temp_dir / "events.jsonl", EVENTS)
+    return temp_dir
+
+
+class TestAnalyze:
+    """Test the analyses of response sets."""
+
+    def test_detect(self):
+        """Test telling the kinds of response files apart."""
+        assert detect(RECORDS[0]) == "template"
+        assert detect({**RECORDS[0], "models": ["a", "b"]}) == "fanout"
+        assert detect(OPENAI_RESULTS[0]) == "openai"
+        assert detect(ANTHROPIC_RESULTS[0]) == "anthropic"
+        assert detect(EVENTS[0]) == "events"
+        with pytest.raises(ValueError):
+            detect({"foo": 1})
+
+    def test_expand(self, responses):
+        """Test glob patterns and missing files."""
+        assert len(expand([str(responses / "*.jsonl")])) == 4
+        assert expand([str(responses / "run.jsonl")] * 2) == [responses / "run.jsonl"]
+        with pytest.raises(FileNotFoundError):
+            expand([str(responses / "missing-*.jsonl")])
+
+    def test_scan(self, responses):
+        """Test normalizing all kinds of response files into one frame."""
+        frames = scan([str(responses / "*.jsonl")])
+        df = frames["responses"].collect()
+        assert len(df) == 7
+        assert frames["events"].collect()["latency"].to_list() == [0.1, 0.2, 0.3, 0.4]
+        errors = dict(
+            df.filter(df["status"] == "error").select("id", "error").iter_rows()
+        )
+        assert errors == {
+            "00003": "rate limited",
+            "id_00002": "bad",
+            "id_00004": "expired",
+        }
+        claude = df.filter(df["model"] == "claude-3-haiku-20240307").row(0, named=True)
+        assert claude["finish_reason"] == "end_turn"
+        assert (claude["prompt_tokens"], claude["completion_tokens"]) == (4, 6)
+
+    def test_template_run(self, responses):
+        """Test the tables of a template run with its telemetry events."""
+        results = analyze(
+            [str(responses / "run.jsonl"), str(responses / "events.jsonl")]
+        )
+        assert set(results) == {
+            "finish_reasons",
+            "token_usage",
+            "error_rates",
+            "by_size",
+            "by_tone",
+            "latency",
+        }
+        finish = {
+            r["finish_reason"]: r["share"] for r in results["finish_reasons"].to_dicts()
+        }
+        assert finish == {"stop": 0.5, "length": 0.5}
+        usage = results["token_usage"].row(0, named=True)
+        assert (usage["prompt_tokens"], usage["completion_tokens"]) == (30, 55)
+        errors = results["error_rates"].row(0, named=True)
+        assert (errors["requests"], errors["errors"], errors["top_error"]) == (
+            3,
+            1,
+            "rate limited",
+        )
+        by_size = {r["size"]: r for r in results["by_size"].to_dicts()}
+        assert by_size["2"]["error_rate"] == 0.5
+        assert by_size["2"]["truncated"] == 0.5
+        latency = results["latency"].row(0, named=True)
+        assert (latency["latency_p50"], latency["latency_p99"]) == (0.3, 0.4)
+
+    def test_stores(self, temp_dir):
+        """Test directory, SQLite and compressed stores."""
+        for store in (None, temp_dir / "run.sqlite", temp_dir / "run.jsonl.gz"):
+            with open_store(temp_dir / "dir", store) as output:
+                for record in RECORDS:
+                    output.write(record)
+        for path in (
+            temp_dir / "dir",
+            temp_dir / "run.sqlite",
+            temp_dir / "run.jsonl.gz",
+        ):
+            results = analyze([str(path)], by=["tone"])
+            assert results["error_rates"]["requests"].to_list() == [3]
+            assert sorted(results["by_tone"]["tone"].to_list()) == ["formal", "plain"]
+
+    def test_fanout(self, temp_dir):
+        """Test that multi-model records give one row per model."""
+        record = {
+            "id": "00001",
+            "template_params": {"size": 1},
+            "request": {"model": "gpt-4o"},
+            "models": ["gpt-4o-mini", "claude-3-haiku-20240307"],
+            "responses": {"gpt-4o-mini": chat("gpt-4o-mini", "stop", 1, 2)},
+            "errors": {"claude-3-haiku-20240307": "overloaded"},
+        }
+        results = analyze([str(write_jsonl(temp_dir / "fanout.jsonl", [record]))])
+        rates = {r["model"]: r["error_rate"] for r in results["error_rates"].to_dicts()}
+        assert rates == {"gpt-4o-mini": 0.0, "claude-3-haiku-20240307": 1.0}
+
+    def test_batch_params(self, responses):
+        """Test joining the template parameters of batch results from their template store."""
+        results = analyze(
+            [str(responses / "*-results.jsonl")],
+            params=responses / "run.jsonl",
+            by=["tone"],
+        )
+        by_tone = {r["tone"]: r["requests"] for r in results["by_tone"].to_dicts()}
+        assert by_tone == {None: 1, "plain": 2, "formal": 1}
+        # the model of failed batch requests comes from the request
+        assert "gpt-4o-mini" in results["error_rates"]["model"].to_list()
+        with pytest.raises(ValueError):
+            analyze([str(responses / "run.jsonl")], by=["missing"])
+
+    def test_anthropic_positions(self, responses):
+        """Test that positional Anthropic custom IDs are mapped through the submitted requests file."""
+        results = write_jsonl(
+            responses / "positional-results.jsonl",
+            [
+                {**r, "custom_id": f"id-{i}"}
+                for i, r in enumerate(reversed(ANTHROPIC_RESULTS))
+            ],
+        )
+        requests = write_jsonl(
+            responses / "batch-valid.jsonl",
+            [{"custom_id": "id_00002"}, {"custom_id": "id_00003"}],
+        )
+        with pytest.raises(ValueError, match="keyed by position"):
+            analyze([str(results)], params=responses / "run.jsonl")
+
+        tables = analyze(
+            [str(results)], params=responses / "run.jsonl", requests=requests
+        )
+        by_tone = {r["tone"]: r["requests"] for r in tables["by_tone"].to_dicts()}
+        assert by_tone == {"formal": 1, "plain": 1}
+
+    @patch("llm_batch.cli.console")
+    def test_command(self, mock_console, responses):
+        """Test the analyze command and its JSON output."""
+        output = responses / "analysis.json"
+        analyze_command([str(responses / "*.jsonl")], output=output)
+        tables = json.loads(output.read_text())
+        assert {"finish_reasons", "token_usage", "error_rates", "latency"} <= set(
+            tables
+        )
+        assert mock_console.print.called
+
+    @patch("llm_batch.cli.console")
+    def test_command_params(self, mock_console, responses):
+        """Test `analyze --params` through the CLI, without --output."""
+        app(
+            [
+                "analyze",
+                str(responses / "*-results.jsonl"),
+                "--params",
+                str(responses / "run.jsonl"),
+            ]
+        )
+        tables = [c[0][0] for c in mock_console.print.call_args_list]
+        assert not any("No batch result" in str(t) for t in tables)
+        assert mock_console.print.called
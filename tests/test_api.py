@@ -0,0 +1,123 @@
+import pytest
+import asyncio
+import gzip
+import json
+from unittest.mock import patch
+from llm_batch import api
+from llm_batch.cli import make
+from llm_batch.records import RecordError
+
+
+class TestAPI:
+    """Test the async Python API."""
+
+    def test_iter_requests_directory(self, temp_dir, sample_json_files):
+        """Test that request files are turned into batch request lines."""
+        (temp_dir / "broken.json").write_text("{ not json")
+
+        requests = sorted(api.iter_requests(temp_dir), key=lambda r: r["custom_id"])
+
+        assert [r["custom_id"] for r in requests] == [
+            "id_request1.json",
+            "id_request2.json",
+        ]
+        assert requests[0]["body"]["model"] == "gpt-3.5-turbo"
+
+    @patch("llm_batch.cli.console")
+    def test_make_matches_cli(self, mock_console, temp_dir, sample_json_files):
+        """Test that the API and `batch make` write the same file, sharing one pipeline."""
+        (temp_dir / "copy.json").write_text(sample_json_files[0].read_text())
+        options = dict(dedup=True, cache_order=True, compression="gzip")
+
+        batch_file = asyncio.run(api.make(temp_dir, temp_dir / "api", "run", **options))
+        make(temp_dir, temp_dir / "cli", "run", **options)
+
+        assert batch_file == temp_dir / "api" / "run-requests.jsonl.gz"
+        cli_file = temp_dir / "cli" / batch_file.name
+        assert gzip.decompress(batch_file.read_bytes()) == gzip.decompress(
+            cli_file.read_bytes()
+        )
+        fanout = (temp_dir / "api" / "run-fanout.jsonl").read_text().splitlines()
+        assert len(fanout) == 1
+
+    @pytest.mark.parametrize("provider", ["openai", "anthropic"])
+    def test_make_send_poll_fetch(
+        self, mock_providers, temp_dir, sample_json_files, provider
+    ):
+        """Test the full batch workflow from one event loop."""
+
+        async def workflow():
+            batch_file = await api.make(temp_dir, temp_dir / "out", "api")
+            batch_id = await api.send(batch_file, provider=provider)
+            batch = await api.poll(
+                batch_id, provider=provider, interval=0.01, timeout=5
+            )
+            results = [r async for r in api.fetch(batch_id, provider=provider)]
+            return batch_file, batch, results
+
+        batch_file, batch, results = asyncio.run(workflow())
+
+        assert len(batch_file.read_text().splitlines()) == 2
+        assert len(results) == 2
+        if provider == "openai":
+            assert batch.status == "completed"
+            assert results[0]["response"]["status_code"] == 200
+        else:
+            assert batch.processing_status == "ended"
+            assert results[0]["result"]["type"] == "succeeded"
+
+    def test_send_validates_and_dedups(self, mock_providers, temp_dir):
+        """Test that send validates and deduplicates like the CLI, and fetch fans results back out."""
+        request = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+        batch_file = temp_dir / "run-requests.jsonl"
+        batch_file.write_text(
+            "".join(
+                json.dumps(api.batch_request(f"id_{i}", request)) + "\n"
+                for i in range(3)
+            )
+            + '{"custom_id": "bad"}\n'
+        )
+
+        with pytest.raises(RecordError, match="line 4"):
+            asyncio.run(api.send(batch_file))
+
+        async def workflow():
+            batch_id = await api.send(batch_file, strict=False, dedup=True)
+            await api.poll(batch_id, interval=0.01, timeout=5)
+            fanout = temp_dir / "run-fanout.jsonl"
+            return [r async for r in api.fetch(batch_id, fanout=fanout)]
+
+        results = asyncio.run(workflow())
+
+        (batch,) = mock_providers.batches.values()
+        assert batch["request_counts"]["total"] == 1
+        assert [r["custom_id"] for r in results] == ["id_0", "id_1", "id_2"]
+        assert "bad" in (temp_dir / "run-quarantine.jsonl").read_text()
+
+    def test_poll_timeout(self, mock_providers, sample_batch_file):
+        """Test that poll gives up after the timeout."""
+        mock_providers.config.batch_delay = 60
+
+        async def workflow():
+            batch_id = await api.send(sample_batch_file, provider="anthropic")
+            await api.poll(batch_id, provider="anthropic", interval=0.01, timeout=0.1)
+
+        with pytest.raises(TimeoutError):
+            asyncio.run(workflow())
+
+    def test_execute(self, mock_providers, sample_batch_file):
+        """Test concurrent synchronous execution through litellm."""
+        requests = list(api.read_batch_file(sample_batch_file))
+        for request in requests:
+            request["body"]["model"] = "openai/" + request["body"]["model"]
+
+        async def run():
+            return [r async for r in api.execute(requests, concurrency=2)]
+
+        results = asyncio.run(run())
+
+        assert sorted(r["custom_id"] for r in results) == [
+            "id_request1.json",
+            "id_request2.json",
+        ]
+        assert all(r["response"]["choices"][0]["message"]["content"] for r in results)
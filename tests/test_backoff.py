@@ -0,0 +1,163 @@
+import pytest
+import asyncio
+import time
+import httpx
+import litellm
+from email.utils import formatdate
+from unittest.mock import AsyncMock, patch
+from tenacity import Retrying
+from llm_batch import CONFIG, api, backoff
+from llm_batch.backoff import (
+    CircuitBreaker,
+    CircuitOpenError,
+    classify,
+    retry_after,
+    retry_options,
+)
+from llm_batch.fanout import run_requests
+from llm_batch.clients import completion_options
+from llm_batch.telemetry import Telemetry
+
+FAST = {"max_attempts": 3, "min_wait": 0.0, "max_wait": 0.0, "breaker_threshold": 2}
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.litellm_response_headers = httpx.Headers(headers or {})
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    """Circuit breakers are per process; start every test with closed ones."""
+    backoff.breakers.clear()
+    yield
+    backoff.breakers.clear()
+
+
+class TestBackoff:
+    """Test retry classification, Retry-After and circuit breakers."""
+
+    @pytest.mark.parametrize(
+        "exc, kind",
+        [
+            (StatusError(400), "fatal"),
+            (StatusError(401), "fatal"),
+            (StatusError(422), "fatal"),
+            (StatusError(408), "transient"),
+            (StatusError(429), "rate_limit"),
+            (StatusError(503), "server"),
+            (httpx.ConnectError("refused"), "transient"),
+            (
+                litellm.APIConnectionError("reset", llm_provider="openai", model="m"),
+                "transient",
+            ),
+            (litellm.Timeout("slow", llm_provider="openai", model="m"), "transient"),
+            (TimeoutError(), "transient"),
+            (ValueError("bad template"), "fatal"),
+            (CircuitOpenError("open"), "fatal"),
+        ],
+    )
+    def test_classify(self, exc, kind):
+        """Test the error classes."""
+        assert classify(exc) == kind
+
+    def test_retry_after(self):
+        """Test the Retry-After header forms."""
+        assert retry_after(StatusError(429, {"retry-after": "2.5"})) == 2.5
+        assert retry_after(StatusError(429, {"retry-after-ms": "300"})) == 0.3
+        date = formatdate(time.time() + 30, usegmt=True)
+        assert 20 < retry_after(StatusError(429, {"Retry-After": date})) <= 30
+        assert retry_after(StatusError(429)) is None
+        assert retry_after(ValueError()) is None
+
+    def test_circuit_breaker(self):
+        """Test that consecutive server errors open the breaker until the cooldown ends."""
+        breaker = CircuitBreaker("openai", threshold=2, cooldown=0.05)
+        breaker.failure(StatusError(500))
+        breaker.failure(StatusError(429))  # not a server error
+        breaker.check()
+        breaker.failure(StatusError(502))
+        with pytest.raises(CircuitOpenError, match="openai"):
+            breaker.check()
+        time.sleep(0.06)
+        breaker.check()
+        breaker.success()
+        assert (breaker.failures, breaker.is_open) == (0, False)
+
+    def test_breaker_logs_state_changes(self, caplog):
+        """Test that opening, reopening and closing the breaker are each logged."""
+        breaker = CircuitBreaker("openai", threshold=1, cooldown=0.01)
+        with caplog.at_level("WARNING", logger="llm_batch"):
+            breaker.failure(StatusError(500))
+            breaker.failure(StatusError(500))  # still open: no new message
+            time.sleep(0.02)
+            breaker.failure(StatusError(500))
+            breaker.success()
+            breaker.success()
+        messages = [r.getMessage() for r in caplog.records]
+        assert [m.split(" for ")[0] for m in messages] == [
+            "circuit breaker opened",
+            "circuit breaker reopened",
+            "circuit breaker closed",
+        ]
+
+    def test_fast_fail(self):
+        """Test that a bad request is not retried."""
+        completion = AsyncMock(side_effect=StatusError(400))
+        records = [{"id": "00001", "request": {"model": "gpt-4o-mini"}}]
+
+        async def collect():
+            return [r async for r in run_requests(records)]
+
+        with patch("llm_batch.fanout.litellm.acompletion", completion):
+            (record,) = asyncio.run(collect())
+        assert record["error"] == "HTTP 400"
+        assert completion.call_count == 1
+
+    def test_honours_retry_after(self, mock_providers):
+        """Test that 429s wait for Retry-After instead of the exponential backoff."""
+        mock_providers.config.rate_limit_rate = 1.0
+        mock_providers.config.retry_after = 0.05
+        telemetry = Telemetry()
+        body = {"model": "gpt-4o-mini", "max_tokens": 5, "messages": []}
+        start = time.monotonic()
+        with pytest.raises(Exception) as e:
+            for attempt in Retrying(**retry_options(3)):
+                with attempt:
+                    litellm.completion(
+                        **body, **completion_options(body), max_retries=0
+                    )
+        assert classify(e.value) == "rate_limit"
+        assert time.monotonic() - start < 1.0
+        assert telemetry.retry_counts()["retry_rate_limit"] == 2
+
+    def test_breaker_in_execute(self, mock_providers):
+        """Test that the synchronous executor fails fast once a provider's breaker is open."""
+        mock_providers.config.error_rate = 1.0
+        requests = [
+            api.batch_request(
+                f"id_{i}",
+                {
+                    "model": "gpt-4o-mini",
+                    "max_tokens": 5,
+                    "messages": [],
+                    "max_retries": 0,
+                },
+            )
+            for i in range(4)
+        ]
+
+        async def collect():
+            return [r async for r in api.execute(requests, concurrency=1)]
+
+        telemetry = Telemetry()
+        with patch.dict(CONFIG, {"retries": FAST}):
+            results = asyncio.run(collect())
+
+        # two server errors open the breaker; no further calls reach the provider
+        assert mock_providers.request_count == 2
+        assert all("circuit breaker open" in r["error"] for r in results)
+        counts = telemetry.summary()["retry_counts"]
+        assert (counts["retry_server"], counts["circuit_open"]) == (2, 4)
@@ -1,9 +1,10 @@
 import pytest
-import json
 import os
 from pathlib import Path
-from unittest.mock import patch, Mock
+import httpx
+from unittest.mock import AsyncMock, patch, Mock
 from llm_batch.batch_anthropic import send, fetch, check
+from llm_batch.cli import app
 
 
 class TestAnthropicBatch:
@@ -11,14 +12,11 @@ class TestAnthropicBatch:
 
     @patch("llm_batch.batch_anthropic.console")
     @patch("llm_batch.batch_anthropic.logger")
-    @patch("llm_batch.batch_anthropic.Anthropic")
     def test_send_batch_success(
-        self, mock_anthropic_class, mock_logger, mock_console, sample_batch_file
+        self, mock_logger, mock_console, sample_batch_file, mock_async_anthropic_client
     ):
         """Test successful batch upload."""
-        # Mock the Anthropic client
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        mock_client = mock_async_anthropic_client
 
         # Mock the batch response
         mock_batch_response = Mock()
@@ -30,7 +28,6 @@ class TestAnthropicBatch:
         send(batch_file=sample_batch_file)
 
         # Verify Anthropic client was called correctly
-        mock_anthropic_class.assert_called_once()
         mock_client.messages.batches.create.assert_called_once()
 
         # Verify the requests were created correctly
@@ -68,14 +65,11 @@ class TestAnthropicBatch:
 
     @patch("llm_batch.batch_anthropic.console")
     @patch("llm_batch.batch_anthropic.logger")
-    @patch("llm_batch.batch_anthropic.Anthropic")
     def test_fetch_batch_success(
-        self, mock_anthropic_class, mock_logger, mock_console, temp_dir
+        self, mock_logger, mock_console, temp_dir, mock_async_anthropic_client
     ):
         """Test successful batch results fetching."""
-        # Mock the Anthropic client
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        mock_client = mock_async_anthropic_client
 
         # Mock the results response
         mock_result1 = Mock()
@@ -88,7 +82,7 @@ class TestAnthropicBatch:
             '{"custom_id": "id-1", "result": "response2"}'
         )
 
-        mock_client.messages.batches.results.return_value = [mock_result1, mock_result2]
+        mock_client.results = [mock_result1, mock_result2]
 
         out_dir = temp_dir / "output"
         batch_id = "msgbatch_123"  # Use valid Anthropic batch ID format
@@ -107,10 +101,7 @@ class TestAnthropicBatch:
         assert "response2" in content
 
         # Verify Anthropic client was called correctly
-        mock_anthropic_class.assert_called_once()
-        mock_client.messages.batches.results.assert_called_once_with(
-            message_batch_id=batch_id
-        )
+        mock_client.messages.batches.results.assert_called_once_with(batch_id)
 
         # Verify console and logger were called
         assert mock_console.print.call_count >= 1
@@ -176,17 +167,12 @@ class TestAnthropicBatch:
 
     @patch("llm_batch.batch_anthropic.console")
     @patch("llm_batch.batch_anthropic.logger")
-    @patch("llm_batch.batch_anthropic.Anthropic")
     def test_send_batch_anthropic_error(
-        self, mock_anthropic_class, mock_logger, mock_console, sample_batch_file
+        self, mock_logger, mock_console, sample_batch_file, mock_async_anthropic_client
     ):
         """Test handling Anthropic API errors."""
-        # Mock the Anthropic client
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
         # Mock Anthropic client to raise an exception
-        mock_client.messages.batches.create.side_effect = Exception(
+        mock_async_anthropic_client.messages.batches.create.side_effect = Exception(
             "Anthropic API error"
         )
 
@@ -196,31 +182,27 @@ class TestAnthropicBatch:
 
     @patch("llm_batch.batch_anthropic.console")
     @patch("llm_batch.batch_anthropic.logger")
-    @patch("llm_batch.batch_anthropic.Anthropic")
     def test_send_batch_invalid_json(
-        self, mock_anthropic_class, mock_logger, mock_console, temp_dir
+        self, mock_logger, mock_console, temp_dir, mock_async_anthropic_client
     ):
-        """Test sending batch with invalid JSON in batch file."""
+        """Test that invalid JSON in the batch file is reported and nothing is sent."""
         # Create invalid batch file
         invalid_batch_file = temp_dir / "invalid-batch.jsonl"
         invalid_batch_file.write_text("invalid json content\n")
 
-        with pytest.raises(json.JSONDecodeError):
-            send(batch_file=invalid_batch_file)
+        send(batch_file=invalid_batch_file)
+
+        mock_async_anthropic_client.messages.batches.create.assert_not_called()
+        assert "line 1:" in mock_console.print.call_args_list[0][0][0]
 
     @patch("llm_batch.batch_anthropic.console")
     @patch("llm_batch.batch_anthropic.logger")
-    @patch("llm_batch.batch_anthropic.Anthropic")
     def test_fetch_batch_no_results(
-        self, mock_anthropic_class, mock_logger, mock_console, temp_dir
+        self, mock_logger, mock_console, temp_dir, mock_async_anthropic_client
     ):
         """Test fetching batch with no results."""
-        # Mock the Anthropic client
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
         # Mock empty results
-        mock_client.messages.batches.results.return_value = []
+        mock_async_anthropic_client.results = []
 
         out_dir = temp_dir / "output"
         batch_id = "msgbatch_123"  # Use valid Anthropic batch ID format
@@ -234,13 +216,24 @@ class TestAnthropicBatch:
         assert output_file.exists()
         assert output_file.read_text() == ""
 
+    @patch("llm_batch.batch_anthropic.console")
+    @patch("llm_batch.batch_anthropic.logger")
+    def test_fetch_command_line(
+        self, mock_logger, mock_console, temp_dir, mock_async_anthropic_client
+    ):
+        """Test that fetch parses its command line with the optional arguments left out."""
+
+        app(["batch", "anthropic", "fetch", "msgbatch_123", "--out", str(temp_dir)])
+
+        assert (temp_dir / "batch-responses.jsonl").exists()
+
     @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test_key"})
-    @patch("llm_batch.batch_anthropic.Anthropic")
+    @patch("llm_batch.api.AsyncAnthropic")
     def test_anthropic_client_initialization(
         self, mock_anthropic_class, sample_batch_file
     ):
         """Test that Anthropic client is initialized with API key."""
-        mock_client = Mock()
+        mock_client = AsyncMock()
         mock_anthropic_class.return_value = mock_client
 
         # Mock successful batch creation
@@ -250,5 +243,8 @@ class TestAnthropicBatch:
 
         send(batch_file=sample_batch_file)
 
-        # Verify Anthropic client was initialized with API key
-        mock_anthropic_class.assert_called_once_with(api_key="test_key")
+        # Verify Anthropic client was initialized with API key and an async connection pool
+        mock_anthropic_class.assert_called_once()
+        kwargs = mock_anthropic_class.call_args.kwargs
+        assert kwargs["api_key"] == "test_key"
+        assert isinstance(kwargs["http_client"], httpx.AsyncClient)
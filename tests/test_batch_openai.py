@@ -3,6 +3,7 @@ import json
 from pathlib import Path
 from unittest.mock import patch, Mock
 from llm_batch.batch_openai import send, fetch, check
+from llm_batch.cli import app
 
 
 class TestOpenAIBatch:
@@ -11,7 +12,7 @@ class TestOpenAIBatch:
     @patch("llm_batch.batch_openai.console")
     @patch("llm_batch.batch_openai.logger")
     def test_send_batch_success(
-        self, mock_logger, mock_console, sample_batch_file, mock_openai_client
+        self, mock_logger, mock_console, sample_batch_file, mock_async_openai_client
     ):
         """Test successful batch upload."""
         # Mock the OpenAI client responses
@@ -21,15 +22,15 @@ class TestOpenAIBatch:
         mock_batch_response = Mock()
         mock_batch_response.id = "batch_456"
 
-        mock_openai_client.files.create.return_value = mock_file_response
-        mock_openai_client.batches.create.return_value = mock_batch_response
+        mock_async_openai_client.files.create.return_value = mock_file_response
+        mock_async_openai_client.batches.create.return_value = mock_batch_response
 
         # Test the send function
         send(batch_file=sample_batch_file, description="Test batch")
 
         # Verify OpenAI client was called correctly
-        mock_openai_client.files.create.assert_called_once()
-        mock_openai_client.batches.create.assert_called_once_with(
+        mock_async_openai_client.files.create.assert_called_once()
+        mock_async_openai_client.batches.create.assert_called_once_with(
             input_file_id="file_123",
             endpoint="/v1/chat/completions",
             completion_window="24h",
@@ -43,20 +44,18 @@ class TestOpenAIBatch:
     @patch("llm_batch.batch_openai.console")
     @patch("llm_batch.batch_openai.logger")
     def test_fetch_batch_completed(
-        self, mock_logger, mock_console, mock_openai_client, temp_dir
+        self, mock_logger, mock_console, mock_async_openai_client, temp_dir
     ):
         """Test fetching completed batch results."""
         # Mock the batch response
         mock_batch_response = Mock()
         mock_batch_response.status = "completed"
         mock_batch_response.output_file_id = "output_file_123"
+        mock_batch_response.error_file_id = None
 
         # Mock the file content response
-        mock_file_response = Mock()
-        mock_file_response.text = '{"result": "test response"}'
-
-        mock_openai_client.batches.retrieve.return_value = mock_batch_response
-        mock_openai_client.files.content.return_value = mock_file_response
+        mock_async_openai_client.file_lines = ['{"result": "test response"}']
+        mock_async_openai_client.batches.retrieve.return_value = mock_batch_response
 
         out_dir = temp_dir / "output"
         batch_id = "batch_123"
@@ -71,20 +70,22 @@ class TestOpenAIBatch:
         assert output_file.read_text() == '{"result": "test response"}'
 
         # Verify OpenAI client was called correctly
-        mock_openai_client.batches.retrieve.assert_called_once_with(batch_id)
-        mock_openai_client.files.content.assert_called_once_with("output_file_123")
+        mock_async_openai_client.batches.retrieve.assert_called_with(batch_id)
+        mock_async_openai_client.files.with_streaming_response.content.assert_called_once_with(
+            "output_file_123"
+        )
 
     @patch("llm_batch.batch_openai.console")
     @patch("llm_batch.batch_openai.logger")
     def test_fetch_batch_not_completed(
-        self, mock_logger, mock_console, mock_openai_client
+        self, mock_logger, mock_console, mock_async_openai_client
     ):
         """Test fetching batch that is not completed."""
         # Mock the batch response
         mock_batch_response = Mock()
         mock_batch_response.status = "in_progress"
 
-        mock_openai_client.batches.retrieve.return_value = mock_batch_response
+        mock_async_openai_client.batches.retrieve.return_value = mock_batch_response
 
         batch_id = "batch_123"
 
@@ -92,10 +93,24 @@ class TestOpenAIBatch:
         fetch(batch_id=batch_id)
 
         # Verify OpenAI client was called
-        mock_openai_client.batches.retrieve.assert_called_once_with(batch_id)
+        mock_async_openai_client.batches.retrieve.assert_called_once_with(batch_id)
 
         # Verify file content was not called (since batch is not completed)
-        mock_openai_client.files.content.assert_not_called()
+        mock_async_openai_client.files.with_streaming_response.content.assert_not_called()
+
+    @patch("llm_batch.batch_openai.console")
+    @patch("llm_batch.batch_openai.logger")
+    def test_fetch_command_line(
+        self, mock_logger, mock_console, mock_async_openai_client
+    ):
+        """Test that fetch parses its command line with the optional arguments left out."""
+        mock_batch_response = Mock()
+        mock_batch_response.status = "in_progress"
+        mock_async_openai_client.batches.retrieve.return_value = mock_batch_response
+
+        app(["batch", "openai", "fetch", "batch_123"])
+
+        mock_async_openai_client.batches.retrieve.assert_called_once_with("batch_123")
 
     @patch("llm_batch.batch_openai.console")
     def test_check_batches(self, mock_console, mock_openai_client):
@@ -146,11 +161,13 @@ class TestOpenAIBatch:
     @patch("llm_batch.batch_openai.console")
     @patch("llm_batch.batch_openai.logger")
     def test_send_batch_openai_error(
-        self, mock_logger, mock_console, sample_batch_file, mock_openai_client
+        self, mock_logger, mock_console, sample_batch_file, mock_async_openai_client
     ):
         """Test handling OpenAI API errors."""
         # Mock OpenAI client to raise an exception
-        mock_openai_client.files.create.side_effect = Exception("OpenAI API error")
+        mock_async_openai_client.files.create.side_effect = Exception(
+            "OpenAI API error"
+        )
 
         # Should handle the exception gracefully
         with pytest.raises(Exception):
@@ -0,0 +1,139 @@
+import json
+from unittest.mock import Mock, patch
+from llm_batch.api import batch_request, build_requests
+from llm_batch.batch_anthropic import send
+from llm_batch.caching import (
+    CacheReport,
+    anthropic_layout,
+    cache_order,
+    count_tokens,
+    order_requests,
+    plan_prefixes,
+)
+
+SYSTEM = "You are a careful annotator. " * 300
+
+
+def body(user, system=SYSTEM, model="claude-3-5-haiku-latest"):
+    messages = [{"role": "user", "content": user}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+    return {"model": model, "max_tokens": 50, "messages": messages}
+
+
+class TestCaching:
+    """Test prompt-caching-aware request layout."""
+
+    def test_count_tokens(self):
+        """Test the offline token estimate."""
+        assert count_tokens("hello world") == 2
+        assert count_tokens(SYSTEM) > 1024
+
+    def test_plan_prefixes(self):
+        """Test that only prefixes shared by several requests and long enough get a breakpoint."""
+        bodies = [
+            body("a"),
+            body("b"),
+            body("c", system="short and shared"),
+            body("d", system="short and shared"),
+            body("e", model="claude-sonnet-4-0"),
+        ]
+        plans = plan_prefixes(bodies)
+
+        assert plans[0].segment == 0 and plans[0].key == plans[1].key
+        assert plans[0].tokens > 1024
+        # shared but under the minimum, and long but on another model
+        assert [p.segment for p in plans[2:]] == [None, None, None]
+        assert plan_prefixes(bodies[2:4], min_tokens=1)[0].segment == 0
+
+    def test_plan_prefixes_memoizes_tokens(self):
+        """Test that a prefix shared by many requests is tokenized once."""
+        bodies = [body(str(idx)) for idx in range(20)]
+        with patch("llm_batch.caching.count_tokens", wraps=count_tokens) as counter:
+            plans = plan_prefixes(bodies)
+
+        # the shared system prompt once, then each distinct user message
+        assert counter.call_count == 21
+        assert len({plan.tokens for plan in plans}) == 1
+
+    def test_cache_order(self):
+        """Test that requests sharing a prefix are grouped at the first member's position."""
+        bodies = [
+            body("a"),
+            body("b", system="x"),
+            body("c"),
+            body("d", system="y"),
+            body("e"),
+        ]
+        assert cache_order(plan_prefixes(bodies)) == [0, 2, 4, 1, 3]
+
+    def test_report(self):
+        """Test the cached-token savings estimate."""
+        plans = plan_prefixes([body("a"), body("b"), body("c")])
+        report = CacheReport.from_plans(plans)
+
+        assert report.requests == 3
+        assert report.prefix_groups == 1
+        assert report.shared_requests == 3
+        assert report.cached_tokens == 2 * plans[0].tokens
+        assert 0.5 < report.savings < 1
+
+    def test_order_requests(self):
+        """Test reordering batch request lines."""
+        requests = [
+            batch_request("id_1", body("a")),
+            batch_request("id_2", body("b", system="other")),
+            batch_request("id_3", body("c")),
+        ]
+        ordered, report = order_requests(requests)
+        assert [r["custom_id"] for r in ordered] == ["id_1", "id_3", "id_2"]
+        assert report.prefix_groups == 1
+
+    def test_anthropic_layout(self):
+        """Test that system messages move to `system` with a breakpoint after the shared prefix."""
+        bodies = [body("a"), body("b")]
+        plan = plan_prefixes(bodies)[0]
+        layout = anthropic_layout(bodies[0], plan)
+
+        assert layout["system"] == [
+            {"type": "text", "text": SYSTEM, "cache_control": {"type": "ephemeral"}}
+        ]
+        assert layout["messages"] == [{"role": "user", "content": "a"}]
+        # the input body is not modified
+        assert bodies[0]["messages"][0]["content"] == SYSTEM
+
+        layout = anthropic_layout(bodies[0])
+        assert layout["system"] == [{"type": "text", "text": SYSTEM}]
+
+    def test_build_requests_keeps_positional_ids(self):
+        """Test that reordered Anthropic requests keep the custom_id of their batch file position."""
+        lines = [
+            batch_request("x", body("a")),
+            batch_request("y", body("b", system=None)),
+            batch_request("z", body("c")),
+        ]
+        requests = build_requests(
+            lines, plan_prefixes([line["body"] for line in lines])
+        )
+
+        assert [r["custom_id"] for r in requests] == ["id-0", "id-2", "id-1"]
+        assert "cache_control" in requests[1]["params"]["system"][-1]
+        assert "system" not in requests[2]["params"]
+
+    @patch("llm_batch.batch_anthropic.console")
+    def test_send_no_cache(self, mock_console, temp_dir, mock_async_anthropic_client):
+        """Test that `--no-cache` keeps the batch order and adds no breakpoints."""
+        mock_client = mock_async_anthropic_client
+        mock_client.messages.batches.create.return_value = Mock(id="msgbatch_1")
+        batch_file = temp_dir / "batch-requests.jsonl"
+        batch_file.write_text(
+            "\n".join(
+                json.dumps(batch_request(f"id_{i}", body(str(i)))) for i in range(2)
+            )
+        )
+
+        send(batch_file=batch_file, cache=False)
+
+        requests = mock_client.messages.batches.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == ["id-0", "id-1"]
+        assert "cache_control" not in requests[0]["params"]["system"][-1]
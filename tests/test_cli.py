@@ -2,7 +2,7 @@ import pytest
 import json
 from pathlib import Path
 from unittest.mock import patch, Mock, MagicMock
-from llm_batch.cli import make, config, pdf2text, template, extract_combinations
+from llm_batch.cli import app, make, config, pdf2text, template, extract_combinations
 
 
 class TestCLI:
@@ -245,3 +245,48 @@ class TestCLI:
                 out=output_file,
                 execute=False,
             )
+
+    @patch("llm_batch.cli.console")
+    def test_template_store_to_make(self, mock_console, temp_dir):
+        """Test that template output written to a single store can be made into a batch."""
+        template_file = temp_dir / "test_template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o", "messages": [{"role": "user", "content": "Hello {{ name }}"}]}'
+        )
+        data_file = temp_dir / "test_data.yml"
+        data_file.write_text("name: [John, Jane, Joe]\n")
+        store = temp_dir / "output" / "records.jsonl.gz"
+
+        template(template=template_file, data=data_file, out=temp_dir / "output", store=store)
+
+        assert store.exists()
+        assert not (temp_dir / "output" / "gpt-4o").exists()
+
+        make(in_dir=store, out=temp_dir / "batch", batch_name="store")
+        lines = (temp_dir / "batch" / "store-requests.jsonl").read_text().split("\n")
+        requests = [json.loads(line) for line in lines]
+        assert [r["custom_id"] for r in requests] == ["id_00001", "id_00002", "id_00003"]
+        assert requests[2]["body"]["messages"][0]["content"] == "Hello Joe"
+
+    @patch("llm_batch.cli.console")
+    def test_template_command_line(self, mock_console, temp_dir):
+        """Test that the template command parses its command line with the optional arguments left out."""
+        template_file = temp_dir / "test_template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o", "messages": [{"role": "user", "content": "Hello {{ name }}"}]}'
+        )
+        data_file = temp_dir / "test_data.yml"
+        data_file.write_text("name: [John, Jane]\n")
+        out_dir = temp_dir / "output"
+
+        app(
+            [
+                "template",
+                str(template_file),
+                str(data_file),
+                "--out",
+                str(out_dir),
+            ]
+        )
+
+        assert len(list((out_dir / "gpt-4o").glob("*.json"))) == 2
@@ -0,0 +1,126 @@
+import pytest
+import asyncio
+import httpx
+import litellm
+from unittest.mock import patch
+from llm_batch import CONFIG
+from llm_batch.clients import (
+    aclose_clients,
+    acompletion_options,
+    async_http_client,
+    client_options,
+    completion_options,
+    http2_available,
+    http_client,
+    http_options,
+    litellm_client,
+    use_shared_pool,
+)
+
+
+class TestClients:
+    """Test the shared client factory and connection pools."""
+
+    def test_http_options_from_config(self):
+        """Test that pool limits and timeouts come from config.yml."""
+        http = {
+            "timeout": 30,
+            "connect_timeout": 2,
+            "max_connections": 7,
+            "http2": False,
+        }
+        with patch.dict(CONFIG, {"http": http}):
+            options = http_options()
+
+        assert options["timeout"] == httpx.Timeout(30, connect=2)
+        assert options["limits"].max_connections == 7
+        assert options["http2"] is False
+
+    def test_sync_pool_is_shared(self):
+        """Test that every sync client gets the same connection pool."""
+        assert client_options("openai")["http_client"] is http_client()
+        assert client_options("anthropic")["http_client"] is http_client()
+
+    def test_async_pool_per_event_loop(self):
+        """Test that async pools are shared within, but not across, event loops."""
+
+        async def pools():
+            return async_http_client(), client_options("openai", asynchronous=True)
+
+        first, options = asyncio.run(pools())
+        second, _ = asyncio.run(pools())
+
+        assert options["http_client"] is first
+        assert first is not second
+
+    def test_http2_without_h2(self, caplog):
+        """Test that HTTP/2 falls back to HTTP/1.1 with a warning when h2 is missing."""
+        http2_available.cache_clear()
+        try:
+            with (
+                patch.dict(CONFIG, {"http": {"http2": True}}),
+                patch("importlib.util.find_spec", return_value=None),
+            ):
+                assert http_options()["http2"] is False
+            assert "h2 package is not installed" in caplog.text
+        finally:
+            http2_available.cache_clear()
+
+    def test_aclose_clients(self):
+        """Test that only the pool of the running loop is closed with it."""
+        other = httpx.AsyncClient()
+
+        async def run():
+            pool = async_http_client()
+            handler = litellm_client("anthropic")
+            await aclose_clients()
+            await aclose_clients()
+            return pool, handler, litellm_client("anthropic")
+
+        try:
+            pool, handler, after = asyncio.run(run())
+            assert pool.is_closed
+            assert after is not handler
+            assert not other.is_closed
+        finally:
+            asyncio.run(other.aclose())
+
+    def test_acompletion_options(self):
+        """Test that async litellm calls get a client over the loop's pool instead of a global session."""
+
+        async def options(body):
+            result = acompletion_options(body), async_http_client()
+            await aclose_clients()
+            return result
+
+        with patch.dict("os.environ", {"OPENAI_API_KEY": "test"}):
+            openai_options, pool = asyncio.run(options({"model": "gpt-4o"}))
+        assert openai_options["client"]._client is pool
+        anthropic_options, pool = asyncio.run(
+            options({"model": "claude-3-5-haiku-latest"})
+        )
+        assert anthropic_options["client"].client is pool
+        assert (
+            "client" not in asyncio.run(options({"model": "gpt-4o", "api_key": "k"}))[0]
+        )
+        assert litellm.aclient_session is None
+
+    def test_base_url_options(self):
+        """Test that configured base URLs reach the SDK clients and litellm."""
+        providers = {"openai": {"base_url": "http://localhost:9/v1"}}
+        with patch.dict(CONFIG, {"providers": providers}):
+            assert client_options("openai")["base_url"] == "http://localhost:9/v1"
+            assert "base_url" not in client_options("anthropic")
+            assert completion_options({"model": "gpt-4o"}) == {
+                "api_base": "http://localhost:9/v1"
+            }
+            assert completion_options({"model": "gpt-4o", "api_base": "x"}) == {}
+
+    def test_use_shared_pool(self):
+        """Test that litellm is routed through the shared pool."""
+        previous = litellm.client_session
+        try:
+            use_shared_pool()
+            assert litellm.client_session is http_client()
+        finally:
+            litellm.client_session = previous
@@ -0,0 +1,146 @@
+import json
+from unittest.mock import Mock, patch
+from llm_batch.api import batch_request
+from llm_batch.cli import app, make
+from llm_batch.dedup import (
+    Deduplicator,
+    expand_results,
+    fanout_path,
+    read_fanout,
+    request_key,
+)
+
+
+def body(content, **kwargs):
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": content}],
+        **kwargs,
+    }
+
+
+def write_lines(path, items):
+    path.write_text("\n".join(json.dumps(item) for item in items))
+
+
+class TestDedup:
+    """Test request deduplication and result fan-out."""
+
+    def test_request_key_is_canonical(self):
+        """Test that key order does not change the digest but content does."""
+        a = {"model": "gpt-4o", "max_tokens": 10, "messages": []}
+        b = {"messages": [], "max_tokens": 10, "model": "gpt-4o"}
+        assert request_key(a) == request_key(b)
+        assert request_key(a) != request_key({**a, "max_tokens": 11})
+
+    def test_fanout_path(self, temp_dir):
+        """Test the fan-out map location next to a batch file."""
+        assert fanout_path(temp_dir / "run-requests.jsonl").name == "run-fanout.jsonl"
+        assert (
+            fanout_path(temp_dir / "test-batch.jsonl").name == "test-batch-fanout.jsonl"
+        )
+
+    def test_unique_writes_fanout(self, temp_dir):
+        """Test that duplicates are dropped and mapped to the request that was kept."""
+        requests = [
+            batch_request("a", body("x")),
+            batch_request("b", body("y")),
+            batch_request("c", body("x")),
+            batch_request("d", body("x")),
+        ]
+        fanout = temp_dir / "fanout.jsonl"
+        with open(fanout, "w") as f:
+            dedup = Deduplicator(f)
+            kept = list(dedup.unique(requests))
+
+        assert [r["custom_id"] for r in kept] == ["a", "b"]
+        assert (dedup.total, dedup.unique_count, dedup.duplicate_count) == (4, 2, 2)
+        entries = [json.loads(line) for line in fanout.read_text().splitlines()]
+        assert entries == [
+            {"custom_id": "c", "canonical": "a", "index": 0},
+            {"custom_id": "d", "canonical": "a", "index": 0},
+        ]
+        assert read_fanout(fanout) == {"a": ["c", "d"], "id-0": ["c", "d"]}
+
+    def test_expand_results(self, temp_dir):
+        """Test that results are copied to duplicates, keyed by custom_id or Anthropic position."""
+        fanout = temp_dir / "fanout.jsonl"
+        write_lines(
+            fanout,
+            [
+                {"custom_id": "id_3", "canonical": "id_1", "index": 0},
+                {"custom_id": "id_4", "canonical": "id_2", "index": 1},
+            ],
+        )
+        openai_results = [
+            {"custom_id": "id_1", "response": {"body": "one"}},
+            {"custom_id": "id_2", "response": {"body": "two"}},
+        ]
+        expanded = list(expand_results(openai_results, fanout))
+        assert [(r["custom_id"], r["response"]["body"]) for r in expanded] == [
+            ("id_1", "one"),
+            ("id_3", "one"),
+            ("id_2", "two"),
+            ("id_4", "two"),
+        ]
+
+        anthropic_results = [{"custom_id": "id-1", "result": {"type": "succeeded"}}]
+        expanded = list(expand_results(anthropic_results, fanout))
+        assert [r["custom_id"] for r in expanded] == ["id-1", "id_4"]
+
+    @patch("llm_batch.cli.console")
+    def test_make_dedup_and_expand(self, mock_console, temp_dir):
+        """Test `batch make --dedup` followed by `batch expand` on the results, through the CLI."""
+        in_dir = temp_dir / "in"
+        in_dir.mkdir()
+        for name, content in [("a", "same"), ("b", "same"), ("c", "other")]:
+            (in_dir / f"{name}.json").write_text(json.dumps({"request": body(content)}))
+        out_dir = temp_dir / "out"
+
+        make(in_dir=in_dir, out=out_dir, batch_name="run", dedup=True)
+
+        requests = (out_dir / "run-requests.jsonl").read_text().splitlines()
+        assert len(requests) == 2
+        fanout = out_dir / "run-fanout.jsonl"
+        assert len(fanout.read_text().splitlines()) == 1
+
+        results = out_dir / "run-responses.jsonl"
+        write_lines(
+            results,
+            [
+                {"custom_id": json.loads(line)["custom_id"], "response": {}}
+                for line in requests
+            ],
+        )
+        app(["batch", "expand", str(results), str(fanout)])
+
+        expanded = out_dir / "run-responses-expanded.jsonl"
+        ids = {
+            json.loads(line)["custom_id"] for line in expanded.read_text().splitlines()
+        }
+        assert ids == {"id_a.json", "id_b.json", "id_c.json"}
+
+    @patch("llm_batch.batch_openai.console")
+    @patch("llm_batch.batch_openai.logger")
+    def test_openai_send_dedup(
+        self, mock_logger, mock_console, temp_dir, mock_async_openai_client
+    ):
+        """Test that `send --dedup` uploads only the unique requests."""
+        from llm_batch.batch_openai import send
+
+        batch_file = temp_dir / "run-requests.jsonl"
+        write_lines(
+            batch_file,
+            [batch_request(f"id_{i}", body("same")) for i in range(3)],
+        )
+        mock_async_openai_client.files.create.return_value = Mock(id="file_123")
+        mock_async_openai_client.batches.create.return_value = Mock(id="batch_456")
+
+        send(batch_file=batch_file, dedup=True)
+
+        uploaded = mock_async_openai_client.files.create.call_args.kwargs["file"]
+        assert uploaded.name == str(temp_dir / "run-requests.unique.jsonl")
+        assert (
+            len((temp_dir / "run-requests.unique.jsonl").read_text().splitlines()) == 1
+        )
+        assert len((temp_dir / "run-fanout.jsonl").read_text().splitlines()) == 2
@@ -0,0 +1,227 @@
+import ast
+import base64
+import json
+import struct
+import pytest
+from unittest.mock import Mock, patch
+from llm_batch import api
+from llm_batch.batch_openai import fetch, fetch_embeddings, send
+from llm_batch.cli import app
+from llm_batch.embeddings import (
+    NPY_HEADER,
+    NpyWriter,
+    embedding_requests,
+    load_embeddings,
+    split_text,
+    text_sources,
+    vector_bytes,
+    write_embeddings,
+)
+from llm_batch.records import Validator
+
+TEXT = " ".join(f"word{i}" for i in range(100))
+
+
+def read_npy(path):
+    """Shape and rows of a float32 .npy file, read without numpy."""
+    data = path.read_bytes()
+    assert data[:8] == b"\x93NUMPY\x01\x00"
+    (header_len,) = struct.unpack("<H", data[8:10])
+    header = ast.literal_eval(data[10 : 10 + header_len].decode())
+    assert header["descr"] == "<f4" and not header["fortran_order"]
+    rows, dim = header["shape"]
+    values = struct.unpack(f"<{rows * dim}f", data[10 + header_len :])
+    return (rows, dim), [list(values[i * dim : (i + 1) * dim]) for i in range(rows)]
+
+
+def result(custom_id, *embeddings, status_code=200):
+    body = {
+        "model": "text-embedding-3-small",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": e}
+            for i, e in enumerate(embeddings)
+        ],
+        "usage": {"prompt_tokens": 4, "total_tokens": 4},
+    }
+    if status_code != 200:
+        body = {"error": {"message": "failed"}}
+    return {
+        "custom_id": custom_id,
+        "response": {"status_code": status_code, "body": body},
+    }
+
+
+class TestEmbeddings:
+    """Test embeddings batches."""
+
+    def test_split_text(self):
+        """Test token chunks and their overlap."""
+        chunks = split_text(TEXT, max_tokens=40, overlap=10)
+        assert len(chunks) > 1
+        assert chunks[0].startswith("word0") and chunks[-1].endswith("word99")
+        # consecutive chunks share their overlap
+        assert chunks[0][-8:] in chunks[1]
+        assert split_text("", 10) == []
+        assert split_text("short", 10) == ["short"]
+        with pytest.raises(ValueError):
+            split_text(TEXT, max_tokens=10, overlap=10)
+
+    @pytest.mark.parametrize("per_request", [1, 3])
+    def test_requests(self, per_request):
+        """Test the request lines and chunk rows, packed several chunks per request."""
+        sources = [("a", TEXT), ("b", "short text")]
+        pairs = list(
+            embedding_requests(
+                sources,
+                "text-embedding-3-small",
+                max_tokens=30,
+                per_request=per_request,
+                options={"encoding_format": "base64"},
+            )
+        )
+        chunks = [c for _, cs in pairs for c in cs]
+        assert [(c["source"], c["chunk"]) for c in chunks][-2:] == [
+            ("a", len(chunks) - 2),
+            ("b", 0),
+        ]
+        requests = [r for r, _ in pairs]
+        assert requests[0]["url"] == "/v1/embeddings"
+        assert requests[0]["custom_id"] == "id_a-00000"
+        assert requests[0]["body"]["encoding_format"] == "base64"
+        if per_request == 1:
+            assert requests[0]["body"]["input"] == chunks[0]["text"]
+        else:
+            assert len(requests[0]["body"]["input"]) == 3
+            assert [c["index"] for c in pairs[0][1]] == [0, 1, 2]
+        assert list(Validator().check(requests)) == requests
+
+    def test_text_sources(self, temp_dir):
+        """Test text files, directories of text files and JSONL records."""
+        (temp_dir / "texts").mkdir()
+        (temp_dir / "texts" / "paper.txt").write_text("text")
+        (temp_dir / "texts.jsonl").write_text('{"id": 7, "text": "hello"}\n')
+        assert list(text_sources(temp_dir / "texts")) == [("paper", "text")]
+        assert list(text_sources(temp_dir / "texts" / "paper.txt")) == [
+            ("paper", "text")
+        ]
+        assert list(text_sources(temp_dir / "texts.jsonl")) == [("7", "hello")]
+
+    def test_vector_bytes(self):
+        """Test that base64 and float vectors give the same float32 bytes."""
+        vector = [0.5, -1.0, 0.25]
+        packed = struct.pack("<3f", *vector)
+        assert vector_bytes(vector) == packed
+        assert vector_bytes(base64.b64encode(packed).decode()) == packed
+
+    def test_npy_writer(self, temp_dir):
+        """Test the streamed .npy matrix."""
+        path = temp_dir / "m.npy"
+        with NpyWriter(path) as writer:
+            writer.write(vector_bytes([1.0, 2.0]))
+            writer.write(vector_bytes([3.0, 4.0]))
+            with pytest.raises(ValueError):
+                writer.write(vector_bytes([1.0]))
+        assert read_npy(path) == ((2, 2), [[1.0, 2.0], [3.0, 4.0]])
+        assert path.stat().st_size == NPY_HEADER + 16
+
+    def test_write_embeddings(self, temp_dir):
+        """Test decoding result lines into the matrix, the ID index and the errors file."""
+        b64 = base64.b64encode(struct.pack("<2f", 5.0, 6.0)).decode()
+        results = [
+            result("id_1", [1.0, 2.0], [3.0, 4.0]),
+            result("id_2", status_code=500),
+            result("id_3", b64),
+        ]
+        matrix, ids, errors = (temp_dir / n for n in ("m.npy", "ids.jsonl", "e.jsonl"))
+        with open(errors, "w") as failed:
+            counts = write_embeddings(results, matrix, ids, failed)
+        assert counts == {"rows": 3, "results": 3, "failed": 1}
+        assert read_npy(matrix)[1] == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+        index = [json.loads(l) for l in ids.read_text().splitlines()]
+        assert [(r["custom_id"], r["index"]) for r in index] == [
+            ("id_1", 0),
+            ("id_1", 1),
+            ("id_3", 0),
+        ]
+        assert json.loads(errors.read_text())["custom_id"] == "id_2"
+
+    def test_load_embeddings(self, temp_dir):
+        """Test memory-mapping a fetched matrix."""
+        numpy = pytest.importorskip("numpy")
+        matrix, ids = temp_dir / "b-embeddings.npy", temp_dir / "b-embeddings-ids.jsonl"
+        with open(temp_dir / "e.jsonl", "w") as failed:
+            write_embeddings([result("id_1", [1.0, 2.0])], matrix, ids, failed)
+        vectors, index = load_embeddings(matrix)
+        assert isinstance(vectors, numpy.memmap)
+        assert vectors.tolist() == [[1.0, 2.0]]
+        assert index == [{"custom_id": "id_1", "index": 0}]
+
+    @patch("llm_batch.batch_openai.console")
+    def test_refetch_errors(self, mock_console, temp_dir, mock_async_openai_client):
+        """Test that fetching again rewrites the errors file instead of appending to it."""
+        mock_async_openai_client.file_lines = {
+            "out": [
+                json.dumps(result("id_1", [1.0])),
+                json.dumps(result("id_2", status_code=500)),
+            ],
+            "err": ['{"custom_id": "id_3"}'],
+        }
+        mock_async_openai_client.batches.retrieve.return_value = Mock(
+            output_file_id="out", error_file_id="err"
+        )
+        batch = Mock(id="batch_1")
+
+        api.run(fetch_embeddings(batch, temp_dir, "batch"))
+        api.run(fetch_embeddings(batch, temp_dir, "batch"))
+
+        errors = (temp_dir / "batch-errors.jsonl").read_text().splitlines()
+        assert [json.loads(l)["custom_id"] for l in errors] == ["id_2", "id_3"]
+
+    @patch("llm_batch.batch_openai.console")
+    @patch("llm_batch.cli.console")
+    def test_workflow(
+        self, mock_console, mock_openai_console, mock_providers, temp_dir
+    ):
+        """Test making, sending and fetching an embeddings batch against the mock server."""
+        (temp_dir / "texts").mkdir()
+        (temp_dir / "texts" / "a.txt").write_text(TEXT)
+        (temp_dir / "texts" / "b.txt").write_text("short text")
+        out = temp_dir / "batch"
+        app(
+            [
+                "batch",
+                "embed",
+                str(temp_dir / "texts"),
+                "--out",
+                str(out),
+                "--chunk-tokens",
+                "40",
+                "--overlap",
+                "0",
+                "--per-request",
+                "2",
+            ]
+        )
+        batch_file = out / "batch-requests.jsonl"
+        chunks = [
+            json.loads(l) for l in (out / "batch-chunks.jsonl").read_text().splitlines()
+        ]
+
+        send(batch_file)
+        (batch_id,) = mock_providers.batches
+        assert mock_providers.batches[batch_id]["endpoint"] == "/v1/embeddings"
+        fetch(batch_id, out=out)
+
+        shape, rows = read_npy(out / "batch-embeddings.npy")
+        assert shape == (len(chunks), mock_providers.config.embedding_dim)
+        index = [
+            json.loads(l)
+            for l in (out / "batch-embeddings-ids.jsonl").read_text().splitlines()
+        ]
+        assert [(r["custom_id"], r["index"]) for r in index] == [
+            (c["custom_id"], c["index"]) for c in chunks
+        ]
+        # the same text gives the same vector from the synchronous endpoint
+        body = {"model": "m", "input": chunks[0]["text"]}
+        expected = mock_providers.embeddings(body)["data"][0]["embedding"]
+        assert rows[0] == pytest.approx(expected)
@@ -0,0 +1,211 @@
+import json
+import pytest
+import polars as pl
+from unittest.mock import patch
+from llm_batch.cli import app, extract as extract_command
+from llm_batch.extract import (
+    ParquetWriter,
+    extract,
+    extract_chunk,
+    init_worker,
+    items,
+    output_schema,
+    parse_json,
+    polars_dtype,
+    rejects_path,
+)
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+        "confidence": {"type": "number"},
+        "reasons": {"type": "array", "items": {"type": "string"}},
+        "source": {
+            "type": "object",
+            "properties": {"page": {"type": "integer"}, "quote": {"type": "string"}},
+        },
+        "extra": {},
+    },
+    "required": ["answer"],
+}
+
+
+def chat(content):
+    return {"model": "gpt-4o-mini", "choices": [{"message": {"content": content}}]}
+
+
+def record(id, content=None, error=None):
+    record = {"id": id, "template_params": {}, "request": {"model": "gpt-4o-mini"}}
+    if error:
+        record["error"] = error
+    else:
+        record["response"] = chat(content)
+    return record
+
+
+RECORDS = [
+    record("00001", '{"answer": "A", "confidence": 0.9, "reasons": ["x", "y"]}'),
+    record(
+        "00002",
+        'Here you go:\n```json\n{"answer": "B", "source": {"page": 3, "quote": "q"}, "extra": [1]}\n```',
+    ),
+    record("00003", '{"answer": "E"}'),
+    record("00004", "I cannot answer that."),
+    record("00005", error="rate limited"),
+]
+
+
+@pytest.fixture
+def responses(temp_dir):
+    path = temp_dir / "run.jsonl"
+    path.write_text("".join(json.dumps(r) + "\n" for r in RECORDS))
+    return path
+
+
+class TestExtract:
+    """Test structured-output extraction."""
+
+    def test_parse_json(self):
+        """Test plain, fenced and embedded JSON."""
+        assert parse_json(' {"a": 1} ') == {"a": 1}
+        assert parse_json('```json\n{"a": 1}\n```') == {"a": 1}
+        assert parse_json('The answer is {"a": [1, 2]}. Done.') == {"a": [1, 2]}
+        assert parse_json("list: [1, 2]") == [1, 2]
+        with pytest.raises(json.JSONDecodeError):
+            parse_json("no JSON here")
+
+    def test_items(self, temp_dir):
+        """Test the response text of batch results."""
+        openai = temp_dir / "openai.jsonl"
+        openai.write_text(
+            json.dumps(
+                {
+                    "custom_id": "id_1",
+                    "response": {"status_code": 200, "body": chat('{"answer": "A"}')},
+                }
+            )
+        )
+        anthropic = temp_dir / "anthropic.jsonl"
+        anthropic.write_text(
+            json.dumps(
+                {
+                    "custom_id": "id_2",
+                    "result": {
+                        "type": "succeeded",
+                        "message": {
+                            "model": "claude-3-haiku-20240307",
+                            "content": [
+                                {"type": "text", "text": '{"answer": '},
+                                {"type": "text", "text": '"B"}'},
+                            ],
+                        },
+                    },
+                }
+            )
+        )
+        assert list(items(openai)) == [("id_1", "gpt-4o-mini", '{"answer": "A"}', None)]
+        assert list(items(anthropic)) == [
+            ("id_2", "claude-3-haiku-20240307", '{"answer": "B"}', None)
+        ]
+
+    def test_extract_chunk(self, responses):
+        """Test the reject reasons."""
+        init_worker(SCHEMA)
+        results = extract_chunk(list(items(responses)))
+        reasons = [reason for _, _, _, reason, _ in results]
+        assert reasons[:2] == [None, None]
+        assert reasons[2].startswith("'E' is not one of") and "at answer" in reasons[2]
+        assert reasons[3].startswith("invalid JSON")
+        assert reasons[4] == "request failed: rate limited"
+
+    def test_output_schema(self):
+        """Test the column types derived from the JSON Schema."""
+        schema = output_schema(SCHEMA)
+        assert list(schema) == [
+            "id",
+            "model",
+            "answer",
+            "confidence",
+            "reasons",
+            "source",
+            "extra",
+        ]
+        assert schema["confidence"] == pl.Float64
+        assert schema["reasons"] == pl.List(pl.Utf8)
+        assert schema["source"] == pl.Struct({"page": pl.Int64, "quote": pl.Utf8})
+        assert schema["extra"] == pl.Utf8
+        assert polars_dtype({"type": ["integer", "null"]}) == pl.Int64
+        assert output_schema({"type": "array"})["data"] == pl.Utf8
+        with pytest.raises(ValueError, match="id clash"):
+            output_schema({"type": "object", "properties": {"id": {"type": "string"}}})
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_extract(self, responses, temp_dir, processes):
+        """Test the Parquet output and the rejects file, in process and in worker processes."""
+        out = temp_dir / "out" / "results.parquet"
+        counts = extract([str(responses)], SCHEMA, out, processes=processes)
+        assert counts == {"extracted": 2, "rejected": 3}
+        df = pl.read_parquet(out)
+        assert df["id"].to_list() == ["00001", "00002"]
+        assert df["confidence"].to_list() == [0.9, None]
+        assert df["reasons"].to_list() == [["x", "y"], None]
+        assert df["source"].to_list()[1] == {"page": 3, "quote": "q"}
+        assert df["extra"].to_list() == [None, "[1]"]
+        rejects = [json.loads(line) for line in open(rejects_path(out))]
+        assert [r["id"] for r in rejects] == ["00003", "00004", "00005"]
+        assert not (out.parent / "results.parquet.parts").exists()
+
+    def test_row_groups(self, temp_dir):
+        """Test that rows are written in parts and merged in order."""
+        out = temp_dir / "rows.parquet"
+        schema = output_schema({"type": "integer"})
+        with ParquetWriter(out, schema, row_group_size=3, single_column=True) as writer:
+            for i in range(10):
+                writer.write(f"{i}", None, i)
+            assert len(writer.parts) == 3
+        assert pl.read_parquet(out)["data"].to_list() == list(range(10))
+
+    def test_data_property(self, temp_dir):
+        """Test that an object schema with a `data` property gets one column per property."""
+        path = temp_dir / "run.jsonl"
+        path.write_text(json.dumps(record("00001", '{"data": [1, 2], "n": 3}')) + "\n")
+        schema = {
+            "type": "object",
+            "properties": {
+                "data": {"type": "array", "items": {"type": "integer"}},
+                "n": {"type": "integer"},
+            },
+        }
+        out = temp_dir / "results.parquet"
+        assert extract([str(path)], schema, out, processes=1)["extracted"] == 1
+        assert pl.read_parquet(out).select("data", "n").to_dicts() == [
+            {"data": [1, 2], "n": 3}
+        ]
+
+    def test_invalid_schema(self, responses, temp_dir):
+        """Test that an invalid schema fails before any work is done."""
+        with pytest.raises(Exception, match="is not valid"):
+            extract([str(responses)], {"type": 5}, temp_dir / "x.parquet")
+
+    @patch("llm_batch.cli.console")
+    def test_command(self, mock_console, responses, temp_dir):
+        """Test the extract command."""
+        schema = temp_dir / "schema.json"
+        schema.write_text(json.dumps(SCHEMA))
+        out = temp_dir / "results.parquet"
+        rejects = temp_dir / "rejects.jsonl.gz"
+        extract_command([str(responses)], schema, out, rejects=rejects, processes=1)
+        assert pl.read_parquet(out).height == 2
+        assert rejects.exists()
+        assert "2 responses extracted" in mock_console.print.call_args_list[-1][0][0]
+
+    @patch("llm_batch.cli.console")
+    def test_command_defaults(self, mock_console, responses, temp_dir):
+        """Test the extract command through the CLI, with the default rejects file and processes."""
+        schema = temp_dir / "schema.json"
+        schema.write_text(json.dumps(SCHEMA))
+        out = temp_dir / "results.parquet"
+        app(["extract", str(responses), "--schema", str(schema), "--out", str(out)])
+        assert pl.read_parquet(out).height == 2
+        assert rejects_path(out).exists()
@@ -0,0 +1,227 @@
+import pytest
+import asyncio
+import time
+from collections import Counter
+from unittest.mock import Mock, patch
+from llm_batch import CONFIG
+from llm_batch.cli import template
+from llm_batch.fanout import (
+    ProviderPool,
+    RateLimiter,
+    provider_of,
+    run_fanout,
+    run_requests,
+)
+from llm_batch.store import read_records
+from llm_batch.telemetry import Telemetry
+
+MODELS = ["gpt-4o-mini", "claude-3-haiku-20240307"]
+
+
+def records(n):
+    return [
+        {
+            "id": f"{i:05d}",
+            "template_params": {"i": i},
+            "request": {
+                "model": "gpt-4o",
+                "max_tokens": 10,
+                "messages": [{"role": "user", "content": f"question {i}"}],
+            },
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+class TestFanout:
+    """Test multi-model fan-out of template records."""
+
+    def test_provider_of(self):
+        """Test provider detection from model names."""
+        assert provider_of("gpt-4o-mini") == "openai"
+        assert provider_of("claude-3-haiku-20240307") == "anthropic"
+        assert provider_of("no-such-model") == "unknown"
+
+    def test_rate_limiter(self):
+        """Test that requests are spaced by the rate."""
+
+        async def run(limiter):
+            start = time.monotonic()
+            for _ in range(5):
+                await limiter.acquire()
+            return time.monotonic() - start
+
+        assert asyncio.run(run(RateLimiter(50))) >= 0.07
+        assert asyncio.run(run(RateLimiter())) < 0.01
+
+    def test_pool_limits(self):
+        """Test the per-provider overrides of the fanout config."""
+        fanout = {"concurrency": 5, "rate": None, "limits": {"anthropic": {"rate": 2}}}
+        with patch.dict(CONFIG, {"fanout": fanout}):
+            openai, anthropic = ProviderPool("openai"), ProviderPool("anthropic")
+        assert openai.semaphore._value == anthropic.semaphore._value == 5
+        assert (openai.limiter.interval, anthropic.limiter.interval) == (0.0, 0.5)
+
+    def test_slow_provider(self):
+        """Test that each provider runs in its own pool, so a slow one does not hold back a fast one."""
+        running, peak, finished = Counter(), Counter(), []
+
+        async def acompletion(model, **kwargs):
+            provider = provider_of(model)
+            running[provider] += 1
+            peak[provider] = max(peak[provider], running[provider])
+            await asyncio.sleep(0.05 if provider == "anthropic" else 0.001)
+            running[provider] -= 1
+            finished.append(provider)
+            return Mock(json=lambda: {"model": model, "choices": []})
+
+        async def collect():
+            return [r async for r in run_fanout(records(8), MODELS)]
+
+        fanout = {"concurrency": 4, "limits": {"anthropic": {"concurrency": 1}}}
+        with (
+            patch.dict(CONFIG, {"fanout": fanout}),
+            patch("llm_batch.fanout.litellm.acompletion", acompletion),
+        ):
+            results = asyncio.run(collect())
+
+        assert (peak["anthropic"], peak["openai"]) == (1, 4)
+        assert finished[:8] == ["openai"] * 8
+        assert all(set(r["responses"]) == set(MODELS) for r in results)
+
+    def test_provider_windows(self):
+        """Test that a slow provider's calls do not use up the window of a fast one."""
+        finished = []
+
+        async def acompletion(model, **kwargs):
+            await asyncio.sleep(0.05 if provider_of(model) == "anthropic" else 0.001)
+            finished.append((provider_of(model), kwargs["messages"][0]["content"]))
+            return Mock(json=lambda: {"model": model, "choices": []})
+
+        async def collect():
+            return [r async for r in run_fanout(records(8), MODELS, window=2)]
+
+        fanout = {"concurrency": 4, "limits": {"anthropic": {"concurrency": 1}}}
+        with (
+            patch.dict(CONFIG, {"fanout": fanout}),
+            patch("llm_batch.fanout.litellm.acompletion", acompletion),
+        ):
+            results = asyncio.run(collect())
+
+        # the fast provider runs ahead of the slow one by more than the window
+        assert [p for p, _ in finished[:4]] == ["openai"] * 4
+        assert [r["id"] for r in results] == [f"{i:05d}" for i in range(1, 9)]
+        assert all(list(r["responses"]) == MODELS for r in results)
+
+    def test_retry_releases_pool(self):
+        """Test that a call waiting to retry does not hold its provider's only slot."""
+        calls = []
+
+        async def acompletion(model, **kwargs):
+            content = kwargs["messages"][0]["content"]
+            calls.append(content)
+            if calls.count(content) == 1 and content == "question 1":
+                raise TimeoutError("first attempt")
+            return Mock(json=lambda: {"model": model, "choices": []})
+
+        async def collect():
+            return [r async for r in run_fanout(records(2), MODELS[1:])]
+
+        fanout = {"concurrency": 1}
+        retries = {"min_wait": 0.2, "max_wait": 0.2}
+        with (
+            patch.dict(CONFIG, {"fanout": fanout, "retries": retries}),
+            patch("llm_batch.fanout.litellm.acompletion", acompletion),
+        ):
+            results = asyncio.run(collect())
+
+        assert calls == ["question 1", "question 2", "question 1"]
+        assert all(r["errors"] == {} for r in results)
+
+    def test_requests_in_order(self):
+        """Test that single-model requests run concurrently but come back in input order."""
+        running, peak = Counter(), Counter()
+
+        async def acompletion(model, messages, **kwargs):
+            running[model] += 1
+            peak[model] = max(peak[model], running[model])
+            # later questions finish first
+            await asyncio.sleep(0.01 * (9 - int(messages[0]["content"].split()[-1])))
+            running[model] -= 1
+            return Mock(json=lambda: {"model": model, "choices": []})
+
+        async def collect():
+            return [r async for r in run_requests(records(8), window=4)]
+
+        with (
+            patch.dict(CONFIG, {"fanout": {"concurrency": 4}}),
+            patch("llm_batch.fanout.litellm.acompletion", acompletion),
+        ):
+            results = asyncio.run(collect())
+
+        assert [r["id"] for r in results] == [f"{i:05d}" for i in range(1, 9)]
+        assert all("response" in r for r in results)
+        assert peak["gpt-4o"] == 4
+
+    @patch("llm_batch.cli.console")
+    def test_template_execute(self, mock_console, mock_providers, temp_dir):
+        """Test that `template --execute` without `--models` writes every response in combination order."""
+        template_file = temp_dir / "template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o", "max_tokens": 10, "messages": [{"role": "user", "content": "{{ q }}"}]}'
+        )
+        data_file = temp_dir / "data.yml"
+        data_file.write_text("q: [one, two, three]\n")
+        store = temp_dir / "out.jsonl"
+
+        template(template_file, data_file, out=temp_dir, execute=True, store=store)
+
+        results = list(read_records(store))
+        assert [r["template_params"]["q"] for r in results] == ["one", "two", "three"]
+        assert all(r["response"]["choices"] for r in results)
+
+    def test_mock_server(self, mock_providers):
+        """Test fan-out to OpenAI and Anthropic models through the mock server."""
+
+        async def collect(telemetry):
+            return [r async for r in run_fanout(records(3), MODELS, telemetry)]
+
+        with Telemetry() as telemetry:
+            results = asyncio.run(collect(telemetry))
+
+        assert sorted(r["id"] for r in results) == ["00001", "00002", "00003"]
+        for r in results:
+            assert r["models"] == MODELS
+            assert set(r["responses"]) == set(MODELS) and r["errors"] == {}
+        assert telemetry.summary()["requests"] == 6
+
+    @patch("llm_batch.cli.console")
+    @pytest.mark.parametrize("execute", [False, True])
+    def test_template_models(self, mock_console, mock_providers, temp_dir, execute):
+        """Test `template --models` writing side-by-side records."""
+        template_file = temp_dir / "template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o", "max_tokens": 10, "messages": [{"role": "user", "content": "{{ q }}"}]}'
+        )
+        data_file = temp_dir / "data.yml"
+        data_file.write_text("q: [one, two]\n")
+        store = temp_dir / "out.jsonl"
+
+        template(
+            template_file,
+            data_file,
+            out=temp_dir,
+            execute=execute,
+            store=store,
+            models=MODELS,
+        )
+
+        results = sorted(read_records(store), key=lambda r: r["id"])
+        assert [r["template_params"]["q"] for r in results] == ["one", "two"]
+        assert all(r["models"] == MODELS for r in results)
+        assert all(bool(r.get("responses")) == execute for r in results)
+
+        template(template_file, data_file, out=temp_dir / "dirs", models=MODELS)
+        assert [p.name for p in (temp_dir / "dirs").iterdir()] == [
+            "gpt-4o-mini__vs__claude-3-haiku-20240307"
+        ]
@@ -0,0 +1,111 @@
+import pytest
+import asyncio
+import gzip
+import io
+import json
+from unittest.mock import patch
+from llm_batch import api
+from llm_batch.cli import make
+from llm_batch.fileio import (
+    DecompressedUpload,
+    compression_of,
+    open_file,
+    strip_compression,
+    upload_file,
+)
+from llm_batch.store import open_store, read_records
+
+
+def compressions():
+    """Compressions to test; zstd only when the optional package is installed."""
+    try:
+        import zstandard  # noqa: F401
+
+        return ["none", "gzip", "zstd"]
+    except ImportError:
+        return ["none", "gzip"]
+
+
+SUFFIX = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class TestFileIO:
+    """Test transparent gzip and zstd reading and writing."""
+
+    def test_compression_of(self, temp_dir):
+        """Test that compression is detected from the extension."""
+        assert compression_of(temp_dir / "a.jsonl") == "none"
+        assert compression_of(temp_dir / "a.jsonl.gz") == "gzip"
+        assert compression_of(temp_dir / "a.jsonl.zst") == "zstd"
+        assert strip_compression("batch-requests.jsonl.zst") == "batch-requests.jsonl"
+
+    @pytest.mark.parametrize("compression", compressions())
+    def test_round_trip(self, temp_dir, compression):
+        """Test writing and reading back text lines."""
+        path = temp_dir / f"lines.jsonl{SUFFIX[compression]}"
+        with open_file(path, "w") as f:
+            for i in range(1000):
+                f.write(json.dumps({"i": i, "text": "é" * 10}) + "\n")
+        with open_file(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["i"] for line in lines] == list(range(1000))
+        if compression != "none":
+            assert path.stat().st_size < len("".join(json.dumps(l) for l in lines))
+
+    @pytest.mark.parametrize("compression", compressions())
+    def test_decompressed_upload(self, temp_dir, compression):
+        """Test the upload stream: decompressed content, known length, and rewind."""
+        content = b"".join(b'{"custom_id": "id_%d"}\n' % i for i in range(5000))
+        path = temp_dir / f"batch-requests.jsonl{SUFFIX[compression]}"
+        with open_file(path, "wb") as f:
+            f.write(content)
+
+        with upload_file(path) as f:
+            assert f.seek(0, io.SEEK_END) == len(content)
+            f.seek(0)
+            assert f.read(100) == content[:100]
+            f.seek(0)
+            assert f.read() == content
+        if compression != "none":
+            assert DecompressedUpload(path).name == "batch-requests.jsonl"
+
+    @patch("llm_batch.cli.console")
+    def test_make_compressed(self, mock_console, sample_json_files, temp_dir):
+        """Test `batch make --compression gzip`."""
+        out = temp_dir / "out"
+        make(temp_dir, out, "batch", compression="gzip")
+
+        out_file = out / "batch-requests.jsonl.gz"
+        with gzip.open(out_file, "rt") as f:
+            lines = [json.loads(line) for line in f]
+        assert {line["custom_id"] for line in lines} == {
+            "id_request1.json",
+            "id_request2.json",
+        }
+
+    @pytest.mark.parametrize("compression", compressions())
+    def test_store(self, temp_dir, compression):
+        """Test a compressed template output store."""
+        path = temp_dir / f"records.jsonl{SUFFIX[compression]}"
+        with open_store(temp_dir, path) as store:
+            store.write({"id": "a", "request": {}})
+            store.write({"id": "b", "request": {}})
+        assert [r["id"] for r in read_records(path)] == ["a", "b"]
+
+    def test_send_compressed(self, mock_providers, temp_dir):
+        """Test that a compressed batch file is uploaded decompressed."""
+        request = api.batch_request(
+            "id_1",
+            {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]},
+        )
+        path = temp_dir / "batch-requests.jsonl.gz"
+        with gzip.open(path, "wt") as f:
+            f.write(json.dumps(request))
+
+        async def workflow():
+            batch_id = await api.send(path)
+            await api.poll(batch_id, interval=0.01)
+            return [result async for result in api.fetch(batch_id)]
+
+        results = asyncio.run(workflow())
+        assert [r["custom_id"] for r in results] == ["id_1"]
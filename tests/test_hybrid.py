@@ -0,0 +1,176 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import patch
+from llm_batch import api
+from llm_batch.cli import hybrid
+from llm_batch.hybrid import estimate_cost, run_hybrid, sync_line
+
+
+def write_requests(path, n, model="gpt-4o-mini"):
+    lines = [
+        api.batch_request(
+            f"id_{i:03d}",
+            {
+                "model": model,
+                "max_tokens": 10,
+                "messages": [{"role": "user", "content": f"question {i}"}],
+            },
+        )
+        for i in range(n)
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines))
+    return path
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestHybrid:
+    """Test the deadline-routed batch/synchronous executor."""
+
+    def test_estimate_cost(self):
+        """Test the synchronous cost estimate."""
+        body = {
+            "model": "gpt-4o-mini",
+            "max_tokens": 100,
+            "messages": [{"role": "user", "content": "hello"}],
+        }
+        assert estimate_cost(body) > 0
+        assert estimate_cost({**body, "max_tokens": 1000}) > estimate_cost(body)
+        assert estimate_cost({**body, "model": "no-such-model"}) == 0.0
+
+    def test_sync_line(self):
+        """Test that synchronous results look like batch result lines."""
+        assert sync_line({"custom_id": "a", "response": {"id": "x"}}) == {
+            "custom_id": "a",
+            "source": "sync",
+            "response": {"status_code": 200, "body": {"id": "x"}},
+            "error": None,
+        }
+        assert sync_line({"custom_id": "a", "error": "boom"})["error"] == {
+            "message": "boom"
+        }
+
+    @pytest.mark.parametrize("provider", ["openai", "anthropic"])
+    def test_batch_finishes_in_time(self, mock_providers, temp_dir, provider):
+        """Test that nothing moves to the synchronous path when the batch is done before the cutover."""
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 10)
+        report = asyncio.run(
+            run_hybrid(
+                requests,
+                temp_dir,
+                provider=provider,
+                deadline=60,
+                reserve=10,
+                interval=0.01,
+            )
+        )
+        assert (report.batch_done, report.sync_done, report.cancelled) == (10, 0, False)
+        results = read_lines(temp_dir / "batch-responses.jsonl")
+        assert {r["custom_id"] for r in results} == {f"id_{i:03d}" for i in range(10)}
+
+    @pytest.mark.parametrize("provider", ["openai", "anthropic"])
+    def test_stragglers_go_synchronous(self, mock_providers, temp_dir, provider):
+        """Test that the batch is cancelled at the cutover and stragglers finish synchronously."""
+        mock_providers.config.batch_delay = 3600
+        mock_providers.config.early_rate = 0.5
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 20)
+        seen = []
+
+        report = asyncio.run(
+            run_hybrid(
+                requests,
+                temp_dir,
+                provider=provider,
+                deadline=0.5,
+                reserve=0.3,
+                interval=0.05,
+                on_progress=lambda done, total: seen.append((done, total)),
+            )
+        )
+
+        assert report.cancelled
+        assert 0 < report.batch_done < 20
+        assert report.batch_done + report.sync_done == 20
+        assert seen and seen[0][1] == 20
+        results = read_lines(temp_dir / "batch-responses.jsonl")
+        assert {r["custom_id"] for r in results} == {f"id_{i:03d}" for i in range(20)}
+        assert {r["source"] for r in results} == {"batch", "sync"}
+
+    @pytest.mark.parametrize("provider", ["openai", "anthropic"])
+    def test_cancel_past_deadline(self, mock_providers, temp_dir, provider):
+        """Test that a batch stuck cancelling past the deadline does not hold up the synchronous path."""
+        mock_providers.config.batch_delay = 3600
+        mock_providers.config.early_rate = 0.5
+        mock_providers.config.cancel_delay = 3600
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 10)
+
+        report = asyncio.run(
+            run_hybrid(
+                requests,
+                temp_dir,
+                provider=provider,
+                deadline=0.5,
+                reserve=0.3,
+                interval=0.05,
+            )
+        )
+
+        assert report.cancelled
+        assert (report.batch_done, report.sync_done) == (0, 10)
+        assert report.elapsed < 5
+        results = read_lines(temp_dir / "batch-responses.jsonl")
+        assert sorted(r["custom_id"] for r in results) == [
+            f"id_{i:03d}" for i in range(10)
+        ]
+
+    def test_slow_cancel_reconciles(self, mock_providers, temp_dir):
+        """Test that results of a slowly cancelled batch and the synchronous path are merged once each."""
+        mock_providers.config.batch_delay = 3600
+        mock_providers.config.early_rate = 0.5
+        mock_providers.config.cancel_delay = 0.3
+        mock_providers.config.latency = 0.05
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 20)
+
+        report = asyncio.run(
+            run_hybrid(
+                requests,
+                temp_dir,
+                deadline=2,
+                reserve=1.8,
+                concurrency=1,
+                interval=0.05,
+            )
+        )
+
+        assert report.batch_done > 0
+        assert report.batch_done + report.sync_done == 20
+        results = read_lines(temp_dir / "batch-responses.jsonl")
+        assert sorted(r["custom_id"] for r in results) == [
+            f"id_{i:03d}" for i in range(20)
+        ]
+
+    def test_budget_defers_stragglers(self, mock_providers, temp_dir):
+        """Test that stragglers over budget are written out for a later batch."""
+        mock_providers.config.batch_delay = 3600
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 5)
+
+        report = asyncio.run(
+            run_hybrid(
+                requests, temp_dir, deadline=0.1, reserve=0.1, budget=0.0, interval=0.01
+            )
+        )
+
+        assert (report.batch_done, report.sync_done, report.deferred) == (0, 0, 5)
+        deferred = read_lines(temp_dir / "batch-deferred-requests.jsonl")
+        assert len(deferred) == 5
+
+    @patch("llm_batch.cli.console")
+    def test_hybrid_command(self, mock_console, mock_providers, temp_dir):
+        """Test the `batch hybrid` command."""
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 3)
+        hybrid(requests, out=temp_dir, deadline=60, reserve=10, interval=0.01)
+        assert len(read_lines(temp_dir / "batch-responses.jsonl")) == 3
+        assert not (temp_dir / "batch-deferred-requests.jsonl").exists()
@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import pytest
+from unittest.mock import patch
+from llm_batch.cli import inspect
+from llm_batch.index import (
+    OffsetIndex,
+    build_index,
+    index_path,
+    is_current,
+    line_custom_id,
+)
+
+
+def write_lines(path, items):
+    path.write_text("".join(json.dumps(item) + "\n" for item in items))
+    return path
+
+
+class TestIndex:
+    """Test the sidecar byte-offset index."""
+
+    def test_line_custom_id(self):
+        """Test custom_id extraction without parsing the whole line."""
+        assert line_custom_id(b'{"custom_id": "id_1", "body": {}}') == "id_1"
+        assert line_custom_id(b'{"id": "req_1", "custom_id":"id_2"}') == "id_2"
+        assert line_custom_id(json.dumps({"custom_id": 'a"b'}).encode()) == 'a"b'
+        assert line_custom_id(b'{"body": {}}') is None
+
+    def test_build_and_lookup(self, temp_dir):
+        """Test lookups in a responses file, where custom_id is not the first key."""
+        results = write_lines(
+            temp_dir / "batch-responses.jsonl",
+            [{"id": f"req_{i}", "custom_id": f"id_{i}", "n": i} for i in range(100)],
+        )
+        sidecar = build_index(results)
+
+        assert sidecar == index_path(results) and sidecar.exists()
+        with OffsetIndex(results) as index:
+            assert len(index) == 100
+            assert index.get("id_42")["n"] == 42
+            assert index.get("id-7")["n"] == 7
+            assert index.get("missing") is None
+
+    def test_rebuilds_stale_index(self, temp_dir):
+        """Test that a sidecar older than its file is rebuilt on first use."""
+        path = write_lines(temp_dir / "batch-requests.jsonl", [{"custom_id": "a"}])
+        build_index(path)
+        assert is_current(path)
+
+        write_lines(path, [{"custom_id": "a"}, {"custom_id": "b"}])
+        os.utime(path, ns=(0, 0))
+        assert not is_current(path)
+        with OffsetIndex(path) as index:
+            assert index.get("b") == {"custom_id": "b"}
+        assert is_current(path)
+
+    def test_hash_collisions(self, temp_dir):
+        """Test that lines whose ids share a hash are told apart by their custom_id."""
+        path = write_lines(
+            temp_dir / "batch-requests.jsonl",
+            [{"custom_id": f"id_{i}", "n": i} for i in range(10)],
+        )
+        with patch("llm_batch.index.id_hash", return_value=1):
+            with OffsetIndex(path) as index:
+                assert [index.get(f"id_{i}")["n"] for i in range(10)] == list(range(10))
+
+    def test_compressed_file(self, temp_dir):
+        """Test that a gzip file is looked up through a decompressed copy and never indexed in place."""
+        path = temp_dir / "batch-requests.jsonl.gz"
+        with gzip.open(path, "wt") as f:
+            f.writelines(json.dumps({"custom_id": f"id_{i}", "n": i}) + "\n" for i in range(5))
+
+        with pytest.raises(ValueError, match="compressed"):
+            build_index(path)
+        with OffsetIndex(path) as index:
+            assert len(index) == 5
+            assert index.position("id_3") == 3
+            assert json.loads(index.line(4))["n"] == 4
+            assert index.get("id-1")["n"] == 1
+        assert not index_path(path).exists()
+        assert list(temp_dir.iterdir()) == [path]
+
+    def test_empty_file(self, temp_dir):
+        """Test that an empty file can be indexed."""
+        path = temp_dir / "empty.jsonl"
+        path.write_text("")
+        with OffsetIndex(path) as index:
+            assert len(index) == 0
+            assert index.get("a") is None
+
+    @patch("llm_batch.cli.console")
+    def test_inspect(self, mock_console, temp_dir):
+        """Test the `batch inspect` command."""
+        path = write_lines(
+            temp_dir / "batch-requests.jsonl", [{"custom_id": "id_1", "body": {}}]
+        )
+        inspect(path, "id_1")
+        mock_console.print_json.assert_called_once_with(
+            data={"custom_id": "id_1", "body": {}}
+        )
+
+        inspect(path, "id_2")
+        assert "not found" in mock_console.print.call_args.args[0]
@@ -12,7 +12,7 @@ class TestIntegration:
     """Integration tests for complete workflows."""
 
     def test_complete_openai_workflow(
-        self, temp_dir, sample_json_files, mock_openai_client
+        self, temp_dir, sample_json_files, mock_async_openai_client
     ):
         """Test complete OpenAI batch workflow from JSON files to results."""
         # Step 1: Create batch file from JSON files
@@ -33,25 +33,25 @@ class TestIntegration:
         mock_batch_response = Mock()
         mock_batch_response.id = "batch_456"
 
-        mock_openai_client.files.create.return_value = mock_file_response
-        mock_openai_client.batches.create.return_value = mock_batch_response
+        mock_async_openai_client.files.create.return_value = mock_file_response
+        mock_async_openai_client.batches.create.return_value = mock_batch_response
 
         send(batch_file=batch_file, description="Integration test")
 
         # Verify batch was sent
-        mock_openai_client.files.create.assert_called_once()
-        mock_openai_client.batches.create.assert_called_once()
+        mock_async_openai_client.files.create.assert_called_once()
+        mock_async_openai_client.batches.create.assert_called_once()
 
         # Step 3: Fetch results
         mock_batch_retrieve = Mock()
         mock_batch_retrieve.status = "completed"
         mock_batch_retrieve.output_file_id = "output_file_123"
+        mock_batch_retrieve.error_file_id = None
 
-        mock_file_content = Mock()
-        mock_file_content.text = '{"result": "integration test response"}'
-
-        mock_openai_client.batches.retrieve.return_value = mock_batch_retrieve
-        mock_openai_client.files.content.return_value = mock_file_content
+        mock_async_openai_client.file_lines = [
+            '{"result": "integration test response"}'
+        ]
+        mock_async_openai_client.batches.retrieve.return_value = mock_batch_retrieve
 
         results_dir = temp_dir / "results"
         fetch(batch_id="batch_456", out=results_dir, batch_name=batch_name)
@@ -61,14 +61,11 @@ class TestIntegration:
         assert results_file.exists()
         assert "integration test response" in results_file.read_text()
 
-    @patch("llm_batch.batch_anthropic.Anthropic")
     def test_complete_anthropic_workflow(
-        self, mock_anthropic_class, temp_dir, sample_batch_file
+        self, temp_dir, sample_batch_file, mock_async_anthropic_client
     ):
         """Test complete Anthropic batch workflow."""
-        # Mock the Anthropic client
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        mock_client = mock_async_anthropic_client
 
         # Step 1: Send batch to Anthropic
         mock_batch_response = Mock()
@@ -79,7 +76,6 @@ class TestIntegration:
         anthropic_send(batch_file=sample_batch_file)
 
         # Verify batch was sent
-        mock_anthropic_class.assert_called_once()
         mock_client.messages.batches.create.assert_called_once()
 
         # Step 2: Fetch results
@@ -88,7 +84,7 @@ class TestIntegration:
             '{"custom_id": "id-0", "result": "anthropic response"}'
         )
 
-        mock_client.messages.batches.results.return_value = [mock_result1]
+        mock_client.results = [mock_result1]
 
         results_dir = temp_dir / "anthropic_results"
         anthropic_fetch(
@@ -0,0 +1,106 @@
+import logging
+from logging.handlers import QueueHandler
+from llm_batch import logs
+from llm_batch.logs import ItemLog, queue_handlers, stop_listeners
+
+
+class Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class Lazy:
+    """Counts how often it is formatted."""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "lazy"
+
+
+class TestQueuedLogging:
+    """Test moving logging handlers behind a queue."""
+
+    def test_package_logger(self):
+        """Test that the package logger is set up with a queue handler."""
+        handlers = logging.getLogger("llm_batch").handlers
+        assert any(isinstance(h, QueueHandler) for h in handlers)
+
+    def test_queue_handlers(self):
+        """Test that records reach the original handler through the listener."""
+        log = logging.getLogger("llm_batch.test_logs.queued")
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        collect = Collect()
+        log.addHandler(collect)
+        saved = list(logs.listeners)
+        logs.listeners.clear()
+        try:
+            queue_handlers([log.name])
+            assert [type(h) for h in log.handlers] == [QueueHandler]
+            assert logs.listeners[0].handlers == (collect,)
+            for i in range(3):
+                log.info("message %d", i)
+            stop_listeners()
+        finally:
+            logs.listeners.extend(saved)
+            log.handlers.clear()
+        assert collect.messages == ["message 0", "message 1", "message 2"]
+
+
+class TestItemLog:
+    """Test sampled per-item messages."""
+
+    def make(self, **kwargs):
+        log = logging.getLogger("llm_batch.test_logs.items")
+        log.propagate = False
+        log.setLevel(logging.DEBUG)
+        log.handlers.clear()
+        collect = Collect()
+        log.addHandler(collect)
+        return ItemLog(log, **kwargs), collect
+
+    def test_sampling(self):
+        """Test that one in `sample_every` messages of each kind is logged."""
+        item_log, collect = self.make(sample_every=3)
+        for i in range(7):
+            item_log("done", "item %d", i)
+        item_log("retry", "retrying %s", "x")
+        assert collect.messages == [
+            "item 0 (done #1, 1 in 3 logged)",
+            "item 3 (done #4, 1 in 3 logged)",
+            "item 6 (done #7, 1 in 3 logged)",
+            "retrying x (retry #1, 1 in 3 logged)",
+        ]
+
+    def test_no_sampling(self):
+        """Test that every message is logged without the suffix when sample_every is 1."""
+        item_log, collect = self.make(sample_every=1)
+        item_log("done", "item %d", 1)
+        item_log("done", "item %d", 2)
+        assert collect.messages == ["item 1", "item 2"]
+
+    def test_config(self):
+        """Test the level and sampling rate from `logging_options`."""
+        config = {"logging_options": {"item_level": "DEBUG", "sample_every": 5}}
+        item_log, _ = self.make(config=config)
+        assert (item_log.level, item_log.sample_every) == (logging.DEBUG, 5)
+
+    def test_lazy(self):
+        """Test that arguments are formatted only for logged messages."""
+        item_log, collect = self.make(level=logging.DEBUG, sample_every=2)
+        lazy = Lazy()
+        for _ in range(4):
+            item_log("done", "item %s", lazy)
+        assert len(collect.messages) == 2
+        assert lazy.formatted == 2
+
+        item_log.logger.setLevel(logging.INFO)
+        item_log("done", "item %s", lazy)
+        assert lazy.formatted == 2
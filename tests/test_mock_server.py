@@ -0,0 +1,129 @@
+import pytest
+import json
+import httpx
+import openai
+from anthropic import Anthropic
+from unittest.mock import patch
+from llm_batch import CONFIG
+from llm_batch.mock_server import MockConfig, MockProviderServer
+from llm_batch.cli import make
+from llm_batch import batch_openai, batch_anthropic
+
+
+@pytest.fixture
+def mock_server():
+    """Run the mock provider server on a free port."""
+    with MockProviderServer(config=MockConfig(seed=0)) as server:
+        yield server
+
+
+@pytest.fixture
+def providers(mock_server):
+    """Point the configured provider base URLs at the mock server."""
+    config = {
+        "openai": {"base_url": f"{mock_server.url}/v1"},
+        "anthropic": {"base_url": mock_server.url},
+    }
+    with (
+        patch.dict(CONFIG, {"providers": config}),
+        patch.dict(
+            "os.environ", {"OPENAI_API_KEY": "test", "ANTHROPIC_API_KEY": "test"}
+        ),
+    ):
+        yield config
+
+
+class TestMockServer:
+    """Test the mock provider server over real HTTP."""
+
+    def test_openai_workflow(self, providers, temp_dir, sample_json_files):
+        """Test make, send and fetch against the mock OpenAI endpoints."""
+        make(in_dir=temp_dir, out=temp_dir / "batch", batch_name="mock")
+        batch_openai.send(batch_file=temp_dir / "batch" / "mock-requests.jsonl")
+
+        client = openai.OpenAI(base_url=providers["openai"]["base_url"])
+        batch = client.batches.list(limit=10).data[0]
+        assert batch.status == "completed"
+        assert batch.request_counts.completed == 2
+
+        batch_openai.fetch(
+            batch_id=batch.id, out=temp_dir / "results", batch_name="mock"
+        )
+        lines = (temp_dir / "results" / "mock-responses.jsonl").read_text().splitlines()
+        assert len(lines) == 2
+        result = json.loads(lines[0])
+        assert result["response"]["status_code"] == 200
+        assert result["response"]["body"]["choices"][0]["message"]["content"]
+
+    def test_anthropic_workflow(
+        self, providers, mock_server, temp_dir, sample_batch_file
+    ):
+        """Test send and fetch against the mock Anthropic endpoints."""
+        batch_anthropic.send(batch_file=sample_batch_file)
+        batch_id = next(iter(mock_server.batches))
+
+        batch_anthropic.fetch(batch_id=batch_id, out=temp_dir, batch_name="mock")
+        content = (temp_dir / "mock-responses.jsonl").read_text()
+        assert "succeeded" in content
+        assert '"id-1"' in content
+
+    def test_pagination(self, mock_server):
+        """Test that list endpoints page through every batch."""
+        client = Anthropic(api_key="test", base_url=mock_server.url)
+        params = {"model": "claude", "max_tokens": 10, "messages": []}
+        for idx in range(5):
+            client.messages.batches.create(
+                requests=[{"custom_id": f"id-{idx}", "params": params}]
+            )
+
+        assert len(list(client.messages.batches.list(limit=2))) == 5
+
+    def test_list_batches_by_provider(self, mock_server):
+        """Test that each provider lists only its own batches."""
+        anthropic = Anthropic(api_key="test", base_url=mock_server.url)
+        params = {"model": "claude", "max_tokens": 10, "messages": []}
+        anthropic.messages.batches.create(
+            requests=[{"custom_id": "id-0", "params": params}]
+        )
+        client = openai.OpenAI(api_key="test", base_url=f"{mock_server.url}/v1")
+        assert client.batches.list().data == []
+
+        request = {"custom_id": "a", "method": "POST", "url": "/v1/chat/completions"}
+        request["body"] = {"model": "gpt-4o", "messages": []}
+        file = client.files.create(
+            file=("batch.jsonl", json.dumps(request).encode()), purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        assert [b.id for b in client.batches.list().data] == [batch.id]
+        assert len(list(anthropic.messages.batches.list())) == 1
+
+    def test_rate_limit_headers(self):
+        """Test 429 responses and rate-limit headers."""
+        config = MockConfig(rate_limit_rate=1.0, retry_after=7)
+        with MockProviderServer(config=config) as server:
+            response = httpx.get(f"{server.url}/v1/batches")
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "7"
+        assert "x-ratelimit-remaining-requests" in response.headers
+
+    def test_item_errors_and_result_size(self, temp_dir):
+        """Test per-item batch failures and generated result sizes."""
+        config = MockConfig(item_error_rate=1.0, result_size=50, seed=1)
+        with MockProviderServer(config=config) as server:
+            client = Anthropic(api_key="test", base_url=server.url)
+            params = {"model": "claude", "max_tokens": 10, "messages": []}
+            batch = client.messages.batches.create(
+                requests=[{"custom_id": "id-0", "params": params}]
+            )
+            results = list(client.messages.batches.results(batch.id))
+            chat = httpx.post(
+                f"{server.url}/v1/chat/completions", json={"model": "gpt-4o"}
+            ).json()
+
+        assert results[0].result.type == "errored"
+        assert len(chat["choices"][0]["message"]["content"]) == 50
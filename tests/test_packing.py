@@ -0,0 +1,140 @@
+import pytest
+import json
+from collections import Counter
+from unittest.mock import patch
+from llm_batch.cli import app, make
+from llm_batch.packing import Packer, parse_answers, unpack_results
+from llm_batch.store import open_store, read_records
+
+
+def record(idx, text=None, system="Classify the sentiment.", model="gpt-4o-mini"):
+    return {
+        "id": f"{idx:05d}",
+        "template_params": {},
+        "request": {
+            "model": model,
+            "max_tokens": 5,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": text or f"item text {idx}"},
+            ],
+        },
+    }
+
+
+def openai_result(custom_id, content, status_code=200):
+    return {
+        "custom_id": custom_id,
+        "response": {
+            "status_code": status_code,
+            "body": {"choices": [{"message": {"content": content}}]},
+        },
+    }
+
+
+def write_store(path, records):
+    with open_store(path.parent, path) as store:
+        for r in records:
+            store.write(r)
+
+
+class TestPacking:
+    """Test token-budget packing and unpacking of small items."""
+
+    def test_pack_groups_by_shared_prompt(self):
+        """Test that only requests differing in the last user message are packed together."""
+        records = [record(1), record(2), record(3, system="Other"), record(4)]
+        packed = list(Packer(budget=4000, max_items=10).pack(records))
+
+        assert [p["items"] for p in packed] == [["00001", "00002", "00004"], ["00003"]]
+        request = packed[0]["request"]
+        assert request["max_tokens"] == 15
+        assert request["messages"][0] == {
+            "role": "system",
+            "content": "Classify the sentiment.",
+        }
+        assert (
+            '<item id="00004">\nitem text 4\n</item>'
+            in request["messages"][1]["content"]
+        )
+        assert request["response_format"]["json_schema"]["name"] == "packed_items"
+
+    def test_pack_respects_limits(self):
+        """Test the item and token budgets."""
+        records = [record(i) for i in range(1, 6)]
+        assert [
+            len(p["items"]) for p in Packer(budget=4000, max_items=2).pack(records)
+        ] == [2, 2, 1]
+
+        long_records = [record(i, text="word " * 300) for i in range(1, 4)]
+        packer = Packer(budget=800, max_items=50)
+        assert [len(p["items"]) for p in packer.pack(long_records)] == [2, 1]
+        assert (packer.item_count, packer.count) == (3, 2)
+
+    def test_parse_answers(self):
+        """Test packed response validation."""
+        text = '```json\n{"items": [{"id": "1", "answer": "pos"}, {"id": "1", "answer": "x"}]}\n```'
+        assert parse_answers(text) == {"1": "pos"}
+        for bad in ["", "not json", '{"answers": []}', '{"items": [{"id": "1"}]}']:
+            with pytest.raises(ValueError):
+                parse_answers(bad)
+
+    def test_unpack_results(self, temp_dir):
+        """Test that results split into per-item records, with errors for failed or missing items."""
+        packed = temp_dir / "packed.jsonl"
+        write_store(
+            packed,
+            list(Packer(max_items=2).pack([record(i) for i in range(1, 6)])),
+        )
+        results = [
+            openai_result(
+                "id_p000001",
+                json.dumps({"items": [{"id": "00001", "answer": "pos"}]}),
+            ),
+            openai_result("id_p000002", "no json here"),
+            {"custom_id": "id-2", "result": {"type": "errored"}},
+            openai_result("id_other", "{}"),
+        ]
+        stats = Counter()
+        items = {i["id"]: i for i in unpack_results(results, packed, stats)}
+
+        assert items["00001"]["answer"] == "pos"
+        assert items["00002"]["error"] == "item missing from packed response"
+        assert "not JSON" in items["00003"]["error"]
+        assert items["00005"]["custom_id"] == "id-2"
+        assert stats == Counter(ok=1, error=4, unknown=1)
+
+    @patch("llm_batch.cli.console")
+    def test_pack_make_unpack(self, mock_console, temp_dir):
+        """Test the `batch pack`, `batch make` and `batch unpack` commands end to end, through the CLI."""
+        store = temp_dir / "records.jsonl"
+        write_store(store, [record(i) for i in range(1, 4)])
+        packed = temp_dir / "packed.jsonl"
+
+        app(["batch", "pack", str(store), str(packed)])
+        assert len(list(read_records(packed))) == 1
+
+        make(in_dir=packed, out=temp_dir, batch_name="packed")
+        line = json.loads((temp_dir / "packed-requests.jsonl").read_text())
+        assert line["custom_id"] == "id_p000001"
+
+        answers = [{"id": f"{i:05d}", "answer": str(i)} for i in range(1, 4)]
+        results = temp_dir / "packed-responses.jsonl"
+        results.write_text(
+            json.dumps(openai_result(line["custom_id"], json.dumps({"items": answers})))
+        )
+        app(["batch", "unpack", str(results), str(packed)])
+
+        items = (temp_dir / "packed-responses-items.jsonl").read_text().splitlines()
+        assert [json.loads(i)["answer"] for i in items] == ["1", "2", "3"]
+
+    @patch("llm_batch.cli.console")
+    def test_pack_limits_option(self, mock_console, temp_dir):
+        """Test that `batch pack --max-items` reaches the packer."""
+        store = temp_dir / "records.jsonl"
+        write_store(store, [record(i) for i in range(1, 4)])
+        packed = temp_dir / "packed.jsonl"
+
+        app(["batch", "pack", str(store), str(packed), "--max-items", "2"])
+
+        assert [len(r["items"]) for r in read_records(packed)] == [2, 1]
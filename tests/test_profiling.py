@@ -0,0 +1,77 @@
+import pytest
+import pstats
+import time
+from unittest.mock import patch, Mock
+from llm_batch.profiling import PHASES, SamplingProfiler, phase, profiled
+from llm_batch.cli import app
+
+
+class TestProfiling:
+    """Test profiling hooks and phase timers."""
+
+    def test_phase_disabled_records_nothing(self):
+        """Test that phases are free when profiling is off."""
+        PHASES.reset()
+        with phase("render"):
+            pass
+        assert PHASES.calls["render"] == 0
+
+    def test_profiled_records_phases(self, temp_dir):
+        """Test that phases are timed and a cProfile artifact is written."""
+        console = Mock()
+        with profiled(temp_dir / "run", "cprofile", console):
+            for _ in range(3):
+                with phase("render"):
+                    time.sleep(0.001)
+            with phase("write"):
+                pass
+
+        assert PHASES.calls["render"] == 3
+        assert PHASES.calls["write"] == 1
+        assert PHASES.wall["render"] >= 0.003
+        assert not PHASES.enabled
+        pstats.Stats(str(temp_dir / "run.prof"))
+        assert console.print.call_count >= 2
+
+    def test_sampling_profiler(self, temp_dir):
+        """Test that the sampling profiler writes folded stacks."""
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.enable()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        profiler.disable()
+        profiler.dump_stats(temp_dir / "run.folded")
+
+        lines = (temp_dir / "run.folded").read_text().splitlines()
+        assert lines
+        assert "test_sampling_profiler" in lines[0]
+        assert lines[0].rsplit(" ", 1)[1].isdigit()
+
+    def test_unknown_profiler(self, temp_dir):
+        """Test that an unknown profiler name is rejected."""
+        with pytest.raises(ValueError):
+            with profiled(temp_dir / "run", "perf", None):
+                pass
+
+    @patch("llm_batch.cli.console")
+    def test_global_profile_option(self, mock_console, temp_dir, sample_json_files):
+        """Test that --profile wraps any subcommand."""
+        out = temp_dir / "profile"
+        app.meta(
+            [
+                "--profile",
+                "--profile-out",
+                str(out),
+                "batch",
+                "make",
+                "--in-dir",
+                str(temp_dir),
+                "--out",
+                str(temp_dir / "batch"),
+            ]
+        )
+
+        assert (temp_dir / "batch" / "batch-requests.jsonl").exists()
+        assert (temp_dir / "profile.prof").exists()
+        assert PHASES.calls["serialize"] >= 2
@@ -0,0 +1,102 @@
+import threading
+from io import StringIO
+from unittest.mock import patch
+from rich.console import Console
+from llm_batch import CONFIG
+from llm_batch.cli import template
+from llm_batch.progress import RunProgress, format_duration
+
+RESPONSE = {
+    "model": "gpt-4o-mini",
+    "usage": {
+        "prompt_tokens": 1000,
+        "completion_tokens": 500,
+        "prompt_tokens_details": {"cached_tokens": 512},
+    },
+}
+
+
+class TestProgress:
+    """Test the progress display of long runs."""
+
+    def test_counts(self):
+        """Test counts, tokens, cost and ETA."""
+        with RunProgress("run", total=10) as progress:
+            progress.advance(responses=[RESPONSE])
+            progress.advance("failed")
+            progress.advance(n=3)
+        s = progress.stats()
+        assert (s["done"], s["failed"], s["cached"]) == (4, 1, 1)
+        assert progress.tokens == 1500
+        assert s["cost"] > 0
+        assert s["eta"] is not None
+        assert progress.line().startswith("run: 5/10 (1 failed, 1 cached)")
+
+    def test_batch_results(self):
+        """Test counting batch result lines at the batch discount."""
+        ok = {"custom_id": "a", "response": {"status_code": 200, "body": RESPONSE}}
+        failed = {"custom_id": "b", "response": {"status_code": 500, "body": {}}}
+        full, batch = RunProgress("full"), RunProgress("batch", discount=0.5)
+        for progress in (full, batch):
+            progress.advance_result(ok)
+            progress.advance_result(failed)
+        assert (batch.counts["done"], batch.counts["failed"]) == (1, 1)
+        assert batch.cost == full.cost / 2
+
+    def test_threads(self):
+        """Test that updates from several threads are all counted."""
+        progress = RunProgress("run")
+
+        def work():
+            for _ in range(1000):
+                progress.advance()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert progress.counts["done"] == 4000
+
+    def test_terminal(self):
+        """Test the live display on a terminal."""
+        out = StringIO()
+        console = Console(file=out, force_terminal=True, width=200)
+        with RunProgress("template", total=3, console=console) as progress:
+            for _ in range(3):
+                progress.advance(responses=[RESPONSE])
+        assert progress._progress is not None
+        assert "template" in out.getvalue() and "3/3" in out.getvalue()
+
+    def test_log_lines(self):
+        """Test the periodic summary lines without a terminal."""
+        out = StringIO()
+        console = Console(file=out, force_terminal=False)
+        with patch.dict(CONFIG, {"progress": {"log_interval": 0.0}}):
+            with RunProgress("make", console=console) as progress:
+                progress.advance()
+                progress.advance()
+        lines = out.getvalue().splitlines()
+        assert progress._progress is None
+        assert len(lines) == 3
+        assert lines[-1].startswith("make: 2 (0 failed, 0 cached)")
+
+    def test_format_duration(self):
+        """Test ETA formatting."""
+        assert format_duration(None) == "?"
+        assert format_duration(75) == "1:15"
+        assert format_duration(3725) == "1:02:05"
+
+    @patch("llm_batch.cli.console")
+    def test_template_progress(self, mock_console, temp_dir):
+        """Test that a template run reports its progress instead of a line per combination."""
+        template_file = temp_dir / "template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "{{ q }}"}]}'
+        )
+        data_file = temp_dir / "data.yml"
+        data_file.write_text("q: [one, two, three]\n")
+        template(template_file, data_file, out=temp_dir, store=temp_dir / "out.jsonl")
+        printed = [str(c.args[0]) for c in mock_console.print.call_args_list]
+        assert not any("Executed combination" in p for p in printed)
+        assert any(p.startswith("template: 3/3") for p in printed)
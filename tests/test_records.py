@@ -0,0 +1,239 @@
+import pytest
+import json
+from unittest.mock import patch
+from llm_batch.batch_anthropic import send
+from llm_batch.cli import make
+from llm_batch.records import (
+    BatchResult,
+    ChatRequest,
+    EmbeddingRequest,
+    RecordError,
+    Validator,
+    batch_url,
+    quarantine_path,
+    read_requests,
+)
+from llm_batch.store import open_store
+
+
+def line(custom_id, **body):
+    body = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}], **body}
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body,
+    }
+
+
+class TestRecords:
+    """Test typed request records and streaming validation."""
+
+    def test_round_trip(self):
+        """Test that a validated request converts back to the same line."""
+        data = line(
+            "id_1",
+            max_tokens=10,
+            temperature=0.5,
+            messages=[
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": [{"type": "text", "text": "hi"}]},
+                {"role": "assistant", "content": None, "tool_calls": []},
+            ],
+        )
+        request = ChatRequest.from_dict(data)
+        assert request.max_tokens == 10
+        assert request.params == {"temperature": 0.5}
+        assert request.messages[2].extra == {"tool_calls": []}
+        assert request.to_dict() == data
+
+    @pytest.mark.parametrize(
+        "data, error",
+        [
+            ([], "not an object"),
+            ({"body": {}}, "custom_id"),
+            (line("a", model=""), "body.model"),
+            (line("a", messages=[]), "body.messages"),
+            (line("a", messages=[{"role": "robot", "content": "x"}]), "role"),
+            (line("a", messages=[{"role": "user", "content": 1}]), "content"),
+            (line("a", max_tokens=0), "max_tokens"),
+        ],
+    )
+    def test_invalid(self, data, error):
+        """Test the validation errors."""
+        with pytest.raises(RecordError, match=error):
+            ChatRequest.from_dict(data)
+
+    def test_anthropic_needs_max_tokens(self):
+        """Test that Anthropic requests must set max_tokens."""
+        ChatRequest.from_dict(line("a"))
+        with pytest.raises(RecordError, match="max_tokens is required"):
+            ChatRequest.from_dict(line("a"), provider="anthropic")
+
+    def test_embedding_request(self, temp_dir):
+        """Test embeddings request lines and the single endpoint of a batch."""
+        data = {
+            "custom_id": "e1",
+            "method": "POST",
+            "url": "/v1/embeddings",
+            "body": {"model": "text-embedding-3-small", "input": ["a", "b"]},
+        }
+        request = EmbeddingRequest.from_dict(data)
+        assert request.input == ("a", "b")
+        assert request.to_dict() == data
+        with pytest.raises(RecordError, match="input"):
+            EmbeddingRequest.from_dict({**data, "body": {"model": "m", "input": []}})
+        with pytest.raises(RecordError, match="Anthropic"):
+            EmbeddingRequest.from_dict(data, provider="anthropic")
+
+        path = temp_dir / "batch-requests.jsonl"
+        path.write_text(f"{json.dumps(data)}\n{json.dumps(line('a'))}\n")
+        assert batch_url(path) == "/v1/embeddings"
+        with pytest.raises(
+            RecordError, match="line 2: url '/v1/chat/completions' differs"
+        ):
+            list(read_requests(path))
+
+    def test_strict_line_numbers(self, temp_dir):
+        """Test that the first invalid line raises with its line number."""
+        path = temp_dir / "batch-requests.jsonl"
+        path.write_text(f"{json.dumps(line('a'))}\n\n{{oops\n")
+        with pytest.raises(json.JSONDecodeError, match="line 3"):
+            list(read_requests(path))
+
+        path.write_text(f"{json.dumps(line('a'))}\n{json.dumps(line('a'))}\n")
+        with pytest.raises(RecordError, match="line 2: duplicate custom_id"):
+            list(read_requests(path))
+
+    def test_quarantine(self, temp_dir):
+        """Test that invalid lines are quarantined and the rest streamed through."""
+        lines = [line("a"), line("b"), {"custom_id": "c"}, line("d")]
+        path = temp_dir / "batch-requests.jsonl"
+        path.write_text(
+            "\n".join(json.dumps(l) for l in lines[:3])
+            + "\nnot json\n"
+            + json.dumps(lines[3])
+        )
+        quarantine = quarantine_path(path)
+        assert quarantine.name == "batch-quarantine.jsonl"
+
+        with open(path) as f, Validator(quarantine=quarantine) as validator:
+            ids = [request.custom_id for request in validator.parse(f)]
+
+        assert ids == ["a", "b", "d"]
+        assert (validator.total, validator.invalid) == (5, 2)
+        entries = [json.loads(l) for l in quarantine.read_text().splitlines()]
+        assert [e["line"] for e in entries] == [3, 4]
+        assert entries[1]["text"] == "not json"
+
+    def test_batch_result(self):
+        """Test result records for both providers."""
+        ok = BatchResult.from_dict(
+            {
+                "custom_id": "a",
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"content": "hello"}}]},
+                },
+            }
+        )
+        assert (ok.ok, ok.text) == (True, "hello")
+        assert not BatchResult.from_dict(
+            {"custom_id": "a", "response": None, "error": {"code": "x"}}
+        ).ok
+        anthropic = BatchResult.from_dict(
+            {
+                "custom_id": "id-0",
+                "result": {
+                    "type": "succeeded",
+                    "message": {"content": [{"type": "text", "text": "hi"}]},
+                },
+            }
+        )
+        assert (anthropic.ok, anthropic.text) == (True, "hi")
+        assert (
+            BatchResult.from_dict(
+                {"custom_id": "id-0", "result": {"type": "expired"}}
+            ).error
+            == '"expired"'
+        )
+
+    @patch("llm_batch.batch_anthropic.console")
+    def test_send_no_strict(self, mock_console, temp_dir, mock_async_anthropic_client):
+        """Test that `--no-strict` sends only valid requests and keeps the submitted file."""
+        mock_client = mock_async_anthropic_client
+        path = temp_dir / "batch-requests.jsonl"
+        path.write_text(
+            "\n".join(
+                json.dumps(l)
+                for l in [line("a", max_tokens=5), line("b"), line("c", max_tokens=5)]
+            )
+        )
+
+        send(batch_file=path)
+        mock_client.messages.batches.create.assert_not_called()
+        assert "line 2: body.max_tokens" in mock_console.print.call_args_list[0][0][0]
+
+        send(batch_file=path, strict=False)
+        requests = mock_client.messages.batches.create.call_args[1]["requests"]
+        assert [r["custom_id"] for r in requests] == ["id-0", "id-1"]
+        valid = [
+            json.loads(l)
+            for l in (temp_dir / "batch-valid.jsonl").read_text().splitlines()
+        ]
+        assert [v["custom_id"] for v in valid] == ["a", "c"]
+        assert "max_tokens" in (temp_dir / "batch-quarantine.jsonl").read_text()
+
+    @patch("llm_batch.batch_anthropic.console")
+    def test_send_no_strict_dedup(
+        self, mock_console, temp_dir, mock_async_anthropic_client
+    ):
+        """Test that the submitted file written with `--no-strict --dedup` holds the deduplicated requests."""
+        mock_client = mock_async_anthropic_client
+        path = temp_dir / "batch-requests.jsonl"
+        path.write_text(
+            "\n".join(
+                json.dumps(l)
+                for l in [line("a", max_tokens=5), line("b"), line("c", max_tokens=5)]
+            )
+        )
+
+        send(batch_file=path, strict=False, dedup=True, cache=False)
+        requests = mock_client.messages.batches.create.call_args[1]["requests"]
+        assert [r["custom_id"] for r in requests] == ["id-0"]
+        valid = (temp_dir / "batch-valid.jsonl").read_text().splitlines()
+        assert [json.loads(l)["custom_id"] for l in valid] == ["a"]
+        fanout = json.loads((temp_dir / "batch-fanout.jsonl").read_text())
+        assert fanout == {"custom_id": "c", "canonical": "a", "index": 0}
+
+    @patch("llm_batch.batch_openai.console")
+    def test_openai_send_strict(self, mock_console, temp_dir, mock_openai_client):
+        """Test that a strict OpenAI send reports the first invalid line instead of raising."""
+        from llm_batch.batch_openai import send as openai_send
+
+        path = temp_dir / "batch-requests.jsonl"
+        path.write_text(json.dumps(line("a")) + "\nnot json\n")
+
+        openai_send(batch_file=path)
+
+        mock_openai_client.files.create.assert_not_called()
+        assert "line 2:" in mock_console.print.call_args_list[0][0][0]
+
+    @patch("llm_batch.cli.console")
+    def test_make_quarantines(self, mock_console, temp_dir):
+        """Test that `batch make` skips and quarantines invalid records."""
+        store = temp_dir / "records.jsonl"
+        with open_store(temp_dir, store) as output:
+            output.write({"id": "1", "request": line("x")["body"]})
+            output.write({"id": "2", "request": {"model": "gpt-4o"}})
+        out = temp_dir / "out"
+
+        make(store, out, "batch")
+
+        lines = (out / "batch-requests.jsonl").read_text().splitlines()
+        assert [json.loads(l)["custom_id"] for l in lines] == ["id_1"]
+        (entry,) = [
+            json.loads(l)
+            for l in (out / "batch-quarantine.jsonl").read_text().splitlines()
+        ]
+        assert "body.messages" in entry["error"]
@@ -0,0 +1,139 @@
+import pytest
+import asyncio
+import gzip
+import json
+from pathlib import Path
+from unittest.mock import patch
+from llm_batch import api
+from llm_batch.cli import retry_failed
+from llm_batch.index import OffsetIndex
+from llm_batch.retry import is_failed, retry_batch
+
+
+def write_requests(path, n):
+    lines = [
+        api.batch_request(
+            f"id_{i:03d}",
+            {
+                "model": "gpt-4o-mini",
+                "max_tokens": 10,
+                "messages": [{"role": "user", "content": f"question {i}"}],
+            },
+        )
+        for i in range(n)
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines))
+    return path
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestRetry:
+    """Test re-batching of failed requests."""
+
+    def test_offset_index(self, temp_dir):
+        """Test reading single requests back by custom_id or Anthropic position."""
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 5)
+        with OffsetIndex(requests) as index:
+            assert len(index) == 5
+            assert index.get("id_003")["body"]["messages"][0]["content"] == "question 3"
+            assert index.get("id-4")["custom_id"] == "id_004"
+            assert index.get("id-5") is None
+            assert index.get("id_999") is None
+            # the last line has no trailing newline, but raw lines always end in one
+            assert index.line(4).endswith(b"}\n")
+
+    def test_is_failed(self):
+        """Test failure detection for both providers."""
+        assert not is_failed({"custom_id": "a", "response": {"status_code": 200}})
+        assert is_failed({"custom_id": "a", "response": {"status_code": 500}})
+        assert not is_failed({"custom_id": "id-0", "result": {"type": "succeeded"}})
+        assert is_failed({"custom_id": "id-0", "result": {"type": "expired"}})
+
+    @pytest.mark.parametrize("provider", ["openai", "anthropic"])
+    def test_retry_until_done(self, mock_providers, temp_dir, provider):
+        """Test that only failed requests are resubmitted, round after round."""
+        mock_providers.config.item_error_rate = 0.4
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 20)
+        out = temp_dir / "out"
+
+        async def workflow():
+            batch_id = await api.send(requests, provider=provider)
+            return await retry_batch(
+                batch_id,
+                requests,
+                provider=provider,
+                out=out,
+                max_rounds=10,
+                interval=0.01,
+            )
+
+        lineage = asyncio.run(workflow())
+
+        assert lineage[0]["results"] == 20
+        assert lineage[-1]["stopped"] == "done"
+        for parent, child in zip(lineage, lineage[1:]):
+            assert child["parent_batch_id"] == parent["batch_id"]
+            assert child["results"] == parent["failed"]
+        assert read_lines(out / "batch-lineage.jsonl") == lineage
+
+        # every request ends up with a successful result under its original custom_id
+        succeeded = set()
+        for entry in lineage:
+            for result in read_lines(Path(entry["results_file"])):
+                if not is_failed(result):
+                    succeeded.add(result["custom_id"])
+        assert succeeded == {f"id_{i:03d}" for i in range(20)}
+
+        if provider == "openai" and len(lineage) > 1:
+            batch = mock_providers.batches[lineage[1]["batch_id"]]
+            assert batch["metadata"]["parent_batch_id"] == lineage[0]["batch_id"]
+
+    def test_retry_budget(self, mock_providers, temp_dir):
+        """Test that the loop stops when the retry budget would be exceeded."""
+        mock_providers.config.item_error_rate = 1.0
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 4)
+
+        async def workflow():
+            batch_id = await api.send(requests)
+            return await retry_batch(
+                batch_id, requests, out=temp_dir, budget=6, interval=0.01
+            )
+
+        lineage = asyncio.run(workflow())
+
+        assert [e["failed"] for e in lineage] == [4, 4]
+        assert lineage[-1]["stopped"] == "budget"
+        # the requests still failing are kept for a manual resubmission
+        assert len(read_lines(temp_dir / "batch-retry2-requests.jsonl")) == 4
+
+    def test_retry_compressed_requests(self, mock_providers, temp_dir):
+        """Test that failed requests are resubmitted intact from a gzip requests file."""
+        mock_providers.config.item_error_rate = 1.0
+        plain = write_requests(temp_dir / "plain-requests.jsonl", 3)
+        requests = temp_dir / "batch-requests.jsonl.gz"
+        requests.write_bytes(gzip.compress(plain.read_bytes()))
+
+        async def workflow():
+            batch_id = await api.send(requests)
+            return await retry_batch(
+                batch_id, requests, out=temp_dir, max_rounds=1, interval=0.01
+            )
+
+        lineage = asyncio.run(workflow())
+
+        assert lineage[0]["failed"] == 3
+        assert read_lines(temp_dir / "batch-retry1-requests.jsonl") == read_lines(plain)
+
+    @patch("llm_batch.cli.console")
+    def test_retry_command(self, mock_console, mock_providers, temp_dir):
+        """Test the `batch retry` command."""
+        requests = write_requests(temp_dir / "batch-requests.jsonl", 3)
+        batch_id = asyncio.run(api.send(requests))
+
+        retry_failed(batch_id, requests, out=temp_dir, interval=0.01)
+
+        assert len(read_lines(temp_dir / "batch-responses.jsonl")) == 3
+        assert not (temp_dir / "batch-retry1-requests.jsonl").exists()
@@ -0,0 +1,68 @@
+import pytest
+import json
+from llm_batch import serialization
+from llm_batch.serialization import (
+    dumps,
+    dumps_pretty,
+    loads,
+    loads_lenient,
+    use_backend,
+)
+from llm_batch.store import open_store
+
+BACKENDS = [name for name, available in serialization.BACKENDS.items() if available()]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    """Run a test with each installed JSON backend, restoring the default afterwards."""
+    previous = serialization.backend
+    use_backend(request.param)
+    yield request.param
+    use_backend(previous)  # type: ignore
+
+
+class TestSerialization:
+    """Test the pluggable JSON backends."""
+
+    def test_round_trip(self, backend):
+        """Test that every backend writes the same compact JSON and reads it back."""
+        obj = {"custom_id": "id_1", "body": {"text": "héllo\n", "n": 1.5, "ok": True}}
+        text = dumps(obj)
+        assert (
+            text == '{"custom_id":"id_1","body":{"text":"héllo\\n","n":1.5,"ok":true}}'
+        )
+        assert loads(text) == obj
+        assert loads(text.encode()) == obj
+        assert dumps({"b": 1, "a": 2}, sort_keys=True) == '{"a":2,"b":1}'
+
+    def test_decode_error(self, backend):
+        """Test that invalid JSON raises the standard library error with every backend."""
+        with pytest.raises(json.JSONDecodeError):
+            loads("invalid json content")
+
+    def test_unsupported_values(self, backend):
+        """Test the fallback for values a fast backend cannot encode."""
+        assert loads(dumps({1: 2**70})) == {"1": 2**70}
+
+    def test_loads_lenient(self, backend):
+        """Test parsing rendered templates with raw newlines inside strings."""
+        assert loads_lenient('{"content": "line 1\nline 2"}') == {
+            "content": "line 1\nline 2"
+        }
+
+    def test_pretty(self, backend):
+        """Test indented output."""
+        assert dumps_pretty({"a": [1]}) == '{\n  "a": [\n    1\n  ]\n}'
+
+    def test_unknown_backend(self):
+        """Test that an unknown backend is rejected."""
+        with pytest.raises(ValueError):
+            use_backend("yaml")  # type: ignore
+
+    def test_directory_store_compact(self, temp_dir):
+        """Test that `pretty=False` writes one-line JSON files."""
+        with open_store(temp_dir, pretty=False) as store:
+            store.write({"id": "1", "request": {"model": "gpt-4o"}})
+        (path,) = (temp_dir / "gpt-4o").glob("*.json")
+        assert path.read_text() == '{"request":{"model":"gpt-4o"}}'
@@ -0,0 +1,87 @@
+import pytest
+import json
+from llm_batch.store import (
+    DirectoryStore,
+    JsonlStore,
+    SQLiteStore,
+    open_store,
+    read_records,
+    get_record,
+)
+
+
+def make_record(idx):
+    return {
+        "id": f"{idx:05d}",
+        "template_params": {"name": f"name-{idx}"},
+        "request": {
+            "model": "openai/gpt-4o",
+            "messages": [{"role": "user", "content": f"Hi {idx}"}],
+        },
+    }
+
+
+class TestStore:
+    """Test template output stores."""
+
+    @pytest.mark.parametrize(
+        "name, store_class",
+        [
+            ("out.jsonl", JsonlStore),
+            ("out.jsonl.gz", JsonlStore),
+            ("out.sqlite", SQLiteStore),
+        ],
+    )
+    def test_open_store_by_extension(self, temp_dir, name, store_class):
+        """Test that the backend is selected from the store file extension."""
+        with open_store(temp_dir, temp_dir / name) as store:
+            assert isinstance(store, store_class)
+
+    def test_open_store_default_directory(self, temp_dir):
+        """Test that the legacy directory layout is used without a store path."""
+        assert isinstance(open_store(temp_dir), DirectoryStore)
+
+    def test_open_store_unsupported(self, temp_dir):
+        """Test that unknown store extensions are rejected."""
+        with pytest.raises(ValueError):
+            open_store(temp_dir, temp_dir / "out.csv")
+
+    @pytest.mark.parametrize("name", ["out.jsonl", "out.jsonl.gz", "out.sqlite"])
+    def test_roundtrip(self, temp_dir, name):
+        """Test that records written to a store are read back in order."""
+        path = temp_dir / name
+        with open_store(temp_dir, path) as store:
+            for idx in range(1, 4):
+                store.write(make_record(idx))
+
+        records = list(read_records(path))
+        assert [r["id"] for r in records] == ["00001", "00002", "00003"]
+        assert records[1]["template_params"] == {"name": "name-2"}
+        assert get_record(path, "00003")["request"]["messages"][0]["content"] == "Hi 3"
+        assert get_record(path, "99999") is None
+
+    def test_get_record_jsonl_index(self, temp_dir):
+        """Test that JSONL store lookups go through an `id` sidecar index rebuilt when the store changes."""
+        path = temp_dir / "out.jsonl"
+        with open_store(temp_dir, path) as store:
+            for idx in range(1, 4):
+                store.write(make_record(idx))
+
+        assert get_record(path, "00002")["template_params"] == {"name": "name-2"}
+        assert (temp_dir / "out.jsonl.id.idx").exists()
+
+        with open_store(temp_dir, path) as store:
+            store.write(make_record(4))
+        assert get_record(path, "00004")["request"]["messages"][0]["content"] == "Hi 4"
+        assert get_record(path, "id-0") is None
+
+    def test_directory_store_unique_files(self, temp_dir):
+        """Test that the directory store writes one uniquely named file per record."""
+        store = DirectoryStore(temp_dir)
+        for idx in range(1, 6):
+            store.write(make_record(idx))
+
+        files = list((temp_dir / "openai_gpt-4o").glob("*.json"))
+        assert len(files) == 5
+        body = json.loads(files[0].read_text())
+        assert set(body) == {"template_params", "request"}
@@ -0,0 +1,90 @@
+import pytest
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+from llm_batch.cli import template
+from llm_batch.store import read_records
+from llm_batch.streaming import stream_completion
+from llm_batch.telemetry import RequestEvent, Telemetry
+
+PARAMS = {"max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}
+
+
+class TestStreaming:
+    """Test streamed completions and time-to-first-token metrics."""
+
+    @pytest.mark.parametrize("model", ["gpt-4o-mini", "claude-3-haiku-20240307"])
+    def test_stream_completion(self, mock_providers, temp_dir, model):
+        """Test that streamed chunks assemble into a regular response."""
+        mock_providers.config.stream_delay = 0.01
+        partial = temp_dir / "partial.txt"
+        result = stream_completion({"model": model, **PARAMS}, partial=partial)
+
+        text = result.response["choices"][0]["message"]["content"]
+        assert text == mock_providers.completion_text()
+        assert result.response["usage"]["completion_tokens"] > 0
+        assert 0 < result.ttft < result.latency
+        assert result.tokens_per_second > 0
+        assert not partial.exists()
+
+    def test_partial_kept_on_failure(self, temp_dir):
+        """Test that the text received before a stream fails stays in the partial file."""
+
+        def chunks():
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content="hello "))]
+            )
+            raise ConnectionError("stream dropped")
+
+        partial = temp_dir / "partial.txt"
+        with patch("llm_batch.streaming.litellm.completion", return_value=chunks()):
+            with pytest.raises(ConnectionError):
+                stream_completion({"model": "gpt-4o-mini", **PARAMS}, partial=partial)
+        assert partial.read_text() == "hello "
+
+    def test_telemetry(self, temp_dir):
+        """Test the time-to-first-token summary and metrics."""
+        telemetry = Telemetry()
+        telemetry.record(RequestEvent(id="a", source="t", latency=1.0))
+        assert telemetry.summary()["ttft_p50"] is None
+        for ttft in (0.1, 0.2, 0.3):
+            telemetry.record(
+                RequestEvent(
+                    id="b", source="t", latency=1.0, ttft=ttft, tokens_per_second=50.0
+                )
+            )
+        summary = telemetry.summary()
+        assert (summary["ttft_p50"], summary["ttft_p99"]) == (0.2, 0.3)
+        assert summary["generation_tokens_per_second"] == 50.0
+
+        metrics = temp_dir / "metrics.prom"
+        telemetry.write_openmetrics(metrics)
+        assert "llm_batch_time_to_first_token_seconds_count 3" in metrics.read_text()
+
+    @patch("llm_batch.cli.console")
+    def test_template_stream(self, mock_console, mock_providers, temp_dir):
+        """Test `template --execute --stream` recording TTFT per request."""
+        template_file = temp_dir / "template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o-mini", "max_tokens": 10, "messages": [{"role": "user", "content": "{{ q }}"}]}'
+        )
+        data_file = temp_dir / "data.yml"
+        data_file.write_text("q: [one, two]\n")
+        events = temp_dir / "events.jsonl"
+
+        template(
+            template_file,
+            data_file,
+            out=temp_dir,
+            execute=True,
+            store=temp_dir / "out.jsonl",
+            events=events,
+            stream=True,
+            partial=True,
+        )
+
+        records = list(read_records(temp_dir / "out.jsonl"))
+        assert all(r["response"]["choices"][0]["message"]["content"] for r in records)
+        logged = [json.loads(line) for line in events.read_text().splitlines()]
+        assert len(logged) == 2 and all(e["ttft"] > 0 for e in logged)
+        assert list((temp_dir / "partial").iterdir()) == []
@@ -0,0 +1,128 @@
+import pytest
+import json
+from unittest.mock import AsyncMock, patch, Mock
+from llm_batch.telemetry import (
+    RequestEvent,
+    Telemetry,
+    event_from_response,
+    event_from_batch_result,
+    percentile,
+)
+from llm_batch.cli import template
+
+CHAT_RESPONSE = {
+    "id": "chatcmpl-123",
+    "model": "gpt-4o",
+    "choices": [{"message": {"role": "assistant", "content": "Hi"}}],
+    "usage": {
+        "prompt_tokens": 30,
+        "completion_tokens": 5,
+        "prompt_tokens_details": {"cached_tokens": 20},
+    },
+}
+
+
+class TestTelemetry:
+    """Test structured request telemetry."""
+
+    def test_event_from_openai_response(self):
+        """Test token, cache and request ID extraction from a chat completion."""
+        event = event_from_response("00001", "template", CHAT_RESPONSE, latency=1.5)
+
+        assert event.prompt_tokens == 30
+        assert event.completion_tokens == 5
+        assert event.cached_tokens == 20
+        assert event.cache_hit is True
+        assert event.request_id == "chatcmpl-123"
+        assert event.latency == 1.5
+
+    def test_event_from_batch_results(self):
+        """Test events from OpenAI batch lines and Anthropic result lines."""
+        openai_error = {
+            "custom_id": "id_1",
+            "response": {"status_code": 500, "request_id": "req_1", "body": {}},
+            "error": {"message": "boom"},
+        }
+        anthropic_ok = {
+            "custom_id": "id-0",
+            "result": {
+                "type": "succeeded",
+                "message": {
+                    "id": "msg_1",
+                    "usage": {"input_tokens": 10, "output_tokens": 3},
+                },
+            },
+        }
+
+        error_event = event_from_batch_result(openai_error, "openai-batch")
+        ok_event = event_from_batch_result(anthropic_ok, "anthropic-batch")
+
+        assert error_event.status == "error"
+        assert "boom" in error_event.error
+        assert ok_event.status == "ok"
+        assert ok_event.prompt_tokens == 10
+        assert ok_event.request_id == "msg_1"
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 50) is None
+
+    def test_events_summary_and_metrics(self, temp_dir):
+        """Test the JSONL event stream, summary and OpenMetrics dump."""
+        events = temp_dir / "events.jsonl"
+        with Telemetry(events) as telemetry:
+            for idx in range(10):
+                telemetry.record(
+                    RequestEvent(
+                        id=str(idx), source="test", latency=idx / 10, retries=1
+                    )
+                )
+            telemetry.record(RequestEvent(id="x", source="test", status="error"))
+            summary = telemetry.summary()
+            telemetry.write_openmetrics(temp_dir / "metrics.prom")
+
+        lines = events.read_text().splitlines()
+        assert len(lines) == 11
+        assert json.loads(lines[-1])["status"] == "error"
+        assert summary["requests"] == 11
+        assert summary["errors"] == 1
+        assert summary["retries"] == 10
+        assert summary["latency_p50"] == pytest.approx(0.4)
+
+        metrics = (temp_dir / "metrics.prom").read_text()
+        assert 'llm_batch_requests_total{status="ok"} 10' in metrics
+        assert "llm_batch_request_latency_seconds_count 10" in metrics
+        assert metrics.endswith("# EOF\n")
+
+    @patch("llm_batch.cli.console")
+    @patch("litellm.acompletion", new_callable=AsyncMock)
+    def test_template_execute_records_events(
+        self, mock_completion, mock_console, temp_dir
+    ):
+        """Test that template --execute emits one event per request."""
+        mock_completion.return_value = Mock(json=Mock(return_value=CHAT_RESPONSE))
+        template_file = temp_dir / "template.json"
+        template_file.write_text(
+            '{"model": "gpt-4o", "messages": [{"role": "user", "content": "{{ q }}"}]}'
+        )
+        data_file = temp_dir / "data.yml"
+        data_file.write_text("q: [a, b]\n")
+        events = temp_dir / "events.jsonl"
+
+        template(
+            template=template_file,
+            data=data_file,
+            out=temp_dir / "out",
+            execute=True,
+            store=temp_dir / "out.jsonl",
+            events=events,
+            metrics=temp_dir / "metrics.prom",
+        )
+
+        records = [json.loads(line) for line in events.read_text().splitlines()]
+        assert [r["id"] for r in records] == ["00001", "00002"]
+        assert all(r["source"] == "template" and r["retries"] == 0 for r in records)
+        assert (temp_dir / "metrics.prom").exists()
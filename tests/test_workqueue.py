@@ -0,0 +1,255 @@
+import pytest
+import asyncio
+import multiprocessing
+import os
+import jinja2
+import yaml
+from pathlib import Path
+from unittest.mock import patch
+from llm_batch.cli import app, extract_combinations, queue_init, queue_merge, template
+from llm_batch.store import read_records
+from llm_batch.workqueue import (
+    LeaseLostError,
+    WorkQueue,
+    combinations,
+    merge,
+    run_shard,
+    run_worker,
+    run_workers,
+    shards_dir,
+)
+
+TEMPLATE = """{
+    "model": "gpt-4o-mini",
+    "max_tokens": 10,
+    "messages": [{"role": "user", "content": "{{ a }} and {{ b }}"}]
+}"""
+
+
+def load_run(queue):
+    """The template and data of a queue, as `run_shard` takes them."""
+    template = Path(queue.meta["template"])
+    environment = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(str(template.parent))
+    )
+    data = yaml.safe_load(Path(queue.meta["data"]).read_text())
+    return environment.get_template(template.name), data
+
+
+@pytest.fixture
+def template_run(temp_dir):
+    """A template and data file with 15 combinations."""
+    template_file = temp_dir / "template.json"
+    template_file.write_text(TEMPLATE)
+    data_file = temp_dir / "data.yml"
+    data_file.write_text(yaml.dump({"a": [1, 2, 3, 4, 5], "b": ["x", "y", "z"]}))
+    return template_file, data_file
+
+
+class TestWorkQueue:
+    """Test the sharded work queue."""
+
+    def test_combinations(self):
+        """Test that shard ranges follow the order of the full cartesian product."""
+        data = {"a": [1, 2, 3], "b": ["x", "y"], "c": [True]}
+        full = extract_combinations(data)
+        assert list(combinations(data, 0, 6)) == full
+        assert list(combinations(data, 2, 5)) == full[2:5]
+        assert list(combinations(data, 5, 10)) == full[5:]
+
+        # a shard deep into a huge product is computed directly from its indices
+        big = {"a": list(range(1000)), "b": list(range(1000)), "c": list(range(1000))}
+        assert list(combinations(big, 123_456_789, 123_456_790)) == [
+            {"a": 123, "b": 456, "c": 789}
+        ]
+
+    def test_create(self, temp_dir, template_run):
+        """Test that the combinations are split into shards."""
+        path = temp_dir / "run.db"
+        with WorkQueue.create(path, *template_run, chunk_size=4) as queue:
+            assert queue.meta["total"] == "15"
+            assert queue.counts() == {
+                "pending": 4,
+                "claimed": 0,
+                "done": 0,
+                "failed": 0,
+            }
+        with pytest.raises(FileExistsError):
+            WorkQueue.create(path, *template_run)
+        with pytest.raises(FileNotFoundError):
+            WorkQueue(temp_dir / "missing.db")
+
+    def test_claims(self, temp_dir, template_run):
+        """Test claims, lease expiry and failures."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=10).close()
+        with WorkQueue(path, lease=60, max_attempts=2) as queue:
+            first = queue.claim("a")
+            second = queue.claim("b")
+            assert (first.start, first.stop, second.start, second.stop) == (
+                0,
+                10,
+                10,
+                15,
+            )
+            assert queue.claim("c") is None
+
+            # a worker that stopped sending heartbeats loses its shard
+            queue.lease = 0
+            again = queue.claim("c")
+            assert (again.id, again.attempts) == (first.id, 2)
+
+            queue.lease = 60
+            queue.fail(again, "boom")
+            queue.fail(second, "boom")
+            assert queue.counts() == {
+                "pending": 1,
+                "claimed": 0,
+                "done": 0,
+                "failed": 1,
+            }
+            assert queue.claim("d").id == second.id
+
+    def test_stale_worker(self, temp_dir, template_run):
+        """Test that a worker whose shard was claimed again cannot complete or fail it."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=15).close()
+        with WorkQueue(path, lease=0) as queue:
+            stale = queue.claim("a")
+            current = queue.claim("b")
+            assert current.id == stale.id
+
+            assert not queue.heartbeat(stale)
+            assert not queue.complete(stale, temp_dir / "a.jsonl")
+            assert not queue.fail(stale, "boom")
+            assert queue.counts()["claimed"] == 1
+
+            assert queue.complete(current, temp_dir / "b.jsonl")
+            assert not queue.fail(current, "boom")
+            assert queue.outputs() == [
+                (current.id, str((temp_dir / "b.jsonl").resolve()))
+            ]
+
+    def test_complete_resolves_output(self, temp_dir, template_run, monkeypatch):
+        """Test that shard outputs are stored as absolute paths."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=15).close()
+        monkeypatch.chdir(temp_dir)
+        with WorkQueue(path) as queue:
+            shard = queue.claim("a")
+            assert queue.complete(shard, Path("shards") / "shard-000001.jsonl")
+            assert queue.outputs() == [
+                (shard.id, str((temp_dir / "shards" / "shard-000001.jsonl").resolve()))
+            ]
+
+    def test_temp_file_per_worker(self, temp_dir, template_run):
+        """Test that the temporary shard file is named after the worker and its process."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=15).close()
+        replaced = []
+        original = Path.replace
+
+        def replace(self, target):
+            replaced.append(self.name)
+            return original(self, target)
+
+        with WorkQueue(path) as queue, patch.object(Path, "replace", replace):
+            shard = queue.claim("host/a")
+            out = asyncio.run(
+                run_shard(queue, shard, *load_run(queue), temp_dir, False, 1)
+            )
+
+        assert replaced == [f"{out.name}.host_a.{os.getpid()}.tmp"]
+        assert len(out.read_text().splitlines()) == 15
+
+    def test_lost_lease_stops_shard(self, temp_dir, template_run):
+        """Test that a worker stops running a shard once a heartbeat finds it was claimed again."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=15).close()
+        cancelled = []
+
+        async def execute(requests, concurrency):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            yield {}
+
+        with WorkQueue(path, lease=0.3) as queue:
+            stale = queue.claim("a")
+            queue.lease = 0
+            assert queue.claim("b").id == stale.id
+            queue.lease = 0.3
+            with (
+                patch("llm_batch.workqueue.api.execute", execute),
+                pytest.raises(LeaseLostError, match="another worker"),
+            ):
+                asyncio.run(
+                    run_shard(queue, stale, *load_run(queue), temp_dir, True, 1)
+                )
+
+        assert cancelled == [True]
+        assert not list(temp_dir.glob("shard-*"))
+
+    def test_dry_run_matches_template(self, temp_dir, template_run):
+        """Test that merged shards are the records of a single `template` run."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=4).close()
+        assert run_workers(path, 3, execute=False) == 4
+        merged = temp_dir / "merged.jsonl"
+        assert merge(path, merged) == 15
+
+        single = temp_dir / "single.jsonl"
+        with patch("llm_batch.cli.console"):
+            template(*template_run, out=temp_dir, store=single)
+        assert list(read_records(merged)) == list(read_records(single))
+
+    @patch("llm_batch.cli.console")
+    def test_work_command(self, mock_console, temp_dir, template_run):
+        """Test `queue work` through the CLI, with the default shard directory."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=4).close()
+
+        app(["queue", "work", str(path), "--no-execute"])
+
+        assert len(list(shards_dir(path).glob("shard-*.jsonl"))) == 4
+
+    def test_merge_unfinished(self, temp_dir, template_run):
+        """Test that merging refuses unfinished shards unless partial."""
+        path = temp_dir / "run.db"
+        WorkQueue.create(path, *template_run, chunk_size=4).close()
+        assert run_worker(path, execute=False, max_shards=1) == 1
+        with pytest.raises(RuntimeError, match="3 shards are not done"):
+            merge(path, temp_dir / "merged.jsonl")
+        assert merge(path, temp_dir / "merged.jsonl", partial=True) == 4
+
+    def test_workers_execute(self, mock_providers, temp_dir, template_run):
+        """Test several worker processes running shards against the mock server."""
+        path = temp_dir / "run.db"
+        with patch("llm_batch.cli.console"):
+            queue_init(path, *template_run, chunk_size=2)
+
+        # forked, so the workers see the mock server configuration
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=run_worker, args=(path,), kwargs={"concurrency": 2})
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+            assert worker.exitcode == 0
+
+        with WorkQueue(path) as queue:
+            assert queue.counts()["done"] == 8
+        assert len(list(shards_dir(path).glob("shard-*.jsonl"))) == 8
+
+        merged = temp_dir / "merged.jsonl"
+        with patch("llm_batch.cli.console"):
+            queue_merge(path, merged)
+        records = list(read_records(merged))
+        assert [r["id"] for r in records] == [f"{i:05d}" for i in range(1, 16)]
+        assert all("response" in r for r in records)
+        assert records[0]["template_params"] == {"a": 1, "b": "x"}